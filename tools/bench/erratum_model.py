@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+"""
+Benchmark the Erratum model on a large advisory list.
+
+The filtered list fixtures from ocp_cd_tools/test_structures.py are
+copied until there are --count advisories, then Erratum objects are
+built for all of them three ways:
+
+  eager:   every attribute is read and the body kept, which is what
+           every Erratum used to cost
+  lazy:    only what find_latest_erratum reads (synopsis and release
+           date) is touched, the body is kept
+  compact: keep_body=False, the body is dropped after decoding
+
+For each the time to build (and read) the list and the memory it keeps
+alive are printed.
+
+    $ python bench/erratum_model.py --count 5000
+"""
+
+from __future__ import print_function
+import argparse
+import copy
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from ocp_cd_tools import errata  # noqa: E402
+from ocp_cd_tools import test_structures  # noqa: E402
+
+
+def deep_sizeof(obj, seen=None):
+    """Approximate number of bytes kept alive by `obj`"""
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(k, seen) + deep_sizeof(v, seen) for k, v in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(deep_sizeof(i, seen) for i in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(deep_sizeof(getattr(obj, s), seen)
+                    for s in obj.__slots__ if hasattr(obj, s))
+    elif hasattr(obj, '__dict__'):
+        size += deep_sizeof(obj.__dict__, seen)
+    return size
+
+
+def make_rows(count):
+    """`count` distinct filtered list rows"""
+    fixtures = test_structures.example_erratum_filtered_list
+    rows = []
+    for i in range(count):
+        row = copy.deepcopy(fixtures[i % len(fixtures)])
+        row['id'] = i
+        rows.append(row)
+    return rows
+
+
+def eager(rows):
+    advisories = [errata.Erratum(body=row) for row in rows]
+    for advs in advisories:
+        (advs.advisory_id, advs.advisory_name, advs.synopsis, advs.description,
+         advs.solution, advs.topic, advs.status, advs.created_at,
+         advs.updated_at, advs.release_date, advs.url)
+    return advisories
+
+
+def lazy(rows):
+    advisories = [errata.Erratum(body=row) for row in rows]
+    for advs in advisories:
+        (advs.synopsis, advs.release_date)
+    return advisories
+
+
+def compact(rows):
+    advisories = [errata.Erratum(body=row, keep_body=False) for row in rows]
+    for advs in advisories:
+        (advs.synopsis, advs.release_date)
+    return advisories
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--count', type=int, default=5000,
+                        help="How many advisories to build (default: 5000)")
+    parser.add_argument('--rounds', type=int, default=5,
+                        help="Take the best time of this many rounds (default: 5)")
+    args = parser.parse_args()
+
+    print("{:<10} {:>12} {:>14}".format('model', 'best time', 'memory kept'))
+    for name, build in [('eager', eager), ('lazy', lazy), ('compact', compact)]:
+        best = None
+        for _ in range(args.rounds):
+            rows = make_rows(args.count)
+            start = time.time()
+            advisories = build(rows)
+            elapsed = time.time() - start
+            best = elapsed if best is None else min(best, elapsed)
+        # The rows are only kept alive by the advisories holding on
+        # to their body
+        del rows
+        print("{:<10} {:>10.3f}s {:>12.1f}MB".format(
+            name, best, deep_sizeof(advisories) / 1024.0 / 1024.0))
+
+
+if __name__ == '__main__':
+    main()
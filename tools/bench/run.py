@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+"""
+Time elliott commands against the stand-in services (bench/standin.py).
+
+The stand-in services are started in this process, elliott is run as a
+subprocess pointed at them. Every command is run --rounds times and
+the best, median and worst wall clock times are printed, along with how
+many requests each round made to each service.
+
+    $ python bench/run.py --advisories 2000 --latency 50 --rounds 5
+    $ python bench/run.py --only advisory:create --error-rate 0.02
+
+Commands that need the bugzilla command line client (find-bugs
+--auto) are only timed when that client is installed.
+"""
+
+from __future__ import print_function
+import argparse
+import distutils.spawn
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BENCH_DIR, '..', 'src')
+ELLIOTT = os.path.join(SRC_DIR, 'elliott.py')
+
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, SRC_DIR)
+
+import standin  # noqa: E402
+from ocp_cd_tools import constants  # noqa: E402
+
+# The release the commands work on
+MINOR = 9
+GROUP = 'openshift-3.{}'.format(MINOR)
+GROUP_YML = """name: {group}
+branch: rhaos-3.{minor}-rhel-7
+push:
+  registries: []
+"""
+# How many bugs/builds the find-* commands attach, and advisories
+# advisory:get (many) gets
+ATTACH_COUNT = 50
+
+
+def make_metadata_dir():
+    """A metadata directory with just enough group config for elliott"""
+    metadata_dir = tempfile.mkdtemp(prefix='elliott-bench-')
+    group_dir = os.path.join(metadata_dir, 'groups', GROUP)
+    os.makedirs(group_dir)
+    with open(os.path.join(group_dir, 'group.yml'), 'w') as f:
+        f.write(GROUP_YML.format(group=GROUP, minor=MINOR))
+    return metadata_dir
+
+
+def open_advisory(data, round_num):
+    """An open advisory for the benchmarked release, a different one
+    each round so the attach commands start from scratch"""
+    candidates = sorted(a['id'] for a in data.advisories.values()
+                        if a['status'] in constants.errata_active_advisory_labels)
+    return candidates[round_num % len(candidates)]
+
+
+def scenarios(data):
+    """
+    :return: A list of (name, args_f, needs) tuples. args_f(round_num)
+    gives the elliott arguments for a round, `needs` names the command
+    line client the command needs, if any.
+    """
+    group = ['--group', GROUP]
+    people = ['--assigned-to', 'qe@example.com', '--manager', 'manager@example.com',
+              '--package-owner', 'owner@example.com']
+    with data.lock:
+        bugs = sorted(b['id'] for b in data.bugs.values()
+                      if '3.{}.z'.format(MINOR) in b['target_release'])[:ATTACH_COUNT]
+        builds = sorted(nvr for nvr, b in data.builds.items()
+                        if b['kind'] == 'rpm' and 'rhaos-3.{}-rhel-7-candidate'.format(MINOR) in b['tags'])[:ATTACH_COUNT]
+        some_advisory = sorted(data.advisories)[0]
+        many_advisories = [str(a) for a in sorted(data.advisories)[:ATTACH_COUNT]]
+
+    bug_args = [arg for b in bugs for arg in ['--id', str(b)]]
+    build_args = [arg for b in builds for arg in ['-b', b]]
+
+    return [
+        ('advisory:list', lambda r: ['advisory:list', '-n', '500'], None),
+        ('advisory:get', lambda r: ['advisory:get', str(some_advisory)], None),
+        ('advisory:get (many)', lambda r: ['advisory:get', '--json'] + many_advisories, None),
+        ('advisory:create', lambda r: group + ['advisory:create', '--kind', 'rpm'] + people, None),
+        ('advisory:find-bugs', lambda r: ['advisory:find-bugs', '--add', str(open_advisory(data, r))] + bug_args, None),
+        ('advisory:find-builds', lambda r: group + ['advisory:find-builds', '-k', 'rpm',
+                                                    '--attach', str(open_advisory(data, r))] + build_args, None),
+        ('advisory:find-bugs --auto', lambda r: group + ['advisory:find-bugs', '--auto'], 'bugzilla'),
+        ('advisory:find-builds (brew)', lambda r: group + ['advisory:find-builds', '-k', 'rpm'], None),
+    ]
+
+
+def run_elliott(args, env, log):
+    """Run elliott once
+
+    :return: A tuple (seconds taken, exit code)
+    """
+    start = time.time()
+    rc = subprocess.call([sys.executable, ELLIOTT] + args, env=env, stdout=log, stderr=subprocess.STDOUT)
+    return time.time() - start, rc
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    standin.add_arguments(parser)
+    parser.add_argument('--rounds', type=int, default=3,
+                        help="How many times to run each command (default: 3)")
+    parser.add_argument('--only', action='append', default=[], metavar='NAME',
+                        help="Only time this command, e.g. advisory:create [multiple]")
+    parser.add_argument('--working-dir', metavar='PATH',
+                        help="Give elliott this --working-dir, so caches live across rounds")
+    parser.add_argument('--log', metavar='PATH', default=os.devnull,
+                        help="Where to write elliott's output (default: discard it)")
+    parser.add_argument('--json', metavar='PATH',
+                        help="Also write the results to this file as JSON")
+    args = parser.parse_args()
+
+    print("Synthesizing {} advisories, {} builds and {} bugs".format(args.advisories, args.builds, args.bugs))
+    server = standin.from_arguments(args)
+    metadata_dir = make_metadata_dir()
+
+    env = dict(os.environ)
+    env.update(standin.environment(server))
+    env['PYTHONPATH'] = os.pathsep.join([SRC_DIR, env.get('PYTHONPATH', '')])
+    env['OIT_METADATA_DIR'] = metadata_dir
+    if args.working_dir:
+        env['ELLIOTT_WORKING_DIR'] = os.path.abspath(args.working_dir)
+
+    results = []
+    print("{:<30} {:>8} {:>8} {:>8} {:>6}  {}".format('command', 'best', 'median', 'worst', 'fails', 'requests/round'))
+    try:
+        with open(args.log, 'a') as log:
+            for name, args_f, needs in scenarios(server.data):
+                if args.only and name not in args.only:
+                    continue
+                if needs is not None and distutils.spawn.find_executable(needs) is None:
+                    print("{:<30} skipped, the {} client is not installed".format(name, needs))
+                    continue
+
+                times = []
+                failures = 0
+                before = dict(server.request_counts)
+                for r in range(args.rounds):
+                    seconds, rc = run_elliott(args_f(r), env, log)
+                    times.append(seconds)
+                    failures += 1 if rc != 0 else 0
+                requests = dict((k, (v - before.get(k, 0)) / float(args.rounds))
+                                for k, v in server.request_counts.items() if v != before.get(k, 0))
+
+                times.sort()
+                result = {
+                    'command': name,
+                    'best': times[0],
+                    'median': times[len(times) // 2],
+                    'worst': times[-1],
+                    'failures': failures,
+                    'requests_per_round': requests,
+                }
+                results.append(result)
+                print("{command:<30} {best:>7.2f}s {median:>7.2f}s {worst:>7.2f}s {failures:>6}  {reqs}".format(
+                    reqs=', '.join('{}={:g}'.format(k, v) for k, v in sorted(requests.items())), **result))
+    finally:
+        server.shutdown()
+        shutil.rmtree(metadata_dir)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'options': vars(args), 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
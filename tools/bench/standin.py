@@ -0,0 +1,879 @@
+#!/usr/bin/env python
+"""
+Stand-in Errata Tool, Brew hub and Bugzilla services, for load testing
+and benchmarking elliott without touching the real ones.
+
+One HTTP server answers for all three:
+
+  /api/v1/..., /filter/{id}.json   The Errata Tool REST API endpoints
+                                   elliott uses (see constants.py)
+  /brewhub                         Brew (koji) hub XML-RPC
+  /xmlrpc.cgi                      Bugzilla XML-RPC
+
+The data is synthesized from the fixtures in
+ocp_cd_tools/test_structures.py, scaled up to as many advisories,
+builds and bugs as asked for. Writes (new advisories, attached bugs and
+builds, comments, state changes) are kept in memory for the life of the
+server. Every response can be delayed (--latency, --jitter) and a share
+of requests can be failed with a '503 Service Unavailable'
+(--error-rate).
+
+Start it:
+
+    $ python bench/standin.py --port 8000 --advisories 2000 --builds 5000 --bugs 3000
+
+and point elliott at it:
+
+    $ export ELLIOTT_ERRATA_URL=http://localhost:8000
+    $ export ELLIOTT_BREW_HUB=http://localhost:8000/brewhub
+    $ export ELLIOTT_BUGZILLA_URL=http://localhost:8000/xmlrpc.cgi
+
+See bench/run.py to time elliott commands against it.
+"""
+
+from __future__ import print_function
+import argparse
+import BaseHTTPServer
+import copy
+import datetime
+import hashlib
+import json
+import os
+import random
+import re
+import SimpleXMLRPCServer
+import SocketServer
+import sys
+import threading
+import time
+import urlparse
+import xmlrpclib
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src'))
+
+from ocp_cd_tools import constants  # noqa: E402
+from ocp_cd_tools import test_structures  # noqa: E402
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# Releases the synthesized advisories, builds and bugs are spread over
+MINORS = range(1, 12)
+
+
+def timestamp(dt):
+    return dt.strftime(DATE_FORMAT)
+
+
+class StandInData(object):
+    """
+    Everything the stand-in services know about: advisories, builds
+    and bugs. Safe to use from the server's request threads.
+    """
+    def __init__(self, advisories=1000, builds=2000, bugs=2000, seed=0):
+        """
+        :param int advisories: How many advisories to synthesize
+        :param int builds: How many Brew builds to synthesize
+        :param int bugs: How many bugs to synthesize
+        :param int seed: Seed for the random choices, the same seed
+        always produces the same data
+        """
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.now = datetime.datetime(2018, 6, 1)
+
+        self.advisories = {}
+        self.builds = {}
+        self.builds_by_id = {}
+        self.bugs = {}
+        self.comment_id = 1
+        self.next_advisory_id = 30000
+
+        for i in range(builds):
+            self._add_build(i + 1)
+        for i in range(bugs):
+            self._add_bug(1500000 + i)
+        for _ in range(advisories):
+            self._add_advisory()
+
+    ######################################################################
+    # Synthesis
+
+    def _add_build(self, build_id):
+        minor = self.random.choice(MINORS)
+        kind = self.random.choice(['rpm', 'image'])
+        package = 'package-{}'.format(build_id % 500)
+        if kind == 'image':
+            template = test_structures.image_build_attached_json
+            package += '-container'
+            version = 'v3.{}.{}'.format(minor, build_id % 100)
+            release = '1'
+        else:
+            template = test_structures.rpm_build_attached_json
+            version = '3.{}.{}'.format(minor, build_id % 100)
+            release = '{}.el7'.format(build_id % 7 + 1)
+        nvr = '{}-{}-{}'.format(package, version, release)
+
+        build = copy.deepcopy(template)
+        build['id'] = build_id
+        build['nvr'] = nvr
+        build['package'] = {'id': build_id % 500, 'name': package}
+        build['all_errata'] = []
+
+        tag = 'rhaos-3.{}-rhel-7'.format(minor)
+        # Most builds are only candidates, some have shipped
+        tags = [tag + '-candidate']
+        if self.random.random() < 0.3:
+            tags.append(tag)
+
+        self.builds[nvr] = {
+            'kind': kind,
+            'et': build,
+            'brew': {
+                'id': build_id,
+                'build_id': build_id,
+                'package_id': build_id % 500,
+                'package_name': package,
+                'name': package,
+                'version': version,
+                'release': release,
+                'epoch': None,
+                'nvr': nvr,
+                'state': 1,
+                'owner_name': 'ocp-build',
+                'owner_id': 1,
+                'task_id': 10000000 + build_id,
+                'creation_ts': time.mktime((self.now - datetime.timedelta(days=build_id % 365)).timetuple()),
+                'creation_time': str(self.now - datetime.timedelta(days=build_id % 365)),
+                'completion_ts': time.mktime((self.now - datetime.timedelta(days=build_id % 365)).timetuple()),
+                'volume_name': 'DEFAULT',
+                'draft': False,
+                'extra': None,
+            },
+            'tags': tags,
+        }
+        self.builds_by_id[build_id] = nvr
+
+    def _add_bug(self, bug_id):
+        minor = self.random.choice(MINORS)
+        self.bugs[bug_id] = {
+            'id': bug_id,
+            'summary': 'Synthesized bug {}'.format(bug_id),
+            'status': self.random.choice(['NEW', 'ASSIGNED', 'POST', 'MODIFIED', 'MODIFIED', 'ON_QA', 'VERIFIED']),
+            'product': 'OpenShift Container Platform',
+            'classification': 'Red Hat',
+            'component': self.random.choice(['Installer', 'Master', 'Networking', 'Storage', 'Build']),
+            'version': ['3.{}.0'.format(minor)],
+            'target_release': [self.random.choice(['3.{}.z', '3.{}.0']).format(minor)],
+            'whiteboard': '',
+            'flags': [],
+            'comments': [],
+        }
+
+    def _add_advisory(self, kind=None, minor=None, release_date=None, metadata=True):
+        advisory_id = self.next_advisory_id
+        self.next_advisory_id += 1
+
+        kind = kind or self.random.choice(['rpm', 'image'])
+        minor = minor or self.random.choice(MINORS)
+        created = self.now - datetime.timedelta(days=self.random.randint(0, 3 * 365))
+        if release_date is None:
+            release_date = created + datetime.timedelta(days=21)
+        status = 'SHIPPED_LIVE' if release_date < self.now else self.random.choice(constants.errata_active_advisory_labels)
+
+        advisory = {
+            'id': advisory_id,
+            'kind': kind,
+            'minor': minor,
+            'synopsis': constants.errata_synopsis[kind].format(Y=minor),
+            'advisory_name': 'RHBA-{}:{}'.format(created.year, advisory_id),
+            'status': status,
+            'created_at': created,
+            'updated_at': created,
+            'release_date': release_date,
+            'description': constants.errata_description.format(Y=minor),
+            'solution': constants.errata_solution.format(Y=minor),
+            'topic': constants.errata_topic.format(Y=minor),
+            'comments': [],
+            'bugs': [],
+            'builds': {},
+        }
+        self.advisories[advisory_id] = advisory
+
+        # Long lived advisories collect plenty of chatter, the
+        # metadata comment is the first (oldest) one
+        if metadata:
+            self._comment(advisory, json.dumps({'release': '3.{}'.format(minor), 'kind': kind, 'impetus': 'standard'}))
+        for n in range(self.random.randint(0, 30)):
+            self._comment(advisory, 'Synthesized comment {}'.format(n))
+        return advisory
+
+    def _comment(self, advisory, text):
+        advisory['comments'].insert(0, {
+            'id': self.comment_id,
+            'type': 'comments',
+            'attributes': {
+                'errata_id': advisory['id'],
+                'type': 'Comment',
+                'text': text,
+                'created_at': timestamp(self.now),
+            }
+        })
+        self.comment_id += 1
+        advisory['updated_at'] = datetime.datetime.now()
+
+    ######################################################################
+    # Errata Tool representations
+
+    def filter_row(self, advisory):
+        """The advisory as listed by /filter/{id}.json"""
+        row = copy.deepcopy(test_structures.example_erratum_filtered_list[0])
+        row['id'] = advisory['id']
+        row['advisory_name'] = advisory['advisory_name']
+        row['synopsis'] = advisory['synopsis']
+        row['status'] = advisory['status']
+        row['timestamps']['created_at'] = timestamp(advisory['created_at'])
+        row['timestamps']['updated_at'] = timestamp(advisory['updated_at'])
+        row['timestamps']['release_date'] = timestamp(advisory['release_date'])
+        row['content']['description'] = advisory['description']
+        row['content']['solution'] = advisory['solution']
+        row['content']['topic'] = advisory['topic']
+        return row
+
+    def erratum(self, advisory):
+        """The advisory as returned by /api/v1/erratum/{id}"""
+        body = copy.deepcopy(test_structures.example_erratum)
+        rhba = body['errata']['rhba']
+        rhba['id'] = rhba['errata_id'] = advisory['id']
+        rhba['fulladvisory'] = advisory['advisory_name']
+        rhba['synopsis'] = advisory['synopsis']
+        rhba['status'] = advisory['status']
+        rhba['created_at'] = timestamp(advisory['created_at'])
+        rhba['updated_at'] = timestamp(advisory['updated_at'])
+        rhba['publish_date_override'] = timestamp(advisory['release_date'])
+        content = body['content']['content']
+        content['errata_id'] = advisory['id']
+        content['description'] = advisory['description']
+        content['solution'] = advisory['solution']
+        content['topic'] = advisory['topic']
+        body['bugs']['bugs'] = [{'bug': {'id': b, 'bug_status': self.bugs[b]['status']}}
+                                for b in advisory['bugs']]
+        body['bugs']['idsfixed'] = list(advisory['bugs'])
+        body['params']['id'] = str(advisory['id'])
+        return body
+
+    def erratum_builds(self, advisory):
+        """The builds attached to the advisory, as returned by
+        /api/v1/erratum/{id}/builds"""
+        return dict(
+            (pv, {'name': pv, 'builds': [{nvr: {'nvr': nvr, 'id': self.builds[nvr]['brew']['id']}} for nvr in nvrs]})
+            for pv, nvrs in advisory['builds'].items())
+
+    def et_build(self, nvr):
+        """The build as returned by /api/v1/build/{nvr}"""
+        build = copy.deepcopy(self.builds[nvr]['et'])
+        build['all_errata'] = [
+            {'id': a['id'], 'name': a['advisory_name'], 'status': a['status']}
+            for a in self.advisories.values()
+            if any(nvr in nvrs for nvrs in a['builds'].values())
+        ]
+        return build
+
+    def find_build(self, build):
+        """:return: The NVR of a build given by NVR or ID, None if unknown"""
+        if build in self.builds:
+            return build
+        try:
+            return self.builds_by_id.get(int(build))
+        except ValueError:
+            return None
+
+    ######################################################################
+    # Errata Tool writes
+
+    def create_advisory(self, body):
+        advs = body['advisory']
+        release_date = datetime.datetime.strptime(advs['publish_date_override'], '%Y-%m-%d')
+        match = re.search(r'3\.(\d+)', advs['synopsis'])
+        minor = int(match.group(1)) if match else 0
+        kind = 'image' if 'images' in advs['synopsis'] else 'rpm'
+        advisory = self._add_advisory(kind=kind, minor=minor, release_date=release_date, metadata=False)
+        advisory['comments'] = []
+        advisory['synopsis'] = advs['synopsis']
+        advisory['status'] = 'NEW_FILES'
+        advisory['created_at'] = advisory['updated_at'] = datetime.datetime.now()
+        return advisory
+
+    def add_comment(self, advisory, text):
+        self._comment(advisory, text)
+
+    def add_bug(self, advisory, bug_id):
+        """:return: An error message, None if the bug was added"""
+        if bug_id not in self.bugs:
+            return "Bug #{} does not exist".format(bug_id)
+        if bug_id in advisory['bugs']:
+            return "Bug #{} is already attached to {}".format(bug_id, advisory['advisory_name'])
+        advisory['bugs'].append(bug_id)
+        advisory['updated_at'] = datetime.datetime.now()
+        return None
+
+    def add_builds(self, advisory, builds):
+        """:return: An error message, None if the builds were added"""
+        found = []
+        for b in builds:
+            nvr = self.find_build(b.get('build'))
+            if nvr is None:
+                return "Build {} not found".format(b.get('build'))
+            found.append((b.get('product_version', ''), nvr))
+        for pv, nvr in found:
+            advisory['builds'].setdefault(pv, [])
+            if nvr not in advisory['builds'][pv]:
+                advisory['builds'][pv].append(nvr)
+        advisory['updated_at'] = datetime.datetime.now()
+        return None
+
+    ######################################################################
+    # Brew representations
+
+    def tagged_builds(self, tag, inherit=False, latest=False, kind=None):
+        """Builds tagged into `tag`, newest first"""
+        tags = [tag]
+        if inherit and tag.endswith('-container-build'):
+            tags.append(tag.replace('-container-build', '-candidate'))
+
+        builds = []
+        for b in self.builds.values():
+            for t in tags:
+                if t in b['tags'] and (kind is None or b['kind'] == kind):
+                    build = dict(b['brew'])
+                    build['tag_name'] = t
+                    # Builds were tagged as they were built
+                    build['create_event'] = build['id']
+                    builds.append(build)
+                    break
+        builds.sort(key=lambda b: b['id'], reverse=True)
+
+        if latest:
+            seen = set([])
+            latest_builds = []
+            for b in builds:
+                if b['package_name'] not in seen:
+                    seen.add(b['package_name'])
+                    latest_builds.append(b)
+            builds = latest_builds
+        return builds
+
+    def build_rpms(self, build):
+        """The RPMs a build produced"""
+        rpms = []
+        for arch in ['src', 'x86_64', 'noarch']:
+            rpms.append({
+                'id': build['id'] * 10 + len(rpms),
+                'build_id': build['id'],
+                'name': build['name'],
+                'version': build['version'],
+                'release': build['release'],
+                'epoch': None,
+                'arch': arch,
+                'draft': False,
+                'sigkey': '',
+                'nvr': build['nvr'],
+            })
+        return rpms
+
+
+class BrewHub(object):
+    """Brew (koji) hub XML-RPC methods"""
+
+    def __init__(self, data):
+        self.data = data
+        self.started = time.time()
+
+    def getAPIVersion(self):
+        return 1
+
+    def getKojiVersion(self):
+        return '1.16.0'
+
+    def getLastEvent(self, before=None):
+        # Nothing is ever tagged or untagged, but time moves on
+        return {'id': 1000000 + int((time.time() - self.started) * 10), 'ts': time.time()}
+
+    def queryHistory(self, tables=None, **kwargs):
+        return dict((table, []) for table in tables or ['tag_listing'])
+
+    def getBuildType(self, buildInfo, strict=False):
+        with self.data.lock:
+            nvr = self.data.find_build(buildInfo)
+            if nvr is None:
+                return None
+            return {self.data.builds[nvr]['kind']: {}}
+
+    def getTag(self, tagInfo, event=None, strict=False, blocked=False):
+        if isinstance(tagInfo, dict):
+            tagInfo = tagInfo.get('name')
+        tags = set([t for b in self.data.builds.values() for t in b['tags']])
+        if tagInfo not in tags and not tagInfo.endswith('-container-build'):
+            if strict:
+                raise xmlrpclib.Fault(1000, "No such tagInfo: '{}'".format(tagInfo))
+            return None
+        return {'id': abs(hash(tagInfo)) % 100000, 'name': tagInfo, 'arches': 'x86_64', 'locked': False}
+
+    def getBuild(self, buildInfo, strict=False):
+        with self.data.lock:
+            nvr = self.data.find_build(buildInfo)
+            if nvr is None:
+                if strict:
+                    raise xmlrpclib.Fault(1000, "No such build: '{}'".format(buildInfo))
+                return None
+            return dict(self.data.builds[nvr]['brew'])
+
+    def listTags(self, build=None, package=None, perms=True, queryOpts=None, pattern=None):
+        with self.data.lock:
+            nvr = self.data.find_build(build)
+            if nvr is None:
+                return []
+            return [self.getTag(t) for t in self.data.builds[nvr]['tags']]
+
+    def listTagged(self, tag, event=None, inherit=False, prefix=None, latest=False,
+                   package=None, owner=None, type=None, **kwargs):
+        with self.data.lock:
+            builds = self.data.tagged_builds(tag, inherit=inherit, latest=latest, kind=type)
+        if package is not None:
+            builds = [b for b in builds if b['package_name'] == package]
+        return builds
+
+    def getLatestBuilds(self, tag, event=None, package=None, type=None):
+        return self.listTagged(tag, latest=True, package=package, type=type)
+
+    def listTaggedRPMS(self, tag, event=None, inherit=False, latest=False, package=None,
+                       arch=None, rpmsigs=False, owner=None, type=None, **kwargs):
+        with self.data.lock:
+            builds = self.data.tagged_builds(tag, inherit=inherit, latest=latest, kind='rpm')
+            rpms = [r for b in builds for r in self.data.build_rpms(b)]
+        if package is not None:
+            builds = [b for b in builds if b['package_name'] == package]
+            rpms = [r for r in rpms if r['name'] == package]
+        if arch is not None:
+            arches = arch if isinstance(arch, list) else [arch]
+            rpms = [r for r in rpms if r['arch'] in arches]
+        return [rpms, builds]
+
+
+class Bugzilla(object):
+    """Bugzilla XML-RPC methods, enough for the python-bugzilla
+    command line client"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def version(self):
+        return {'version': '5.0.4'}
+
+    def extensions(self):
+        return {'extensions': {}}
+
+    def login(self, params):
+        return {'id': 1, 'token': 'standin-token'}
+
+    def logout(self, params=None):
+        return {}
+
+    def valid_login(self, params=None):
+        return True
+
+    def fields(self, params=None):
+        return {'fields': []}
+
+    def search(self, params):
+        def matches(bug, key, values):
+            if not isinstance(values, list):
+                values = [values]
+            value = bug.get(key)
+            if isinstance(value, list):
+                return any(v in values for v in value)
+            return value in values
+
+        with self.data.lock:
+            bugs = self.data.bugs.values()
+            for key in ['id', 'status', 'bug_status', 'product', 'component', 'target_release', 'version']:
+                if key in params:
+                    field = 'status' if key == 'bug_status' else key
+                    bugs = [b for b in bugs if matches(b, field, params[key])]
+            return {'bugs': [self._bug(b) for b in sorted(bugs, key=lambda b: b['id'])]}
+
+    def get(self, params):
+        ids = [int(i) for i in params.get('ids', [])]
+        with self.data.lock:
+            return {'bugs': [self._bug(self.data.bugs[i]) for i in ids if i in self.data.bugs]}
+
+    def update(self, params):
+        ids = [int(i) for i in params.get('ids', [])]
+        with self.data.lock:
+            for i in ids:
+                bug = self.data.bugs.get(i)
+                if bug is None:
+                    raise xmlrpclib.Fault(101, "Bug #{} does not exist".format(i))
+                if 'whiteboard' in params:
+                    bug['whiteboard'] = params['whiteboard']
+                if 'comment' in params:
+                    bug['comments'].append(params['comment'])
+                for flag in params.get('flags', []):
+                    bug['flags'].append(flag)
+        return {'bugs': [{'id': i, 'changes': {}} for i in ids]}
+
+    def _bug(self, bug):
+        return dict((k, v) for k, v in bug.items() if k != 'comments')
+
+
+class XMLRPCDispatcher(SimpleXMLRPCServer.SimpleXMLRPCDispatcher):
+    """Dispatches XML-RPC calls to the methods of `instance`. Understands
+    the keyword arguments koji sends (a trailing struct flagged with
+    '__starstar') and the 'Namespace.method' names Bugzilla uses."""
+
+    def __init__(self, instance):
+        SimpleXMLRPCServer.SimpleXMLRPCDispatcher.__init__(self, allow_none=True, encoding=None)
+        self.instance = instance
+        self.register_multicall_functions()
+        # koji names it differently
+        self.register_function(self.system_multicall, 'multiCall')
+
+    def _dispatch(self, method, params):
+        if method in self.funcs:
+            return self.funcs[method](*params)
+
+        name = method.split('.')[-1]
+        func = getattr(self.instance, name, None)
+        if func is None or name.startswith('_'):
+            raise xmlrpclib.Fault(1, "Unknown method: {}".format(method))
+
+        params = list(params)
+        kwargs = {}
+        if params and isinstance(params[-1], dict) and params[-1].get('__starstar'):
+            kwargs = params.pop()
+            del kwargs['__starstar']
+        return func(*params, **kwargs)
+
+
+class StandInServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """The stand-in services, on one threaded HTTP server"""
+    daemon_threads = True
+    allow_reuse_address = True
+    request_queue_size = 128
+
+    def __init__(self, address, data, latency=0.0, jitter=0.0, error_rate=0.0):
+        """
+        :param tuple address: (host, port) to listen on
+        :param StandInData data: What the services know about
+        :param float latency: Seconds every request is delayed
+        :param float jitter: Up to this many more seconds are added to
+        the delay, at random
+        :param float error_rate: Share (0 to 1) of requests failed with
+        a '503 Service Unavailable'
+        """
+        BaseHTTPServer.HTTPServer.__init__(self, address, StandInHandler)
+        self.data = data
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.brew = XMLRPCDispatcher(BrewHub(data))
+        self.bugzilla = XMLRPCDispatcher(Bugzilla(data))
+        self.counter_lock = threading.Lock()
+        self.request_counts = {}
+
+    @property
+    def url(self):
+        return 'http://{}:{}'.format(self.server_address[0], self.server_address[1])
+
+    def count(self, what):
+        with self.counter_lock:
+            self.request_counts[what] = self.request_counts.get(what, 0) + 1
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Routes requests to the Errata Tool, Brew and Bugzilla stand-ins"""
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, with Nagle's algorithm
+    # every keep-alive request would wait out a delayed ACK (~40ms)
+    disable_nagle_algorithm = True
+
+    # (method, url pattern, handler method name)
+    et_routes = [
+        ('GET', r'^/filter/(?P<filter_id>\w+)\.json$', 'et_filter'),
+        ('GET', r'^/api/v1/erratum/(?P<id>\d+)$', 'et_erratum'),
+        ('GET', r'^/api/v1/erratum/(?P<id>\d+)/builds$', 'et_erratum_builds'),
+        ('GET', r'^/api/v1/build/(?P<build>[^/]+)$', 'et_build'),
+        ('GET', r'^/api/v1/comments$', 'et_comments'),
+        ('GET', r'^/api/v1/comments/(?P<comment_id>\d+)$', 'et_comment'),
+        ('POST', r'^/api/v1/erratum$', 'et_create'),
+        ('POST', r'^/api/v1/erratum/(?P<id>\d+)/add_bug$', 'et_add_bug'),
+        ('POST', r'^/api/v1/erratum/(?P<id>\d+)/add_builds?$', 'et_add_builds'),
+        ('POST', r'^/api/v1/erratum/(?P<id>\d+)/add_comment$', 'et_add_comment'),
+        ('POST', r'^/api/v1/erratum/(?P<id>\d+)/change_state$', 'et_change_state'),
+        ('POST', r'^/api/v1/bug/refresh$', 'et_bug_refresh'),
+    ]
+
+    def log_message(self, format, *args):
+        # Access logs would only slow a load test down
+        pass
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def handle_request(self, method):
+        url = urlparse.urlparse(self.path)
+        self.query = urlparse.parse_qs(url.query)
+        length = int(self.headers.get('Content-Length') or 0)
+        self.body = self.rfile.read(length) if length else ''
+
+        delay = self.server.latency
+        if self.server.jitter:
+            delay += random.uniform(0, self.server.jitter)
+        if delay:
+            time.sleep(delay)
+
+        if self.server.error_rate and random.random() < self.server.error_rate:
+            self.server.count('injected errors')
+            return self.respond(503, 'Service Unavailable (injected)', content_type='text/plain')
+
+        if method == 'POST' and url.path.rstrip('/').endswith('brewhub'):
+            self.server.count('brew')
+            return self.xmlrpc(self.server.brew)
+        if method == 'POST' and url.path.endswith('xmlrpc.cgi'):
+            self.server.count('bugzilla')
+            return self.xmlrpc(self.server.bugzilla)
+
+        for route_method, pattern, handler in self.et_routes:
+            match = re.match(pattern, url.path)
+            if route_method == method and match:
+                self.server.count('errata')
+                with self.server.data.lock:
+                    status, body = getattr(self, handler)(**match.groupdict())
+                return self.respond_json(status, body)
+
+        self.respond(404, 'Not Found', content_type='text/plain')
+
+    ######################################################################
+    # Responses
+
+    def respond(self, status, content, content_type='application/json', headers={}):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(content)
+
+    def respond_json(self, status, body):
+        content = json.dumps(body)
+        if status != 200 or self.command != 'GET':
+            return self.respond(status, content)
+
+        etag = '"{}"'.format(hashlib.sha1(content).hexdigest())
+        if self.headers.get('If-None-Match') == etag:
+            self.server.count('not modified')
+            return self.respond(304, '', headers={'ETag': etag})
+        self.respond(200, content, headers={'ETag': etag})
+
+    def xmlrpc(self, dispatcher):
+        content = dispatcher._marshaled_dispatch(self.body)
+        self.respond(200, content, content_type='text/xml')
+
+    def request_json(self):
+        """The request body (JSON or form encoded) as a dict"""
+        if not self.body:
+            return {}
+        try:
+            return json.loads(self.body)
+        except ValueError:
+            return dict((k, v[0]) for k, v in urlparse.parse_qs(self.body).items())
+
+    def advisory(self, id):
+        return self.server.data.advisories.get(int(id))
+
+    ######################################################################
+    # Errata Tool
+
+    def et_filter(self, filter_id):
+        data = self.server.data
+        advisories = data.advisories.values()
+        if filter_id == constants.errata_live_advisory_filter:
+            advisories = [a for a in advisories if a['status'] in constants.errata_active_advisory_labels]
+        elif filter_id == constants.errata_immutable_advisory_filter:
+            advisories = [a for a in advisories if a['status'] not in constants.errata_active_advisory_labels]
+        # Newest first, like the real filters
+        advisories.sort(key=lambda a: a['created_at'], reverse=True)
+
+        if 'per_page' in self.query:
+            per_page = int(self.query['per_page'][0])
+            page = int(self.query.get('page', ['1'])[0])
+            advisories = advisories[(page - 1) * per_page:page * per_page]
+        return 200, [data.filter_row(a) for a in advisories]
+
+    def et_erratum(self, id):
+        advisory = self.advisory(id)
+        if advisory is None:
+            return 404, {'error': 'Bad errata id given: {}'.format(id)}
+        return 200, self.server.data.erratum(advisory)
+
+    def et_erratum_builds(self, id):
+        advisory = self.advisory(id)
+        if advisory is None:
+            return 404, {'error': 'Bad errata id given: {}'.format(id)}
+        return 200, self.server.data.erratum_builds(advisory)
+
+    def et_build(self, build):
+        nvr = self.server.data.find_build(urlparse.unquote(build))
+        if nvr is None:
+            return 404, {'error': 'Build {} not found'.format(build)}
+        return 200, self.server.data.et_build(nvr)
+
+    def et_comments(self):
+        request = self.request_json()
+        errata_id = request.get('filter', {}).get('errata_id')
+        if errata_id is None and 'filter[errata_id]' in self.query:
+            errata_id = self.query['filter[errata_id]'][0]
+        advisory = self.advisory(errata_id or 0)
+        comments = advisory['comments'] if advisory is not None else []
+
+        page = request.get('page', {})
+        number = int(page.get('number', self.query.get('page[number]', ['1'])[0]))
+        size = int(page.get('size', self.query.get('page[size]', ['20'])[0]))
+        return 200, {'data': comments[(number - 1) * size:number * size]}
+
+    def et_comment(self, comment_id):
+        for advisory in self.server.data.advisories.values():
+            for c in advisory['comments']:
+                if c['id'] == int(comment_id):
+                    return 200, {'data': c}
+        return 404, {'error': 'Comment {} not found'.format(comment_id)}
+
+    def et_create(self):
+        advisory = self.server.data.create_advisory(self.request_json())
+        return 201, self.server.data.erratum(advisory)
+
+    def et_add_bug(self, id):
+        advisory = self.advisory(id)
+        if advisory is None:
+            return 404, {'error': 'Bad errata id given: {}'.format(id)}
+        error = self.server.data.add_bug(advisory, int(self.request_json().get('bug', 0)))
+        if error is not None:
+            return 422, {'error': error}
+        return 201, self.server.data.erratum(advisory)
+
+    def et_add_builds(self, id):
+        advisory = self.advisory(id)
+        if advisory is None:
+            return 404, {'error': 'Bad errata id given: {}'.format(id)}
+        builds = self.request_json()
+        if isinstance(builds, dict):
+            builds = [builds]
+        error = self.server.data.add_builds(advisory, builds)
+        if error is not None:
+            return 422, {'error': error}
+        return 201, self.server.data.erratum_builds(advisory)
+
+    def et_add_comment(self, id):
+        advisory = self.advisory(id)
+        if advisory is None:
+            return 404, {'error': 'Bad errata id given: {}'.format(id)}
+        self.server.data.add_comment(advisory, self.request_json().get('comment', ''))
+        return 201, self.server.data.erratum(advisory)
+
+    def et_change_state(self, id):
+        advisory = self.advisory(id)
+        if advisory is None:
+            return 404, {'error': 'Bad errata id given: {}'.format(id)}
+        new_state = self.request_json().get('new_state')
+        if new_state == 'QE' and not advisory['builds']:
+            return 422, {'error': 'Erratum has no builds'}
+        advisory['status'] = new_state
+        advisory['updated_at'] = datetime.datetime.now()
+        return 201, self.server.data.erratum(advisory)
+
+    def et_bug_refresh(self):
+        return 200, {}
+
+
+def start(data, host='localhost', port=0, **kwargs):
+    """Start the stand-in services in a background thread
+
+    :param StandInData data: What the services know about
+    :param str host: Address to listen on
+    :param int port: Port to listen on, 0 picks a free one
+    :param kwargs: Passed on to StandInServer (latency, jitter, error_rate)
+    :return: The running StandInServer, call shutdown() to stop it
+    """
+    server = StandInServer((host, port), data, **kwargs)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def environment(server):
+    """:return: The environment variables pointing elliott at `server`"""
+    return {
+        'ELLIOTT_ERRATA_URL': server.url,
+        'ELLIOTT_BREW_HUB': server.url + '/brewhub',
+        'ELLIOTT_BUGZILLA_URL': server.url + '/xmlrpc.cgi',
+    }
+
+
+def add_arguments(parser):
+    """Add the options describing the stand-in services to `parser`"""
+    parser.add_argument('--advisories', type=int, default=1000,
+                        help="How many advisories to synthesize (default: 1000)")
+    parser.add_argument('--builds', type=int, default=2000,
+                        help="How many Brew builds to synthesize (default: 2000)")
+    parser.add_argument('--bugs', type=int, default=2000,
+                        help="How many bugs to synthesize (default: 2000)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Random seed, the same seed gives the same data (default: 0)")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="Milliseconds to delay every response by (default: 0)")
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="Up to this many more milliseconds are added at random (default: 0)")
+    parser.add_argument('--error-rate', type=float, default=0.0,
+                        help="Share (0 to 1) of requests to fail with a 503 (default: 0)")
+
+
+def from_arguments(args, host='localhost', port=0):
+    """Start the stand-in services described by parsed arguments"""
+    data = StandInData(advisories=args.advisories, builds=args.builds, bugs=args.bugs, seed=args.seed)
+    return start(data, host=host, port=port,
+                 latency=args.latency / 1000.0,
+                 jitter=args.jitter / 1000.0,
+                 error_rate=args.error_rate)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='localhost',
+                        help="Address to listen on (default: localhost)")
+    parser.add_argument('--port', type=int, default=8000,
+                        help="Port to listen on (default: 8000)")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    print("Synthesizing {} advisories, {} builds and {} bugs".format(args.advisories, args.builds, args.bugs))
+    server = from_arguments(args, host=args.host, port=args.port)
+
+    print("Listening on {}, point elliott at it with:".format(server.url))
+    for k, v in sorted(environment(server).items()):
+        print("    export {}={}".format(k, v))
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print("Requests served: {}".format(server.request_counts))
+
+
+if __name__ == '__main__':
+    main()
@@ -12,8 +12,7 @@ web service.
 # stdlib
 from __future__ import print_function
 import datetime
-from multiprocessing.dummy import Pool as ThreadPool
-from multiprocessing import cpu_count
+import json as json_module
 import os
 import re
 
@@ -23,11 +22,12 @@ import ocp_cd_tools.constants
 import ocp_cd_tools.bugzilla
 import ocp_cd_tools.brew
 import ocp_cd_tools.errata
+import ocp_cd_tools.errata_client
 import ocp_cd_tools.exceptions
+import ocp_cd_tools.image
 
 # 3rd party
 import click
-import requests
 
 # -----------------------------------------------------------------------------
 # Constants and defaults
@@ -40,7 +40,7 @@ context_settings = dict(help_option_names=['-h', '--help'])
 
 
 @click.group(context_settings=context_settings)
-@click.option("--metadata", "--metadata-dir", metavar='PATH', envvar="OIT_METADATA_DIR",
+@click.option("--metadata", "--metadata-dir", "metadata_dir", metavar='PATH', envvar="OIT_METADATA_DIR",
               default=None,
               help="Git repo or directory containing groups metadata directory if not current.")
 @click.option("--working-dir", metavar='PATH', envvar="ELLIOTT_WORKING_DIR",
@@ -76,6 +76,16 @@ def cli(ctx, **kwargs):
     # @pass_runtime
     ctx.obj = Runtime(**kwargs)
 
+    # Errata Tool responses are cached for the length of this run, or
+    # kept in the working directory for later runs if one is given.
+    # So are the brew tag listings, later runs only fetch what changed.
+    cache_dir = None
+    if kwargs['working_dir'] is not None:
+        cache_dir = os.path.join(os.path.abspath(kwargs['working_dir']), 'cache', 'errata')
+        ocp_cd_tools.brew.enable_tag_history(
+            os.path.join(os.path.abspath(kwargs['working_dir']), 'cache', 'brew'))
+    ocp_cd_tools.errata_client.get_client().enable_cache(cache_dir)
+
 
 # -----------------------------------------------------------------------------
 # Utility Functions
@@ -232,6 +242,30 @@ each function call.
     return func()
 
 
+def advisory_metadata_index(runtime):
+    """The index of advisory metadata comments kept in the working
+directory. It only outlives this invocation when --working-dir is
+given.
+
+    :param Runtime runtime: An initialized runtime
+    :return: An `ocp_cd_tools.errata.MetadataIndex`
+    """
+    return ocp_cd_tools.errata.MetadataIndex(
+        os.path.join(runtime.cache_dir, 'advisory-metadata.json'))
+
+
+def build_store(runtime):
+    """The store of Errata Tool build details kept in the working
+directory. It only outlives this invocation when --working-dir is
+given.
+
+    :param Runtime runtime: An initialized runtime
+    :return: An `ocp_cd_tools.brew.BuildStore`
+    """
+    return ocp_cd_tools.brew.BuildStore(
+        os.path.join(runtime.cache_dir, 'brew-builds.json'))
+
+
 # -----------------------------------------------------------------------------
 # CLI Commands - Please keep these in alphabetical order
 # -----------------------------------------------------------------------------
@@ -244,11 +278,13 @@ each function call.
 @cli.command("advisory:change-state", short_help="Change ADVISORY state")
 @click.option("--state", '-s', type=click.Choice(['NEW_FILES', 'QE', 'REL_PREP']),
               help="New state for the Advisory. NEW_FILES, QE, REL_PREP.")
-@click.argument('advisory', type=int)
+@click.option('--json', is_flag=True, default=False,
+              help="Print the outcome for each advisory as a line of JSON")
+@click.argument('advisories', metavar='ADVISORY...', nargs=-1, type=int, required=True)
 @click.pass_context
-def change_state(ctx, state, advisory):
-    """Change the state of ADVISORY. Additional permissions may be
-required to change an advisory to certain states.
+def change_state(ctx, state, json, advisories):
+    """Change the state of one or more ADVISORY. Additional permissions
+may be required to change an advisory to certain states.
 
 An advisory may not move between some states until all criteria have
 been met. For example, an advisory can not move from NEW_FILES to QE
@@ -257,6 +293,10 @@ unless Bugzilla Bugs or JIRA Issues have been attached.
 See the advisory:find-bugs help for additional information on adding
 Bugzilla Bugs.
 
+Several advisories are changed concurrently, each is printed as soon
+as it has been changed. With --json each is printed as a line of JSON:
+{"id": ..., "previous_state": ..., "state": ..., "error": ...}
+
     Move the advisory 123456 from NEW_FILES to QE state:
 
     $ elliott advisory:change-state --state QE 123456
@@ -264,24 +304,35 @@ Bugzilla Bugs.
     Move the advisory 123456 back to NEW_FILES (short option flag):
 
     $ elliott advisory:change-state -s NEW_FILES 123456
+
+    Move the RPM and image advisories 123456 and 123457 to QE:
+
+    $ elliott advisory:change-state -s QE 123456 123457
     """
+    failed = 0
     try:
-        erratum = ocp_cd_tools.errata.get_erratum(advisory)
+        for advisory_id, previous, erratum, error in ocp_cd_tools.errata.change_errata_state(advisories, state):
+            failed += 1 if error is not None else 0
+            if json:
+                click.echo(json_module.dumps({
+                    'id': advisory_id,
+                    'previous_state': previous,
+                    'state': erratum.status if erratum is not False else None,
+                    'error': error,
+                }))
+            elif error is not None:
+                click.secho("Error changing state of {id}: ".format(id=advisory_id), nl=False, bold=True, fg='red')
+                click.echo(error)
+            else:
+                click.secho("Changed advisory state ({previous} -> {state}): ".format(
+                    previous=previous, state=erratum.status), nl=False, fg='green', bold=True)
+                click.echo(erratum)
     except ocp_cd_tools.exceptions.ErrataToolUnauthenticatedException:
         exit_unauthenticated()
 
-    click.echo("Changing state for {id} to {state}".format(id=advisory, state=state))
-    click.echo(erratum)
-    try:
-        erratum.change_state(state)
-    except ocp_cd_tools.exceptions.ErrataToolError as err:
-        click.secho("Error changing state: ", nl=False, bold=True, fg='red')
-        click.echo(str(err))
+    if failed:
         exit(1)
 
-    click.secho("Changed advisory state:", fg='green', bold=True)
-    click.echo(erratum)
-
 
 #
 # Create Advisory (RPM and image)
@@ -358,7 +409,8 @@ advisory.
         # User did not enter a value for --date, default is determined
         # by looking up the latest erratum in a series
         try:
-            latest_advisory = ocp_cd_tools.errata.find_latest_erratum(kind, minor)
+            latest_advisory = ocp_cd_tools.errata.find_latest_erratum(
+                kind, minor, index=advisory_metadata_index(runtime))
         except ocp_cd_tools.exceptions.ErrataToolUnauthenticatedException:
             exit_unauthenticated()
         except ocp_cd_tools.exceptions.ErrataToolUnauthorizedException:
@@ -526,17 +578,42 @@ manually. Provide one or more --id's for manual bug addition.
         else:
             click.echo("Adding {count} bugs to {advs}".format(count=bug_count, advs=advisory))
 
+        # Bugs already attached to an open advisory (this one
+        # included) would only fail to be added, leave them out
+        try:
+            open_advisories = ocp_cd_tools.errata.get_open_advisories()
+            if advs.advisory_id not in [a.advisory_id for a in open_advisories]:
+                open_advisories.append(advs)
+            attached_bugs = ocp_cd_tools.errata.get_attached_bugs_index(open_advisories)
+        except ocp_cd_tools.exceptions.ErrataToolUnauthenticatedException:
+            exit_unauthenticated()
+        except ocp_cd_tools.exceptions.ErrataToolError as e:
+            red_prefix("Error: ")
+            click.echo(e)
+            exit(1)
+
+        already_attached = [b for b in bug_ids if int(b.id) in attached_bugs]
+        bug_ids = [b for b in bug_ids if int(b.id) not in attached_bugs]
+
         if len(flag) > 0:
             for bug in bug_ids:
                 bug.add_flags(flag)
 
-        for res, bug in advs.add_bugs(bug_ids):
-            if res.status_code == 201:
-                green_prefix("Added bug: ")
-                click.secho("  {id}".format(id=bug))
-            else:
-                red_prefix("Failed to add bug: ")
-                click.echo("  {id} (rc={rc}, err={err})".format(id=bug, rc=res.status_code, err=res.text))
+        results = advs.add_bugs(bug_ids)
+
+        for bug in results['added']:
+            green_prefix("Added bug: ")
+            click.echo("  {id}".format(id=bug))
+        for bug in already_attached:
+            click.echo("Skipped bug (already attached): {id} (to {advisories})".format(
+                id=bug, advisories=", ".join(str(a) for a in sorted(attached_bugs[int(bug.id)]))))
+        for failure in results['failed']:
+            red_prefix("Failed to add bug: ")
+            click.echo("  {id} (rc={rc}, err={err})".format(id=failure['bug'], rc=failure['status_code'], err=failure['error']))
+
+        click.echo("Added {added} of {count} bugs, {skipped} already attached, {failed} failed".format(
+            added=len(results['added']), count=bug_count,
+            skipped=len(already_attached), failed=len(results['failed'])))
     # Add bug is false (noop)
     else:
         green_prefix("Would have added {n} bugs: ".format(n=bug_count))
@@ -558,8 +635,16 @@ manually. Provide one or more --id's for manual bug addition.
 @click.option('--kind', '-k', metavar='KIND',
               required=True, type=click.Choice(['rpm', 'image']),
               help='Find builds of the given KIND [rpm, image]')
+@click.option('--concurrency', metavar='N', type=click.IntRange(1),
+              default=ocp_cd_tools.constants.errata_max_concurrent_requests,
+              help='Look up at most N builds in the Errata Tool at once (default: {})'.format(
+                  ocp_cd_tools.constants.errata_max_concurrent_requests))
+@click.option('--chunk-size', metavar='N', type=click.IntRange(1),
+              default=ocp_cd_tools.constants.errata_add_builds_chunk_size,
+              help='Attach at most N builds per request to the Errata Tool (default: {})'.format(
+                  ocp_cd_tools.constants.errata_add_builds_chunk_size))
 @pass_runtime
-def find_builds(runtime, advisory, builds, kind):
+def find_builds(runtime, advisory, builds, kind, concurrency, chunk_size):
     """Automatically or manually find or attach viable rpm or image builds
 to ADVISORY. Default behavior searches Brew for viable builds in the
 given group. Provide builds manually by giving one or more --build
@@ -569,6 +654,8 @@ Tool API.
 \b
   * Attach the builds to ADVISORY by giving --attach
   * Specify the build type using --kind KIND
+  * Builds the Errata Tool rejects are reported, the rest are still
+    attached
 
 Example: Assuming --group=openshift-3.7, then a build is a VIABLE
 BUILD IFF it meets ALL of the following criteria:
@@ -604,20 +691,52 @@ PRESENT advisory. Here are some examples:
     product_version = 'RHEL-7-OSE-{X}.{Y}'.format(X=major, Y=minor)
     base_tag = "rhaos-{major}.{minor}-rhel-7".format(major=major, minor=minor)
 
-    # Test authentication
+    # Test authentication, and find the open advisories of the product
     try:
-        ocp_cd_tools.errata.get_filtered_list(ocp_cd_tools.constants.errata_live_advisory_filter)
+        open_advisories = ocp_cd_tools.errata.get_open_advisories()
     except ocp_cd_tools.exceptions.ErrataToolUnauthenticatedException:
         exit_unauthenticated()
 
-    session = requests.Session()
+    # Builds attached to an open advisory are not viable, and builds
+    # already attached to ADVISORY need not be attached again. Listing
+    # the builds of the open advisories saves looking those up one by
+    # one.
+    attached_builds = {}
+    store = build_store(runtime)
+    if (kind == 'rpm' and len(builds) == 0) or advisory is not False:
+        green_prefix("Indexing builds attached to open advisories: ")
+        click.echo("{n} advisories".format(n=len(open_advisories)))
+        try:
+            attached_builds = ocp_cd_tools.errata.get_attached_builds_index(open_advisories, n_threads=concurrency)
+            # Builds looked up before need not be fetched again to see
+            # where they are attached
+            store.use_attached_index(open_advisories, attached_builds)
+        except ocp_cd_tools.exceptions.ErrataToolUnauthenticatedException:
+            exit_unauthenticated()
+        except ocp_cd_tools.exceptions.ErrataToolError as e:
+            red_prefix("Error: ")
+            click.echo(e)
+            exit(1)
+
+    def skip_attached_to_advisory(nvrs):
+        """Drop the builds already attached to ADVISORY"""
+        if advisory is False:
+            return nvrs
+        remaining = [nvr for nvr in nvrs if int(advisory) not in attached_builds.get(nvr, ())]
+        if len(remaining) < len(nvrs):
+            click.echo("Skipping {n} builds already attached to {advisory}".format(
+                n=len(nvrs) - len(remaining), advisory=advisory))
+        return remaining
 
     if len(builds) > 0:
         green_prefix("Build NVRs provided: ")
         click.echo("Manually verifying the builds exist")
+        builds = skip_attached_to_advisory(builds)
         try:
-            unshipped_builds = [ocp_cd_tools.brew.get_brew_build(b, product_version, session=session) for b in builds]
+            unshipped_builds = ocp_cd_tools.brew.get_brew_builds(builds, product_version, n_threads=concurrency,
+                                                                 store=store)
         except ocp_cd_tools.exceptions.BrewBuildException as e:
+            store.save()
             red_prefix("Error: ")
             click.echo(e)
             exit(1)
@@ -627,17 +746,12 @@ PRESENT advisory. Here are some examples:
             pbar_header("Generating list of {kind}s: ".format(kind=kind),
                         "Hold on a moment, fetching Brew buildinfo",
                         initial_builds)
-            pool = ThreadPool(cpu_count())
-            # Look up builds concurrently
             click.secho("[", nl=False)
 
-            # Returns a list of (n, v, r) tuples of each build
-            potential_builds = pool.map(
-                lambda build: progress_func(lambda: build.get_latest_build_info(), '*'),
-                initial_builds)
-            # Wait for results
-            pool.close()
-            pool.join()
+            # Returns a list of (n, v, r) tuples of each build, looked
+            # up in a few batched brew requests
+            potential_builds = ocp_cd_tools.image.get_latest_build_infos(initial_builds)
+            click.secho('*' * len(potential_builds), fg='green', nl=False)
             click.echo(']')
 
             pbar_header("Generating build metadata: ",
@@ -654,17 +768,12 @@ PRESENT advisory. Here are some examples:
             #
             # TODO: Update the ImageMetaData class to include the NVR as
             # an object attribute.
-            pool = ThreadPool(cpu_count())
-            unshipped_builds = pool.map(
-                lambda meta: progress_func(
-                    lambda: ocp_cd_tools.brew.get_brew_build("{}-{}-{}".format(meta[0], meta[1], meta[2]),
-                                                             product_version,
-                                                             session=session),
-                    '*'),
-                potential_builds)
-            # Wait for results
-            pool.close()
-            pool.join()
+            unshipped_builds = ocp_cd_tools.brew.get_brew_builds(
+                skip_attached_to_advisory(["{}-{}-{}".format(meta[0], meta[1], meta[2]) for meta in potential_builds]),
+                product_version,
+                n_threads=concurrency,
+                progress_f=lambda build: click.secho('*', fg='green', nl=False),
+                store=store)
             click.echo(']')
         elif kind == 'rpm':
             green_prefix("Generating list of {kind}s: ".format(kind=kind))
@@ -674,38 +783,52 @@ PRESENT advisory. Here are some examples:
                 product_version,
                 kind=kind)
 
+            # Builds in the index are attached to an open advisory
+            # already, no need to look those up
+            unshipped_build_candidates = [nvr for nvr in unshipped_build_candidates if nvr not in attached_builds]
+
             pbar_header("Gathering additional information: ", "Brew buildinfo is required to continue", unshipped_build_candidates)
             click.secho("[", nl=False)
 
             # We could easily be making scores of requests, one for each build
             # we need information about. May as well do it in parallel.
-            pool = ThreadPool(cpu_count())
-            results = pool.map(
-                lambda nvr: progress_func(
-                    lambda: ocp_cd_tools.brew.get_brew_build(nvr, product_version, session=session),
-                    '*'),
-                unshipped_build_candidates)
-            # Wait for results
-            pool.close()
-            pool.join()
+            results = ocp_cd_tools.brew.get_brew_builds(
+                unshipped_build_candidates,
+                product_version,
+                n_threads=concurrency,
+                progress_f=lambda build: click.secho('*', fg='green', nl=False),
+                store=store)
             click.echo(']')
 
-            # We only want builds not attached to an existing open advisory
+            # We only want builds not attached to an existing open
+            # advisory. The index may have missed advisories opened since.
             unshipped_builds = [b for b in results if not b.attached_to_open_erratum]
 
+    store.save()
     build_count = len(unshipped_builds)
 
     if advisory is not False:
         # Search and attach
         try:
             erratum = ocp_cd_tools.errata.get_erratum(advisory)
-            erratum.add_builds(unshipped_builds)
-            click.secho("Attached build(s) successfully", fg='green', bold=True)
+            results = erratum.add_builds(unshipped_builds, chunk_size=chunk_size, n_threads=concurrency)
         except ocp_cd_tools.exceptions.ErrataToolUnauthenticatedException:
             exit_unauthenticated()
-        except ocp_cd_tools.exceptions.BrewBuildException as e:
-            red_prefix("Error attaching builds: ")
-            click.echo(str(e))
+
+        for build in results['attached']:
+            green_prefix("Attached build: ")
+            click.echo("  {nvr}".format(nvr=build.nvr))
+        for build in results['skipped']:
+            click.echo("Skipped build (already attached): {nvr}".format(nvr=build.nvr))
+        for failure in results['rejected']:
+            red_prefix("Rejected build: ")
+            click.echo("  {nvr} (rc={rc}, err={err})".format(
+                nvr=failure['build'].nvr, rc=failure['status_code'], err=failure['error']))
+
+        click.echo("Attached {attached} of {count} builds, {skipped} skipped, {rejected} rejected".format(
+            attached=len(results['attached']), count=build_count,
+            skipped=len(results['skipped']), rejected=len(results['rejected'])))
+        if results['rejected']:
             exit(1)
     else:
         click.echo("The following {n} builds ".format(n=build_count), nl=False)
@@ -720,14 +843,19 @@ PRESENT advisory. Here are some examples:
 # advisory:get
 #
 @cli.command("advisory:get", short_help="Get the ADVISORY")
-@click.argument('advisory', type=int)
+@click.argument('advisories', metavar='ADVISORY...', nargs=-1, type=int, required=True)
 @click.option('--json', is_flag=True, default=False,
               help="Print the full JSON object of the advisory")
 @click.pass_context
-def get(ctx, json, advisory):
-    """Get details about a specific advisory from the Errata Tool. By
+def get(ctx, json, advisories):
+    """Get details about one or more ADVISORY from the Errata Tool. By
 default a brief one-line informational string is printed. Use the
---json option to fetch and print the full details of the advisory.
+--json option to fetch and print the full details of the advisory. A
+single advisory is printed as indented JSON, several as one line of
+JSON each.
+
+Several advisories are fetched concurrently, each is printed as soon as
+it arrives.
 
 Fields for the short format: Release date, State, Synopsys, URL
 
@@ -748,16 +876,112 @@ Fields for the short format: Release date, State, Synopsys, URL
         "assigned_to_id": 3002255,
         "batch_id": null,
         ...
+
+    Get the RPM and image advisories 123456 and 123457, one JSON
+    object per line:
+
+\b
+    $ elliott advisory:get --json 123456 123457 | jq '.errata'
 """
+    missing = []
     try:
-        advisory = ocp_cd_tools.errata.get_erratum(advisory)
+        for advisory_id, advisory in ocp_cd_tools.errata.iter_errata(advisories):
+            if advisory is False:
+                missing.append(advisory_id)
+            elif json:
+                # One object per line when there are several, so they
+                # can be told apart
+                click.echo(advisory.to_json() if len(advisories) == 1 else advisory.to_json(indent=None))
+            else:
+                click.echo(advisory)
     except ocp_cd_tools.exceptions.ErrataToolUnauthenticatedException:
         exit_unauthenticated()
 
-    if json:
-        click.echo(advisory.to_json())
-    else:
-        click.echo(advisory)
+    if missing:
+        red_prefix("Error: ")
+        click.echo("Could not locate advisories: {ids}".format(ids=", ".join(str(i) for i in sorted(missing))))
+        exit(1)
+
+
+#
+# Watch Advisories
+# advisory:watch
+#
+@cli.command("advisory:watch", short_help="Watch advisories change state")
+@click.argument('advisories', nargs=-1, type=int, required=True)
+@click.option('--interval', metavar='SECONDS', type=click.IntRange(1),
+              default=ocp_cd_tools.constants.errata_watch_interval,
+              help='Poll a changing advisory every SECONDS (default: {})'.format(
+                  ocp_cd_tools.constants.errata_watch_interval))
+@click.option('--max-interval', metavar='SECONDS', type=click.IntRange(1),
+              default=ocp_cd_tools.constants.errata_watch_max_interval,
+              help='Poll an unchanging advisory at least every SECONDS (default: {})'.format(
+                  ocp_cd_tools.constants.errata_watch_max_interval))
+@click.option('--until', metavar='STATE', multiple=True,
+              default=ocp_cd_tools.constants.errata_inactive_advisory_labels,
+              help='Stop watching an advisory once it is in STATE [multiple] (default: {})'.format(
+                  ', '.join(ocp_cd_tools.constants.errata_inactive_advisory_labels)))
+@click.option('--json', is_flag=True, default=False,
+              help="Print each state change as a line of JSON")
+@click.pass_context
+def watch(ctx, advisories, interval, max_interval, until, json):
+    """Watch one or more ADVISORIES move through their states. The
+current state of each advisory is printed first, after that a line is
+printed only when an advisory changes state. Watching ends once every
+advisory is SHIPPED_LIVE or DROPPED_NO_SHIP (see --until), or on
+Ctrl-C.
+
+Advisories are polled concurrently, each on its own schedule: more
+often while it is changing, less often (up to --max-interval) while it
+is not. Unchanged advisories are not downloaded again.
+
+    Watch the RPM and image advisories for 3.9 and 3.10 until they
+    ship:
+
+\b
+    $ elliott advisory:watch 123456 123457 123458 123459
+    2018-05-30T12:00:01 123456 QE OpenShift Container Platform 3.9 bug fix update https://errata.devel.redhat.com/advisory/123456
+    ...
+    2018-05-30T14:10:51 123456 QE -> REL_PREP OpenShift Container Platform 3.9 bug fix update https://errata.devel.redhat.com/advisory/123456
+
+    Wait for advisory 123456 to reach REL_PREP, printing JSON lines:
+
+\b
+    $ elliott advisory:watch --until REL_PREP --json 123456
+"""
+    if max_interval < interval:
+        raise click.BadParameter("--max-interval must not be less than --interval")
+
+    changes = ocp_cd_tools.errata.watch_errata(
+        advisories, interval=interval, max_interval=max_interval, until=until)
+    try:
+        for advisory_id, previous, erratum in changes:
+            now = datetime.datetime.now().replace(microsecond=0).isoformat()
+            if json:
+                click.echo(json_module.dumps({
+                    'time': now,
+                    'id': advisory_id,
+                    'from': previous,
+                    'to': erratum.status,
+                    'synopsis': erratum.synopsis,
+                    'url': erratum.url,
+                }))
+            elif previous is None:
+                click.echo("{now} {id} {state} {synopsis} {url}".format(
+                    now=now, id=advisory_id, state=erratum.status,
+                    synopsis=erratum.synopsis, url=erratum.url))
+            else:
+                click.echo("{now} {id} {previous} -> {state} {synopsis} {url}".format(
+                    now=now, id=advisory_id, previous=previous, state=erratum.status,
+                    synopsis=erratum.synopsis, url=erratum.url))
+    except ocp_cd_tools.exceptions.ErrataToolUnauthenticatedException:
+        exit_unauthenticated()
+    except ocp_cd_tools.exceptions.ErrataToolError as e:
+        red_prefix("Error: ")
+        click.echo(str(e))
+        exit(1)
+    except KeyboardInterrupt:
+        exit(130)
 
 
 #
@@ -791,7 +1015,7 @@ yourself online: https://errata.devel.redhat.com/filter/1965
     $ elliott advisory:list -n 10 -f 1337
 """
     try:
-        for erratum in ocp_cd_tools.errata.get_filtered_list(filter_id, limit=n):
+        for erratum in ocp_cd_tools.errata.iter_filtered_list(filter_id, limit=n):
             if json:
                 click.echo(erratum.to_json())
             else:
@@ -839,6 +1063,11 @@ Example to add standard metadata to a 3.10 images release
 
     result = advisory.add_comment({'release': release, 'kind': kind, 'impetus': impetus})
 
+    # Whatever happened, the advisory must be scanned again next time
+    index = advisory_metadata_index(runtime)
+    index.forget(advisory.advisory_id)
+    index.save()
+
     if result.status_code == 201:
         green_prefix("Added metadata successfully")
         click.echo()
@@ -3,28 +3,30 @@ Utility functions for general interactions with Brew and Builds
 """
 
 # stdlib
-import ast
+import atexit
+import gzip
+import os
+import json
+import Queue
+import tempfile
 import time
 import datetime
-import subprocess
 from multiprocessing.dummy import Pool as ThreadPool
 from multiprocessing import cpu_count
 from multiprocessing import Lock
-import shlex
+import threading
 import koji
-import koji_cli.lib
-import traceback
 
 # ours
 import constants
+import errata_client
 import exceptions
-import exectools
+import koji_client
 import logutil
+import repodata
 
 # 3rd party
 import click
-import requests
-from requests_kerberos import HTTPKerberosAuth
 
 logger = logutil.getLogger(__name__)
 
@@ -38,6 +40,31 @@ watch_task_info = {}
 # Protects threaded access to watch_task_info
 watch_task_lock = Lock()
 
+# The shared TaskMonitor, created on first use by get_task_monitor()
+_task_monitor = None
+# Protects creation of the shared TaskMonitor
+_task_monitor_lock = Lock()
+
+# The shared LogCollector, created on first use by get_log_collector()
+_log_collector = None
+# Protects creation of the shared LogCollector
+_log_collector_lock = Lock()
+
+# Populated by get_tag_snapshot. Each (tag, type, inherit) is a key in
+# the dict and each value is the TagSnapshot for it
+_tag_snapshots = {}
+# Protects threaded access to _tag_snapshots
+_tag_snapshots_lock = Lock()
+# Where tag snapshots keep the tag listings they load for later runs,
+# set by enable_tag_history
+_tag_history = None
+
+# Populated by get_tagged_rpm_names. Each (tag, arch) is a key in the
+# dict and each value is the TaggedRPMNames for it
+_tagged_rpm_names = {}
+# Protects threaded access to _tagged_rpm_names
+_tagged_rpm_names_lock = Lock()
+
 
 def get_watch_task_info_copy():
     """
@@ -49,46 +76,132 @@ def get_watch_task_info_copy():
         return dict(watch_task_info)
 
 
-def watch_task(log_f, task_id, terminate_event):
+def watch_task(log_f, task_id, terminate_event, package=None):
+    """Wait for a brew task to finish, cancelling it if interrupted
+    or if it takes more than 4 hours. The task is watched by the shared
+    TaskMonitor, see get_task_monitor().
+
+    :param function log_f: Called with progress messages
+    :param str|int task_id: The ID of the task
+    :param threading.Event terminate_event: Set to interrupt
+    :param str package: The package (component) the task builds, if
+    known. Brew's average build time for it tells the monitor when to
+    look more often.
+
+    :return: None if the task succeeded, otherwise a description of
+    what went wrong
+    """
     end = time.time() + 4 * 60 * 60
-    watcher = koji_cli.lib.TaskWatcher(
-        task_id,
-        koji.ClientSession(constants.BREW_HUB),
-        quiet=True)
+    monitor = get_task_monitor()
+    task = monitor.watch(task_id, package=package)
+    state = None
     error = None
-    except_count = 0
     while error is None:
-        try:
-            watcher.update()
-            except_count = 0
+        # Wake up now and then, `wait` without a timeout disables
+        # signal handling
+        done = task.done.wait(1)
 
+        if task.info is not None:
             # Keep around metrics for each task we watch
             with watch_task_lock:
-                watch_task_info[task_id] = dict(watcher.info)
-
-            if watcher.is_done():
-                return None if watcher.is_success() else watcher.get_failure()
-            log_f("Task state: " + koji.TASK_STATES[watcher.info['state']])
-        except:
-            except_count += 1
-            # possible for watcher.update() to except during connection issue, try again
-            log_f('watcher.update() exception. Trying again in 60s.\n{}'.format(traceback.format_exc()))
-            if except_count >= 10:
-                log_f('watcher.update() excepted 10 times. Giving up.')
-                error = traceback.format_exc()
-                break
-
-        if terminate_event.wait(timeout=3 * 60):
+                watch_task_info[task_id] = dict(task.info)
+            if task.state != state:
+                state = task.state
+                log_f("Task state: " + state)
+
+        if done:
+            if task.watch_error is None:
+                return task.failure
+            log_f('Could not watch task, giving up: {}'.format(task.watch_error))
+            error = task.watch_error
+        elif terminate_event.is_set():
             error = 'Interrupted'
         elif time.time() > end:
             error = 'Timeout building image'
 
+    monitor.forget(task)
     log_f(error + ", canceling build")
-    subprocess.check_call(("brew", "cancel", str(task_id)))
+    with koji_client.get_pool().session(login=True) as session:
+        session.cancelTask(int(task_id))
     return error
 
 
-def get_brew_build(nvr, product_version='', session=None):
+def get_task_monitor():
+    """
+    :return: The TaskMonitor shared by the whole process. It is
+    created the first time this is called.
+    """
+    global _task_monitor
+    with _task_monitor_lock:
+        if _task_monitor is None:
+            _task_monitor = TaskMonitor()
+        return _task_monitor
+
+
+def get_log_collector():
+    """
+    :return: The LogCollector shared by the whole process. It is
+    created the first time this is called, and waited for when the
+    process exits.
+    """
+    global _log_collector
+    with _log_collector_lock:
+        if _log_collector is None:
+            _log_collector = LogCollector()
+            atexit.register(_log_collector.join)
+        return _log_collector
+
+
+def collect_task_logs(task_id, logs_dir, callback=None):
+    """Download the logs of a brew task in the background, compressed,
+    see LogCollector.collect()
+
+    :return: A LogCollection, done once the logs are downloaded
+    """
+    return get_log_collector().collect(task_id, logs_dir, callback=callback)
+
+
+def download_task_logs(task_id, logs_dir, blocksize=102400, compress=False):
+    """Download the logs of a brew task, to where `brew download-logs
+    -d logs_dir task_id` would put them: logs_dir/{arch}-{task_id}/
+
+    :param str|int task_id: The ID of the task
+    :param str logs_dir: The directory to download into
+    :param int blocksize: How much of a log to download per request
+    :param bool compress: Store the logs gzipped, as {name}.log.gz
+
+    :return: A list of the paths of the downloaded logs
+    :raises BrewBuildException: If the task does not exist
+    """
+    task_id = int(task_id)
+    pool = koji_client.get_pool()
+    task_info, files = pool.multicall([
+        ('getTaskInfo', [task_id], {}),
+        ('listTaskOutput', [task_id], {}),
+    ])
+    if task_info is None:
+        raise exceptions.BrewBuildException("No such brew task: {}".format(task_id))
+
+    task_dir = os.path.join(logs_dir, "{}-{}".format(task_info['arch'], task_id))
+    paths = []
+    for filename in sorted(f for f in files if f.endswith('.log')):
+        path = os.path.join(task_dir, filename)
+        koji.ensuredir(os.path.dirname(path))
+        if compress:
+            path += '.gz'
+        with (gzip.open if compress else open)(path, 'wb') as f:
+            offset = 0
+            while True:
+                contents = pool.call('downloadTaskOutput', task_id, filename, offset=offset, size=blocksize)
+                if not contents:
+                    break
+                f.write(contents)
+                offset += len(contents)
+        paths.append(path)
+    return paths
+
+
+def get_brew_build(nvr, product_version='', client=None, store=None):
     """5.2.2.1. GET /api/v1/build/{id_or_nvr}
 
     Get Brew build details.
@@ -98,31 +211,95 @@ def get_brew_build(nvr, product_version='', session=None):
     :param str nvr: A name-version-release string of a brew rpm/image build
     :param str product_version: The product version tag as given to ET
     when attaching a build
-    :param requests.Session session: A python-requests Session object,
-    used for for connection pooling. Providing `session` object can
-    yield a significant reduction in total query time when looking up
-    many builds.
-
-    http://docs.python-requests.org/en/master/user/advanced/#session-objects
+    :param ErrataClient client: The Errata Tool client to make the
+    request with. Defaults to the shared, connection pooled client
+    (see errata_client.get_client()), which is what you want when
+    looking up many builds.
+    :param BuildStore store: Answer from this store of build details
+    where it can, and record what is fetched in it
 
     :return: An initialized Build object with the build details
     :raises exceptions.BrewBuildException: When build not found
 
     """
-    if session is not None:
-        res = session.get(constants.errata_get_build_url.format(id=nvr),
-                          auth=HTTPKerberosAuth())
+    if store is not None:
+        body = store.lookup(nvr)
+        if body is not None:
+            return Build(nvr=nvr, body=body, product_version=product_version)
+
+    if client is None:
+        client = errata_client.get_client()
+    if store is not None:
+        # The store wants to know where the build is attached now, not
+        # what a cached response says
+        res = client.get(constants.errata_get_build_url.format(id=nvr), max_age=0)
     else:
-        res = requests.get(constants.errata_get_build_url.format(id=nvr),
-                           auth=HTTPKerberosAuth())
+        res = client.get(constants.errata_get_build_url.format(id=nvr))
     if res.status_code == 200:
-        return Build(nvr=nvr, body=res.json(), product_version=product_version)
+        body = res.json()
+        if store is not None:
+            store.record(nvr, body)
+        return Build(nvr=nvr, body=body, product_version=product_version)
     else:
         raise exceptions.BrewBuildException("{build}: {msg}".format(
             build=nvr,
             msg=res.text))
 
 
+def get_brew_builds(nvrs, product_version='', n_threads=constants.errata_max_concurrent_requests, progress_f=None,
+                    store=None):
+    """Look up many builds with get_brew_build(), concurrently
+
+    Up to `n_threads` lookups are in flight at once, all of them
+    sharing the connection pool of the Errata Tool client. Make sure
+    constants.errata_connection_pool_size is at least as large, or
+    connections will not be reused.
+
+    :param list nvrs: Name-version-release strings (or build IDs) of
+    the builds to look up
+    :param str product_version: The product version tag as given to ET
+    when attaching a build
+    :param int n_threads: The most lookups to have in flight at once
+    :param function progress_f: Called with each Build once it has
+    been looked up, e.g., to draw a progress bar
+    :param BuildStore store: Passed on to get_brew_build()
+
+    :return: A list of Build objects, in the same order as `nvrs`
+    :raises exceptions.BrewBuildException: When any build is not found
+    :raises KeyboardInterrupt: When interrupted (Ctrl-C). The lookups
+    not yet started are abandoned.
+    """
+    if len(nvrs) == 0:
+        return []
+
+    client = errata_client.get_client()
+    terminate_event = threading.Event()
+
+    def lookup(nvr):
+        if terminate_event.is_set():
+            return None
+        build = get_brew_build(nvr, product_version, client=client, store=store)
+        if progress_f is not None:
+            progress_f(build)
+        return build
+
+    pool = ThreadPool(min(n_threads, len(nvrs)))
+    ret = pool.map_async(lookup, nvrs, chunksize=1)
+    pool.close()
+    try:
+        # `wait` without a timeout disables signal handling
+        while not ret.ready():
+            ret.wait(60)
+    except KeyboardInterrupt:
+        logger.warn('SIGINT received, abandoning the remaining build lookups...')
+        terminate_event.set()
+        pool.terminate()
+        pool.join()
+        raise
+    pool.join()
+    return ret.get()
+
+
 def find_unshipped_build_candidates(base_tag, product_version, kind='rpm'):
     """Find builds for a product and return a list of the builds only
     labeled with the -candidate tag that aren't attached to any open
@@ -169,99 +346,111 @@ def find_unshipped_build_candidates(base_tag, product_version, kind='rpm'):
 def get_brew_buildinfo(build):
     """Get the buildinfo of a brew build from brew.
 
-    :param str|int build: A build NVR or numeric ID
+    :param Build build: The build to look up
+
+    :return dict buildinfo: The build as given by brew (the koji
+    getBuild call, including its 'extra' data), with the names of the
+    tags the build is in added as 'tags'
 
-    :return dict buildinfo: A dict of the build info. Certain fields
-    may be transformed such as 'Tags' turned into a list, and 'Extra'
-    into a proper dict object instead of a JSON string
+    :raises BrewBuildException: If the build does not exist
 
-    :return str buildinfo: The raw unparsed buildinfo as a string
+    Note: This is different from get_brew_build in that this function
+    queries brew directly. Whereas, get_brew_build queries the Errata Tool
+    API for other information.
 
-Note: This is different from get_brew_build in that this function
-queries brew directly using the 'brew buildinfo' command. Whereas,
-get_brew_build queries the Errata Tool API for other information.
+    This function will give information not provided by ET: build tags,
+    finished date, built by, etc.
 
-This function will give information not provided by ET: build tags,
-finished date, built by, etc.
+    To look up many builds use get_brew_buildinfos, it takes a few
+    requests for all of them rather than one per build.
     """
-    query_string = "brew buildinfo {nvr}".format(nvr=build.nvr)
-    rc, stdout, stderr = exectools.cmd_gather(shlex.split(query_string))
-    buildinfo = {}
+    return get_brew_buildinfos([build.nvr])[0]
 
-    if as_string and rc == 0:
-        return stdout
-    else:
-        buildinfo = {}
-
-        # These keys indicate content which can be whitespace split into
-        # an array, ex: the value of the "Tags" key comes as a string, but
-        # we can split it on space characters and have a list of tags
-        # instead.
-        split_keys = ['Tags']
-        # The value of these keys contain json strings which we can
-        # attempt to load into a datastructure
-        json_keys = ['Extra']
-        for line in stdout.splitlines():
-            key, token, rest = line.partition(': ')
-            if key in split_keys:
-                buildinfo[key] = rest.split(' ')
-                continue
-            elif key in json_keys:
-                try:
-                    # Why would we use the ast module for this? Is
-                    # json.loads not enough? Actually, no, it isn't
-                    # enough. The <airquotes>JSON</airquotes> returned
-                    # from 'brew buildinfo' uses single-quotes to wrap
-                    # strings, that is not valid json. Whereas,
-                    # ast.literal_eval() can handle that and load the
-                    # string into a structure we can work with
-                    buildinfo[key] = ast.literal_eval(rest)
-                except Exception as e:
-                    buildinfo[key] = rest
-                    continue
-            else:
-                buildinfo[key] = rest
-        return buildinfo
 
+def get_brew_buildinfos(nvrs):
+    """Get the buildinfo of many brew builds from brew, in a few
+    batched requests. See get_brew_buildinfo.
 
-def get_tagged_image_builds(tag, latest=True):
-    """Wrapper around shelling out to run 'brew list-tagged' for a given tag.
+    :param list nvrs: Name-version-release strings (or build IDs) of
+    the builds to look up
 
-    :param str tag: The tag to list builds from
-    :param bool latest: Only show the single latest build of a package
+    :return: A list of buildinfo dicts, in the same order as `nvrs`
+    :raises BrewBuildException: If any of the builds does not exist,
+    naming all of those
     """
-    if latest:
-        latest_option = '--latest'
-    else:
-        latest_option = ''
-
-    query_string = "brew list-tagged {tag} {latest} --type=image --quiet".format(tag=tag, latest=latest_option)
-    # --latest - Only the last build for that package
-    # --type=image - Only show container images builds
-    # --quiet - Omit field headers in output
+    calls = []
+    for nvr in nvrs:
+        calls.append(('getBuild', [nvr], {}))
+        calls.append(('listTags', [], {'build': nvr}))
+    results = koji_client.get_pool().multicall(calls, strict=False)
+
+    buildinfos = []
+    errors = []
+    for i, nvr in enumerate(nvrs):
+        buildinfo, tags = results[2 * i], results[2 * i + 1]
+        if buildinfo is None:
+            errors.append("{}: build not found".format(nvr))
+        elif isinstance(buildinfo, Exception) or isinstance(tags, Exception):
+            errors.append("{}: {}".format(nvr, buildinfo if isinstance(buildinfo, Exception) else tags))
+        else:
+            buildinfo['tags'] = [tag['name'] for tag in tags]
+            buildinfos.append(buildinfo)
 
-    return exectools.cmd_gather(shlex.split(query_string))
+    if errors:
+        raise exceptions.BrewBuildException("Failed to get buildinfo for {n} builds: {errors}".format(
+            n=len(errors), errors=', '.join(errors)))
+    return buildinfos
 
 
-def get_tagged_rpm_builds(tag, arch='src', latest=True):
-    """Wrapper around shelling out to run 'brew list-tagged' for a given tag.
+def add_buildinfos(builds, verbose=False):
+    """Fill in the buildinfo of many Build objects at once, see
+    Build.add_buildinfo
 
-    :param str tag: The tag to list builds from
-    :param str arch: Filter results to only this architecture
-    :param bool latest: Only show the single latest build of a package
+    :param list builds: A list of Build objects
+    :param bool verbose: Print a progress dot for each build
+    :raises BrewBuildException: If any of the builds does not exist
     """
-    if latest is True:
-        latest_flag = "--latest"
-    else:
-        latest_flag = ""
+    for build, buildinfo in zip(builds, get_brew_buildinfos([b.nvr for b in builds])):
+        build.buildinfo = buildinfo
+        build.finished = datetime.datetime.utcfromtimestamp(buildinfo['completion_ts'])
+        if verbose:
+            click.secho('.', nl=False)
+
+
+def get_tag_snapshot(tag, type=None, inherit=False):
+    """The TagSnapshot of a tag, shared by the whole process. It is
+    loaded from brew the first time it is asked for, later calls answer
+    from memory.
 
-    query_string = "brew list-tagged {tag} {latest} --rpm --quiet --arch {arch}".format(tag=tag, latest=latest_flag, arch=arch)
-    # --latest - Only the last build for that package
-    # --rpm - Only show RPM builds
-    # --quiet - Omit field headers in output
-    # --arch {arch} - Only show builds of this architecture
+    :param str tag: The name of the tag
+    :param str type: Only index builds of this type, e.g., 'image' or
+    'rpm'
+    :param bool inherit: Include the builds of the tags `tag` inherits
+    from
+    :return: A loaded TagSnapshot
+    :raises koji.GenericError: If the tag could not be listed
+    """
+    key = (tag, type, inherit)
+    with _tag_snapshots_lock:
+        if key not in _tag_snapshots:
+            _tag_snapshots[key] = TagSnapshot(tag, type=type, inherit=inherit, history=_tag_history)
+        snapshot = _tag_snapshots[key]
+    # Snapshots of different tags load concurrently, threads asking
+    # for the same one wait for it to be loaded once
+    snapshot.load()
+    return snapshot
+
+
+def enable_tag_history(path):
+    """Keep the listings of the tags snapshots are loaded from on disk,
+    so later runs only have to fetch what changed since. See
+    TagHistory.
+
+    :param str path: Directory for the listings
+    """
+    global _tag_history
+    _tag_history = TagHistory(path)
 
-    return exectools.cmd_gather(shlex.split(query_string))
 
 # ============================================================================
 # Brew object interaction models
@@ -303,49 +492,697 @@ def splitRPMFilename(filename):
 
 
 def get_tagged_rpm_names(branch, arch='x86_64'):
-    query_string = "brew list-tagged --inherit --latest --rpms --arch {arch} {branch}-container-build"
-    # --latest - Only the last build for that package
-    # --rpm - Only show RPM builds
-    # --quiet - Omit field headers in output
-    # --arch {arch} - Only show builds of this architecture
-
-    rpms = []
-
-    arches = ['noarch', arch]  # always gather noarch
-    for a in arches:
-        rc, stdout, stderr = exectools.cmd_gather(shlex.split(query_string.format(branch=branch, arch=a)))
-        if rc == 0:
-            rpms.extend(stdout.splitlines())
-        else:
-            raise ValueError(stderr)
+    """The names of the latest rpms in the buildroot of a branch, for
+    an architecture and noarch
+
+    The names are listed once per run, see TaggedRPMNames. With tag
+    history enabled (see enable_tag_history()) they are kept on disk
+    too, and later runs only look up the packages tagged or untagged
+    since.
 
-    result = set([splitRPMFilename(line.strip())[0] for line in rpms])
+    :param str branch: Building branch, such as rhaos-3.10-rhel-7
+    :param str arch: CPU architecture
 
-    return result
+    :return: A set of rpm names
+    :raises ValueError: If the rpms could not be listed
+    """
+    key = ("{branch}-container-build".format(branch=branch), arch)
+    with _tagged_rpm_names_lock:
+        if key not in _tagged_rpm_names:
+            _tagged_rpm_names[key] = TaggedRPMNames(
+                key[0], arch, path=_tag_history.path if _tag_history is not None else None)
+        rpm_names = _tagged_rpm_names[key]
+    try:
+        rpm_names.load()
+    except koji.GenericError as e:
+        raise ValueError(str(e))
+    return rpm_names.names
 
 
 def check_rpm_buildroot(name, branch, arch='x86_64'):
     """
     Query the buildroot used by ODCS to determine if a given RPM name
     is provided by ODCS for the given arch.
+
+    The repository metadata of the buildroot is read once per run and
+    arch, see repodata.get_repo_index().
+
     :param str name: RPM name
     :param str branch: Current building branch, such as rhaos-3.10-rhel-7
     :param str arch: CPU architecture to search
+    :return: A list of the names of the packages providing `name`
+    :raises ValueError: If the buildroot repository could not be read
     """
-    args = locals()
-    query = 'repoquery --repofrompath foo,"http://download-node-02.eng.bos.redhat.com/brewroot/repos/{branch}-ppc64le-container-build/latest/{arch}" --repoid=foo --arch {arch},noarch --whatprovides {name}'
-    rc, stdout, stderr = exectools.cmd_gather(query.format(**args))
-    if rc == 0:
-        result = []
-        stdout = stdout.strip()
-        for rpm in stdout.strip().splitlines():
-            n = rpm.split(':')[0]
-            n = '-'.join(n.split('-')[0:-1])
-            result.append(n)
-
-        return result
-    else:
-        raise ValueError(stderr)
+    baseurl = constants.BREW_BUILDROOT_REPO_URL.format(branch=branch, arch=arch)
+    return repodata.get_repo_index(baseurl).whatprovides(name, arch)
+
+
+class TagSnapshot(object):
+    """
+    The latest build of each package in a brew tag, as of when the
+    snapshot was loaded. One listing of the tag answers any number of
+    latest-build questions about it from memory.
+
+    Use get_tag_snapshot() to share snapshots across a run.
+    """
+    def __init__(self, tag, type=None, inherit=False, history=None):
+        """
+        :param str tag: The name of the tag
+        :param str type: Only index builds of this type, e.g., 'image'
+        or 'rpm'
+        :param bool inherit: Include the builds of the tags `tag`
+        inherits from
+        :param TagHistory history: Load the tag through this persistent
+        listing, rather than listing it in full. Tag history does not
+        cover inherited builds, so it is not used when `inherit` is set.
+        """
+        self.tag = tag
+        self.type = type
+        self.inherit = inherit
+        self.history = history if not inherit else None
+        # Package name => latest build (a dict, as from the koji
+        # getBuild call)
+        self.builds = None
+        self._lock = Lock()
+
+    def load(self, reload=False):
+        """Load the listing of the tag from brew, unless it has been
+        already
+
+        :param bool reload: Load it again even if it has been
+        :raises koji.GenericError: If the tag could not be listed
+        """
+        with self._lock:
+            if self.builds is not None and not reload:
+                return
+            if self.history is not None:
+                # Brew's latest build of a package is the one tagged
+                # most recently
+                builds = sorted(self.history.listing(self.tag, self.type).values(),
+                                key=lambda b: (b['create_event'], b['id']))
+            else:
+                builds = koji_client.get_pool().call(
+                    'listTagged', self.tag, inherit=self.inherit, latest=True, type=self.type)
+            self.builds = dict((b['package_name'], b) for b in builds)
+            logger.debug("Loaded {n} builds tagged in {tag}".format(n=len(builds), tag=self.tag))
+
+    def latest_build(self, package):
+        """
+        :param str package: A package (component) name
+        :return: The latest build of the package in the tag, or None if
+        it has none
+        """
+        return self.builds.get(package)
+
+    def latest_builds(self):
+        """
+        :return: A list of the latest build of each package in the tag,
+        newest first (by build id)
+        """
+        return sorted(self.builds.values(), key=lambda b: b['id'], reverse=True)
+
+    def refresh_package(self, package):
+        """Look up the latest build of one package in brew again, e.g.,
+        after building it, and update the snapshot with it
+
+        :param str package: A package (component) name
+        :return: The latest build of the package in the tag, or None if
+        it has none
+        """
+        builds = koji_client.get_pool().call('getLatestBuilds', self.tag, package=package, type=self.type)
+        with self._lock:
+            if builds:
+                self.builds[package] = builds[0]
+            else:
+                self.builds.pop(package, None)
+        return self.latest_build(package)
+
+
+class WatchedTask(object):
+    """
+    A brew task watched by a TaskMonitor. `done` is set once the task
+    has finished, or once the monitor has given up on it (then
+    `watch_error` says why).
+    """
+    def __init__(self, task_id, expected_duration=None):
+        """
+        :param int task_id: The ID of the task
+        :param float expected_duration: How many seconds the task is
+        expected to take, if known
+        """
+        self.task_id = task_id
+        self.expected_duration = expected_duration
+        self.watched_at = time.time()
+        # The latest task info from brew (the koji getTaskInfo call)
+        self.info = None
+        # Why the task failed, None if it succeeded
+        self.failure = None
+        self.watch_error = None
+        self.errors = 0
+        self.done = threading.Event()
+
+    @property
+    def state(self):
+        """The name of the state of the task, e.g., 'OPEN'"""
+        return koji.TASK_STATES[self.info['state']] if self.info is not None else None
+
+
+class TaskMonitor(object):
+    """
+    Watches every brew task in flight from one thread, looking all of
+    them up in one multicall per round. Builders wait on their
+    WatchedTask (see watch()) and are woken as soon as the round which
+    sees their task finish is over.
+
+    Rounds are adaptive. Each task is looked at more often the closer
+    it is to when it is expected to finish (brew's average build time
+    for its package, or how long the tasks finished so far took), and
+    seldom while that is far off.
+    """
+    def __init__(self, min_interval=constants.brew_task_poll_min_interval,
+                 max_interval=constants.brew_task_poll_max_interval,
+                 expected_duration=constants.brew_task_expected_duration):
+        """
+        :param float min_interval: The fewest seconds between rounds
+        :param float max_interval: The most seconds between rounds
+        :param float expected_duration: How many seconds tasks are
+        expected to take until some have finished, for tasks of
+        packages brew has no average build time for
+        """
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.expected_duration = expected_duration
+        self.tasks = {}
+        # How long each task seen finishing took
+        self.durations = []
+        self._poll_now = False
+        self._thread = None
+        self._cond = threading.Condition(threading.Lock())
+
+    def watch(self, task_id, package=None):
+        """Start watching a task
+
+        :param str|int task_id: The ID of the task
+        :param str package: The package the task builds, if known
+        :return: A WatchedTask
+        """
+        expected_duration = None
+        if package is not None:
+            try:
+                expected_duration = koji_client.get_pool().call('getAverageBuildDuration', package)
+            except Exception as e:
+                # Only a hint, the task can be watched without it
+                logger.debug("No average build duration for {}: {}".format(package, e))
+
+        task = WatchedTask(int(task_id), expected_duration)
+        with self._cond:
+            self.tasks[task.task_id] = task
+            # Have a first look at the new task right away
+            self._poll_now = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='brew-task-monitor')
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify_all()
+        return task
+
+    def forget(self, task):
+        """Stop watching a task"""
+        with self._cond:
+            self.tasks.pop(task.task_id, None)
+
+    def interval(self, task, now=None):
+        """How many seconds until `task` should be looked at again"""
+        now = time.time() if now is None else now
+        expected = task.expected_duration
+        if expected is None:
+            expected = sum(self.durations) / len(self.durations) if self.durations else self.expected_duration
+        info = task.info or {}
+        start = info.get('start_ts') or info.get('create_ts') or task.watched_at
+        # Look often around the expected end, less often the further
+        # off it is, whichever side of it we are
+        return min(max(abs(start + expected - now) / 4, self.min_interval), self.max_interval)
+
+    def poll(self, tasks):
+        """Look up `tasks` in brew, finish those which are done
+
+        :param list tasks: A list of WatchedTask
+        """
+        pool = koji_client.get_pool()
+        try:
+            infos = pool.multicall([('getTaskInfo', [t.task_id], {}) for t in tasks], strict=False)
+        except Exception as e:
+            # Can't reach the hub, it counts against every task
+            infos = [e] * len(tasks)
+
+        failed = []
+        for task, info in zip(tasks, infos):
+            if info is None or isinstance(info, Exception):
+                task.errors += 1
+                logger.warning("Could not look up brew task {}: {}".format(task.task_id, info))
+                if task.errors >= 10:
+                    task.watch_error = "Could not look up the task 10 times, the last time: {}".format(info)
+                    self._finish(task)
+                continue
+
+            task.errors = 0
+            task.info = info
+            if task.state == 'CLOSED':
+                self._finish(task)
+            elif task.state == 'CANCELED':
+                task.failure = 'Task canceled'
+                self._finish(task)
+            elif task.state == 'FAILED':
+                failed.append(task)
+
+        if failed:
+            # Why they failed is what getting their result raises
+            results = pool.multicall([('getTaskResult', [t.task_id], {}) for t in failed], strict=False)
+            for task, result in zip(failed, results):
+                if isinstance(result, Exception):
+                    task.failure = '{}: {}'.format(result.__class__.__name__, str(result).strip())
+                else:
+                    task.failure = 'unknown error'
+                self._finish(task)
+
+    def _finish(self, task):
+        """A task is done, wake up whoever is waiting for it"""
+        info = task.info or {}
+        if info.get('start_ts') and info.get('completion_ts') and task.watch_error is None:
+            self.durations.append(info['completion_ts'] - info['start_ts'])
+        self.forget(task)
+        task.done.set()
+
+    def _run(self):
+        """Look at the tasks watched, round after round"""
+        next_poll = 0
+        while True:
+            with self._cond:
+                while not (self.tasks and (self._poll_now or time.time() >= next_poll)):
+                    self._cond.wait(max(min(next_poll - time.time(), 60), 0.1) if self.tasks else 60)
+                self._poll_now = False
+                tasks = self.tasks.values()
+
+            try:
+                self.poll(tasks)
+            except Exception:
+                logger.exception("Failed to look up brew tasks")
+
+            now = time.time()
+            with self._cond:
+                next_poll = now + min([self.interval(t, now) for t in self.tasks.values()] or [0])
+
+
+class LogCollection(object):
+    """
+    The logs of one brew task, being downloaded by a LogCollector.
+    `done` is set once they are downloaded (`paths`), or once that
+    failed (`error`).
+    """
+    def __init__(self, task_id, logs_dir, callback=None):
+        """
+        :param int task_id: The ID of the task
+        :param str logs_dir: The directory to download into
+        :param callback: Called with this LogCollection when it is done
+        """
+        self.task_id = task_id
+        self.logs_dir = logs_dir
+        self.callback = callback
+        self.paths = []
+        self.error = None
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Wait for the collection to be done
+
+        :param float timeout: The most seconds to wait, None to wait
+        for as long as it takes
+        :return: True if it is done
+        """
+        end = None if timeout is None else time.time() + timeout
+        # `wait` without a timeout disables signal handling
+        while not self.done.wait(1):
+            if end is not None and time.time() >= end:
+                break
+        return self.done.is_set()
+
+
+class LogCollector(object):
+    """
+    Downloads the logs of brew tasks in the background, so builders
+    can hand their build result on as soon as the task is done instead
+    of after its logs are downloaded. At most `concurrency` tasks have
+    their logs downloaded at once, the rest queue up. Logs are stored
+    gzipped (see download_task_logs()).
+    """
+    def __init__(self, concurrency=constants.brew_log_collector_concurrency):
+        """
+        :param int concurrency: How many tasks to download the logs of
+        at once
+        """
+        self.concurrency = concurrency
+        self.pending = []
+        self._queue = Queue.Queue()
+        self._threads = []
+        self._lock = Lock()
+
+    def collect(self, task_id, logs_dir, callback=None):
+        """Queue the logs of a task to be downloaded
+
+        :param str|int task_id: The ID of the task
+        :param str logs_dir: The directory to download into, as for
+        download_task_logs()
+        :param callback: Called with the LogCollection once it is done,
+        from the thread which downloaded it
+        :return: A LogCollection
+        """
+        collection = LogCollection(int(task_id), logs_dir, callback)
+        with self._lock:
+            self.pending.append(collection)
+            if len(self._threads) < self.concurrency:
+                thread = threading.Thread(target=self._run,
+                                          name='brew-log-collector-{}'.format(len(self._threads)))
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+        self._queue.put(collection)
+        return collection
+
+    def join(self):
+        """Wait for every collection queued so far to be done"""
+        with self._lock:
+            pending = [c for c in self.pending if not c.done.is_set()]
+        if pending:
+            logger.info("Waiting for the logs of {} brew tasks to be downloaded".format(len(pending)))
+        for collection in pending:
+            collection.wait()
+
+    def _run(self):
+        """Download the logs of queued tasks, one task at a time"""
+        while True:
+            collection = self._queue.get()
+            try:
+                collection.paths = download_task_logs(collection.task_id, collection.logs_dir, compress=True)
+            except Exception as e:
+                collection.error = e
+                logger.warning("Could not download the logs of brew task {}: {}".format(collection.task_id, e))
+
+            if collection.callback is not None:
+                try:
+                    collection.callback(collection)
+                except Exception:
+                    logger.exception("Log collection callback failed for brew task {}".format(collection.task_id))
+
+            with self._lock:
+                self.pending.remove(collection)
+            collection.done.set()
+
+
+class TagHistory(object):
+    """
+    Persistent listings of brew tags, each stamped with the brew event
+    it is current as of. The first listing of a tag is a full one,
+    after that only the tag and untag events since the stamp are
+    fetched (the koji queryHistory call) and applied.
+
+    Each listing is a JSON file in `path`:
+
+        {
+            "tag": "rhaos-3.9-rhel-7-candidate",
+            "type": "rpm",
+            "event_id": 21443890,
+            "builds": {
+                "687421": {
+                    "id": 687421,
+                    "nvr": "cri-o-1.9.10-1.git8723732.el7",
+                    "package_name": "cri-o",
+                    "name": "cri-o",
+                    "version": "1.9.10",
+                    "release": "1.git8723732.el7",
+                    "create_event": 21440187
+                },
+                ...
+            }
+        }
+    """
+    # The fields of a build kept in a listing
+    fields = ['id', 'nvr', 'package_name', 'name', 'version', 'release', 'create_event']
+
+    def __init__(self, path):
+        """
+        :param str path: Directory for the listings
+        """
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def listing(self, tag, type=None):
+        """The builds in a tag now, brought up to date and saved
+
+        :param str tag: The name of the tag
+        :param str type: Only builds of this type, e.g., 'image' or 'rpm'
+        :return: A dict of build id => build (a dict with the keys in
+        TagHistory.fields)
+        :raises koji.GenericError: If brew could not be queried
+        """
+        path = os.path.join(self.path, "{}.{}.json".format(tag, type or 'all'))
+        listing = self.load(path)
+        pool = koji_client.get_pool()
+        event_id = pool.call('getLastEvent')['id']
+
+        if listing is None:
+            builds = pool.call('listTagged', tag, event=event_id, type=type)
+            listing = {
+                'tag': tag,
+                'type': type,
+                'builds': dict((str(b['id']), dict((f, b[f]) for f in self.fields)) for b in builds),
+            }
+            logger.debug("Listed {n} builds tagged in {tag}".format(n=len(builds), tag=tag))
+        elif event_id > listing['event_id']:
+            history = pool.call('queryHistory', tables=['tag_listing'], tag=tag,
+                                afterEvent=listing['event_id'], beforeEvent=event_id + 1)
+            self.apply(listing, history['tag_listing'], type)
+        listing['event_id'] = event_id
+
+        self.save(path, listing)
+        return dict((int(i), b) for i, b in listing['builds'].items())
+
+    def apply(self, listing, changes, type=None):
+        """Apply tag and untag events to a listing
+
+        :param dict listing: The listing to update
+        :param list changes: tag_listing entries, as from the koji
+        queryHistory call
+        :param str type: Only add builds of this type
+        """
+        # Replay the changes in the order they happened, a build can be
+        # untagged and tagged again since the listing was made
+        changes = sorted(changes, key=lambda c: c['revoke_event'] or c['create_event'])
+        tagged = dict((c['build_id'], c) for c in changes if c['revoke_event'] is None)
+        if type is not None and tagged:
+            build_ids = sorted(tagged)
+            build_types = koji_client.get_pool().multicall([('getBuildType', [i], {}) for i in build_ids])
+            wanted = set(i for i, types in zip(build_ids, build_types) if type in (types or {}))
+        else:
+            wanted = set(tagged)
+
+        for change in changes:
+            key = str(change['build_id'])
+            if change['revoke_event'] is not None:
+                listing['builds'].pop(key, None)
+            elif change['build_id'] in wanted:
+                listing['builds'][key] = {
+                    'id': change['build_id'],
+                    'nvr': "{name}-{version}-{release}".format(**change),
+                    'package_name': change['name'],
+                    'name': change['name'],
+                    'version': change['version'],
+                    'release': change['release'],
+                    'create_event': change['create_event'],
+                }
+        logger.debug("Applied {n} changes to {tag} since event {event}".format(
+            n=len(changes), tag=listing['tag'], event=listing['event_id']))
+
+    def load(self, path):
+        """:return: The listing stored at `path`, None if there is none
+        or it is damaged"""
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, 'r') as f:
+                listing = json.load(f)
+        except (IOError, ValueError) as e:
+            logger.warning("Ignoring unreadable tag listing {}: {}".format(path, e))
+            return None
+        if 'event_id' not in listing or 'builds' not in listing:
+            logger.warning("Ignoring incomplete tag listing {}".format(path))
+            return None
+        return listing
+
+    def save(self, path, listing):
+        """Write a listing to `path`"""
+        # Write next to the final name and swap it in, so readers
+        # never see a partial listing
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(listing, f)
+        os.rename(tmp_path, path)
+
+
+class TaggedRPMNames(object):
+    """
+    The names of the rpms of one arch and noarch in the latest builds
+    of a tag, the tags it inherits from included, as the koji
+    listTaggedRPMS call gives them with inherit and latest set. The
+    names are kept by package, stamped with the brew event they are
+    current as of.
+
+    If a `path` is given they are also kept on disk. A later load only
+    looks up again the packages which were tagged or untagged in the
+    tag or the tags it inherits from since then (the koji queryHistory
+    call). If the inheritance of the tag changed, everything is listed
+    again.
+
+    The file is `path`/{tag}.rpms.{arch}.json:
+
+        {
+            "tag": "rhaos-3.10-rhel-7-container-build",
+            "arch": "x86_64",
+            "event_id": 21443890,
+            "inheritance": ["rhaos-3.10-rhel-7-container-build", "rhel-7-build", ...],
+            "packages": {
+                "bash": ["bash", "bash-doc"],
+                ...
+            }
+        }
+    """
+    def __init__(self, tag, arch, path=None):
+        """
+        :param str tag: The name of the tag
+        :param str arch: CPU architecture, noarch rpms are always
+        included
+        :param str path: Directory to keep the names in, None to only
+        keep them in memory
+        """
+        self.tag = tag
+        self.arch = arch
+        self.arches = ['noarch', arch]
+        self.path = path
+        self.listing = None
+        # The names of all the rpms, for membership checks
+        self.names = None
+        self._lock = Lock()
+
+    def __contains__(self, name):
+        return name in self.names
+
+    @property
+    def filename(self):
+        """Where the names are kept on disk"""
+        return os.path.join(self.path, "{}.rpms.{}.json".format(self.tag, self.arch))
+
+    def load(self, reload=False):
+        """Bring the names up to date, unless they have been already
+
+        :param bool reload: Bring them up to date even if they have
+        been
+        :raises koji.GenericError: If brew could not be queried
+        """
+        with self._lock:
+            if self.names is not None and not reload:
+                return
+            listing = self.listing if self.listing is not None else self.read()
+            pool = koji_client.get_pool()
+            event_id = pool.call('getLastEvent')['id']
+            inheritance = [self.tag] + [t['name'] for t in pool.call('getFullInheritance', self.tag, event=event_id)]
+
+            if listing is None or listing['inheritance'] != inheritance:
+                listing = self.full_listing(event_id, inheritance)
+            elif event_id > listing['event_id']:
+                self.update(listing, event_id)
+            listing['event_id'] = event_id
+
+            self.listing = listing
+            self.names = set(name for names in listing['packages'].values() for name in names)
+            self.write()
+
+    def full_listing(self, event_id, inheritance):
+        """List the names of the rpms in full
+
+        :param int event_id: List them as of this brew event
+        :param list inheritance: The names of the tag and the tags it
+        inherits from
+        :return: A new listing
+        """
+        rpms, builds = koji_client.get_pool().call(
+            'listTaggedRPMS', self.tag, event=event_id, inherit=True, latest=True, arch=self.arches)
+        packages = dict((b['package_name'], set()) for b in builds)
+        package_names = dict((b['id'], b['package_name']) for b in builds)
+        for rpm in rpms:
+            packages[package_names[rpm['build_id']]].add(rpm['name'])
+        logger.debug("Listed {n} {arch} rpms tagged in {tag}".format(n=len(rpms), arch=self.arch, tag=self.tag))
+        return {
+            'tag': self.tag,
+            'arch': self.arch,
+            'inheritance': inheritance,
+            'packages': dict((p, sorted(names)) for p, names in packages.items()),
+        }
+
+    def update(self, listing, event_id):
+        """Look up again the packages tagged or untagged since a
+        listing was current
+
+        :param dict listing: The listing to update
+        :param int event_id: Bring it up to date as of this brew event
+        """
+        pool = koji_client.get_pool()
+        histories = pool.multicall([
+            ('queryHistory', [], {'tables': ['tag_listing'], 'tag': tag,
+                                  'afterEvent': listing['event_id'], 'beforeEvent': event_id + 1})
+            for tag in listing['inheritance']
+        ])
+        packages = sorted(set(c['name'] for history in histories for c in history['tag_listing']))
+        if not packages:
+            return
+
+        latest = pool.multicall([('getLatestBuilds', [self.tag], {'event': event_id, 'package': p})
+                                 for p in packages])
+        builds = dict((p, b[0]) for p, b in zip(packages, latest) if b)
+        build_rpms = pool.multicall([('listRPMs', [], {'buildID': builds[p]['id'], 'arches': self.arches})
+                                     for p in sorted(builds)])
+        for package in packages:
+            listing['packages'].pop(package, None)
+        for package, rpms in zip(sorted(builds), build_rpms):
+            listing['packages'][package] = sorted(set(rpm['name'] for rpm in rpms))
+        logger.debug("Looked up {n} packages changed in {tag} since event {event}".format(
+            n=len(packages), tag=self.tag, event=listing['event_id']))
+
+    def read(self):
+        """:return: The listing kept on disk, None if there is none or
+        it is damaged"""
+        if self.path is None or not os.path.isfile(self.filename):
+            return None
+        try:
+            with open(self.filename, 'r') as f:
+                listing = json.load(f)
+        except (IOError, ValueError) as e:
+            logger.warning("Ignoring unreadable rpm listing {}: {}".format(self.filename, e))
+            return None
+        if not all(k in listing for k in ('event_id', 'inheritance', 'packages')):
+            logger.warning("Ignoring incomplete rpm listing {}".format(self.filename))
+            return None
+        return listing
+
+    def write(self):
+        """Keep the listing on disk, if there is a `path`"""
+        if self.path is None:
+            return
+        # Write next to the final name and swap it in, so readers
+        # never see a partial listing
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(self.listing, f)
+        os.rename(tmp_path, self.filename)
 
 
 class BrewTaggedImageBuilds(object):
@@ -365,16 +1202,13 @@ class BrewTaggedImageBuilds(object):
 
         :raises: Exception if there is an error looking up builds
         """
-        rc, stdout, stderr = get_tagged_image_builds(self.tag)
-
         print("Refreshing for tag: {tag}".format(tag=self.tag))
 
-        if rc != 0:
-            raise exceptions.BrewBuildException("Failed to get brew builds for tag: {tag} - {err}".format(tag=self.tag, err=stderr))
-        else:
-            builds = set(stdout.splitlines())
-            for b in builds:
-                self.builds.add(b.split()[0])
+        try:
+            snapshot = get_tag_snapshot(self.tag, type='image')
+        except koji.GenericError as e:
+            raise exceptions.BrewBuildException("Failed to get brew builds for tag: {tag} - {err}".format(tag=self.tag, err=e))
+        self.builds.update(b['nvr'] for b in snapshot.latest_builds())
 
         return True
 
@@ -396,26 +1230,136 @@ class BrewTaggedRPMBuilds(object):
 
         :raises: Exception if there is an error looking up builds
         """
-        rc, stdout, stderr = get_tagged_rpm_builds(self.tag)
-
         print("Refreshing for tag: {tag}".format(tag=self.tag))
 
-        if rc != 0:
-            raise exceptions.BrewBuildException("Failed to get brew builds for tag: {tag} - {err}".format(tag=self.tag, err=stderr))
-        else:
-            builds = set(stdout.splitlines())
-            for b in builds:
-                # The results come back with the build arch (.src)
-                # appended. Remove that if it is in the string.
-                try:
-                    self.builds.add(b[:b.index('.src')])
-                except ValueError:
-                    # Raised if the given substring is not found
-                    self.builds.add(b)
+        try:
+            snapshot = get_tag_snapshot(self.tag, type='rpm')
+        except koji.GenericError as e:
+            raise exceptions.BrewBuildException("Failed to get brew builds for tag: {tag} - {err}".format(tag=self.tag, err=e))
+        self.builds.update(b['nvr'] for b in snapshot.latest_builds())
 
         return True
 
 
+class BuildStore(object):
+    """
+    Persistent record of the Errata Tool details of builds (see
+    get_brew_build()), by NVR.
+
+    What a build is, its files and type, never changes, so that is
+    kept for good. Which advisories the build is attached to does
+    change. That is trusted for constants.errata_build_attachment_ttl
+    seconds after the details were fetched. After that it is worked out
+    from the builds attached to the open advisories, if the store was
+    given those (see use_attached_index()) and they cover every open
+    advisory the build was attached to. Otherwise the details are
+    fetched again.
+
+    Attachments to open advisories outside the index made after the
+    details were fetched are only seen once they are fetched again.
+
+    The store is a JSON file:
+
+        {
+            "builds": {
+                "coreutils-8.22-21.el7": {
+                    "checked_at": 1522698000.0,
+                    "body": {... as from /api/v1/build/{id_or_nvr} ...}
+                },
+                ...
+            }
+        }
+    """
+    def __init__(self, path=None, ttl=constants.errata_build_attachment_ttl):
+        """
+        :param str path: Where the store is kept. If None the store
+        only lives in memory.
+        :param float ttl: Seconds the attachments of a build are
+        trusted after they were fetched
+        """
+        self.path = path
+        self.ttl = ttl
+        self.entries = {}
+        self.dirty = False
+        self.lock = Lock()
+        self.open_advisories = None
+        self.attached_index = None
+
+        if path is not None and os.path.isfile(path):
+            self.load()
+
+    def load(self):
+        """Read the store from disk. A damaged store is discarded."""
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)['builds']
+        except (IOError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable build store {}: {}".format(self.path, e))
+            self.entries = {}
+
+    def save(self):
+        """Write the store to disk, if anything changed"""
+        if self.path is None or not self.dirty:
+            return
+
+        with self.lock:
+            # Write the new store next to the old one and swap it in,
+            # an interrupted run can not leave a truncated store behind
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'builds': self.entries}, f)
+            os.rename(tmp_path, self.path)
+            self.dirty = False
+
+    def use_attached_index(self, open_advisories, attached_index):
+        """Work out where builds are attached from these, once their
+        recorded attachments are too old to be trusted
+
+        :param list[Erratum] open_advisories: The open advisories
+        :param dict attached_index: The NVRs of the builds attached to
+        `open_advisories` mapped to the IDs of the advisories they are
+        attached to, see errata.get_attached_builds_index()
+        """
+        self.open_advisories = dict((a.advisory_id, a) for a in open_advisories)
+        self.attached_index = attached_index
+
+    def lookup(self, nvr):
+        """
+        :param str nvr: The NVR of a build
+        :return: The details of the build, as the Errata Tool would
+        give them now, or None if they have to be fetched
+        """
+        with self.lock:
+            entry = self.entries.get(nvr)
+        if entry is None:
+            return None
+
+        body = dict(entry['body'])
+        if time.time() - entry['checked_at'] < self.ttl:
+            return body
+        if self.attached_index is None:
+            return None
+
+        active = constants.errata_active_advisory_labels
+        if any(e['id'] not in self.open_advisories for e in body['all_errata'] if e['status'] in active):
+            # Attached to an advisory which has been closed since, or
+            # is not covered by the index
+            return None
+        # Attachments to closed advisories are final, the index has
+        # the rest
+        body['all_errata'] = [e for e in body['all_errata'] if e['status'] not in active] + [
+            {'id': a.advisory_id, 'name': a.advisory_name, 'status': a.status}
+            for a in (self.open_advisories[i] for i in sorted(self.attached_index.get(nvr, [])))
+        ]
+        return body
+
+    def record(self, nvr, body):
+        """Remember the details of a build, as just fetched"""
+        with self.lock:
+            self.entries[nvr] = {'checked_at': time.time(), 'body': body}
+            self.dirty = True
+
+
 class Build(object):
     """An existing brew build
 
@@ -536,12 +1480,9 @@ don't have to do extra manipulation later back in the view"""
                     break
 
     def add_buildinfo(self, verbose=False):
-        """Add buildinfo from upstream brew"""
-        date_format = '%a, %d %b %Y %H:%M:%S %Z'
-        if verbose:
-            click.secho('.', nl=False)
-        self.buildinfo = get_brew_buildinfo(self)
-        self.finished = datetime.datetime.strptime(self.buildinfo['Finished'], date_format)
+        """Add buildinfo from upstream brew. For many builds use
+        add_buildinfos(), which looks them up together."""
+        add_buildinfos([self], verbose)
 
     def to_json(self):
         """Method for adding this build to advisory via the Errata Tool
@@ -5,10 +5,12 @@ Test the brew related functions/classes
 """
 
 import mock
-from contextlib import nested
 
+import gzip
 import logging
+import shutil
 import StringIO
+import tempfile
 
 import platform
 (major, minor, patch) = platform.python_version_tuple()
@@ -23,6 +25,16 @@ import brew
 import test_structures
 
 
+def tagged_builds(nvrs):
+    """Builds, as the koji listTagged call gives them"""
+    builds = []
+    for nvr in nvrs:
+        name, version, release = nvr.rsplit('-', 2)
+        builds.append({'id': len(builds) + 1, 'nvr': nvr, 'package_name': name,
+                       'name': name, 'version': version, 'release': release})
+    return builds
+
+
 class TestBrew(unittest.TestCase):
 
     def setUp(self):
@@ -33,6 +45,11 @@ class TestBrew(unittest.TestCase):
         logging.basicConfig(level=logging.DEBUG, stream=self.stream)
         self.logger = logging.getLogger()
 
+        # Every test starts without tag snapshots
+        patcher = mock.patch.object(brew, '_tag_snapshots', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
     def tearDown(self):
         """
         Reset logging for each test.
@@ -167,10 +184,8 @@ class TestBrew(unittest.TestCase):
 
     def test_get_brew_build_success(self):
         """Ensure a 'proper' brew build returns a Build object"""
-        with nested(
-                mock.patch('brew.requests.get'),
-                # Mock the HTTPKerberosAuth object in the module
-                mock.patch('brew.HTTPKerberosAuth')) as (get, kerb):
+        with mock.patch.object(brew.errata_client, 'get_client') as client:
+            get = client.return_value.get
             nvr = 'coreutils-8.22-21.el7'
             pv = 'rhaos-test-7'
             response = mock.MagicMock(status_code=200)
@@ -185,49 +200,46 @@ class TestBrew(unittest.TestCase):
             self.assertEqual(nvr, b.nvr)
 
             get.assert_called_once_with(
-                constants.errata_get_build_url.format(id=nvr),
-                auth=kerb()
+                constants.errata_get_build_url.format(id=nvr)
             )
 
-    def test_get_brew_build_success_session(self):
-        """Ensure a provided requests session is used when getting brew builds"""
-        with mock.patch('brew.HTTPKerberosAuth') as kerb:
+    def test_get_brew_build_success_client(self):
+        """Ensure a provided errata client is used when getting brew builds"""
+        with mock.patch.object(brew.errata_client, 'get_client') as shared_client:
             nvr = 'coreutils-8.22-21.el7'
             pv = 'rhaos-test-7'
-            # This is the return result from the session.get() call
+            # This is the return result from the client.get() call
             response = mock.MagicMock(status_code=200)
             # We'll call the json method on the result to retrieve the
             # response body from ET
             response.json.return_value = test_structures.rpm_build_attached_json
-            # We create a session mock HERE to pass in when we call
+            # We create a client mock HERE to pass in when we call
             # the get_brew_build function
-            session = mock.MagicMock()
+            client = mock.MagicMock()
             # In get_brew_build the get is method is called on the
-            # session mock. We want to return our response as if we
+            # client mock. We want to return our response as if we
             # actually queried the API
-            session.get.return_value = response
+            client.get.return_value = response
 
-            # Ensure we pass in the session mock we created here
-            b = brew.get_brew_build(nvr, product_version=pv, session=session)
+            # Ensure we pass in the client mock we created here
+            b = brew.get_brew_build(nvr, product_version=pv, client=client)
 
             # Basic object validation to ensure that the example build
             # object we return from our get() mock matches the
             # returned Build object
             self.assertEqual(nvr, b.nvr)
 
-            # Our session object+get method were used, not the
-            # requests.get (default) method
-            session.get.assert_called_once_with(
-                constants.errata_get_build_url.format(id=nvr),
-                auth=kerb()
+            # Our client object+get method were used, not the
+            # shared (default) client
+            client.get.assert_called_once_with(
+                constants.errata_get_build_url.format(id=nvr)
             )
+            self.assertFalse(shared_client.called)
 
     def test_get_brew_build_failure(self):
         """Ensure we notice invalid get-build responses from the API"""
-        with nested(
-                mock.patch('brew.requests.get'),
-                # Mock the HTTPKerberosAuth object in the module
-                mock.patch('brew.HTTPKerberosAuth')) as (get, kerb):
+        with mock.patch.object(brew.errata_client, 'get_client') as client:
+            get = client.return_value.get
             nvr = 'coreutils-8.22-21.el7'
             pv = 'rhaos-test-7'
             # Engage the failure logic branch, will raise
@@ -241,131 +253,471 @@ class TestBrew(unittest.TestCase):
                 brew.get_brew_build(nvr, product_version=pv)
 
             get.assert_called_once_with(
-                constants.errata_get_build_url.format(id=nvr),
-                auth=kerb()
+                constants.errata_get_build_url.format(id=nvr)
             )
 
+    def test_get_brew_builds(self):
+        """Ensure many builds are looked up with one shared client, in order"""
+        nvrs = ['coreutils-8.22-{}.el7'.format(i) for i in range(20)]
+        with mock.patch.object(brew.errata_client, 'get_client') as client:
+            response = mock.MagicMock(status_code=200)
+            response.json.return_value = test_structures.rpm_build_attached_json
+            # Mock call counts are not thread safe, record the calls in
+            # lists instead
+            urls = []
+            client.return_value.get.side_effect = lambda url: urls.append(url) or response
+            progress = []
+
+            builds = brew.get_brew_builds(nvrs, 'rhaos-test-7', n_threads=4, progress_f=progress.append)
+
+            self.assertEqual(nvrs, [b.nvr for b in builds])
+            self.assertEqual(len(nvrs), len(urls))
+            self.assertEqual(len(nvrs), len(progress))
+            client.assert_called_once_with()
+
+        self.assertEqual([], brew.get_brew_builds([]))
+
+    def test_get_brew_builds_failure(self):
+        """Ensure a build that is not found fails the whole lookup"""
+        with mock.patch.object(brew.errata_client, 'get_client') as client:
+            found = mock.MagicMock(status_code=200)
+            found.json.return_value = test_structures.rpm_build_attached_json
+            client.return_value.get.side_effect = [found, mock.MagicMock(status_code=404), found]
+
+            with self.assertRaises(exceptions.BrewBuildException):
+                brew.get_brew_builds(['a-1-1', 'b-1-1', 'c-1-1'], n_threads=1)
+
+    def test_build_store_fresh(self):
+        """A build recorded lately is answered from the store"""
+        store = brew.BuildStore()
+        store.record('coreutils-8.22-21.el7', test_structures.rpm_build_attached_json)
+        client = mock.MagicMock()
+
+        b = brew.get_brew_build('coreutils-8.22-21.el7', 'rhaos-test-7', client=client, store=store)
+
+        self.assertTrue(b.attached_to_open_erratum)
+        self.assertFalse(client.get.called)
+
+    def test_build_store_index(self):
+        """Where an older build is attached comes from the index"""
+        store = brew.BuildStore(ttl=0)
+        store.record('coreutils-8.22-21.el7', test_structures.rpm_build_attached_json)
+        advisories = [mock.MagicMock(advisory_id=30540, advisory_name='RHBA-2017:30540', status='REL_PREP'),
+                      mock.MagicMock(advisory_id=30541, advisory_name='RHBA-2017:30541', status='QE')]
+
+        # Moved from one open advisory to the other
+        store.use_attached_index(advisories, {'coreutils-8.22-21.el7': set([30541])})
+        body = store.lookup('coreutils-8.22-21.el7')
+        self.assertEqual([{'id': 30541, 'name': 'RHBA-2017:30541', 'status': 'QE'}], body['all_errata'])
+
+        # Removed from all of them
+        store.use_attached_index(advisories, {})
+        self.assertEqual([], store.lookup('coreutils-8.22-21.el7')['all_errata'])
+
+    def test_build_store_stale(self):
+        """An older build is fetched again when the index can not tell
+        where it is attached"""
+        store = brew.BuildStore(ttl=0)
+        store.record('coreutils-8.22-21.el7', test_structures.rpm_build_attached_json)
+        self.assertIsNone(store.lookup('coreutils-8.22-21.el7'))
+
+        # The advisory it was attached to is not open any more
+        store.use_attached_index([], {})
+        self.assertIsNone(store.lookup('coreutils-8.22-21.el7'))
+
+        client = mock.MagicMock()
+        response = mock.MagicMock(status_code=200)
+        response.json.return_value = test_structures.rpm_build_unattached_json
+        client.get.return_value = response
+        b = brew.get_brew_build('coreutils-8.22-21.el7', client=client, store=store)
+
+        self.assertFalse(b.attached_to_open_erratum)
+        client.get.assert_called_once_with(
+            constants.errata_get_build_url.format(id='coreutils-8.22-21.el7'), max_age=0)
+        self.assertEqual([], store.entries['coreutils-8.22-21.el7']['body']['all_errata'])
+
+    def test_build_store_persisted(self):
+        """The store is kept on disk, a damaged one is discarded"""
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        store_path = '{}/brew-builds.json'.format(path)
+
+        store = brew.BuildStore(store_path)
+        store.record('coreutils-8.22-21.el7', test_structures.rpm_build_attached_json)
+        store.save()
+        self.assertEqual(test_structures.rpm_build_attached_json,
+                         brew.BuildStore(store_path).lookup('coreutils-8.22-21.el7'))
+
+        with open(store_path, 'w') as f:
+            f.write('{"builds": {"coreu')
+        self.assertIsNone(brew.BuildStore(store_path).lookup('coreutils-8.22-21.el7'))
+
     def test_get_tagged_image_builds_success(self):
-        """Ensure the brew list-tagged command is correct for images"""
+        """Ensure brew is asked for the latest image builds in the tag"""
         # Any value will work for this. Let's use a real one though to
         # maintain our sanity. This matches with the example data in
         # test_structures
         tag = 'rhaos-3.9-rhel-7-candidate'
-        # Big multi-line string with brew image build ouput.
-        image_builds_mock_return = test_structures.brew_list_tagged_3_9_image_builds
-        image_builds_mock_length = len(image_builds_mock_return.splitlines())
-
-        with mock.patch('exectools.cmd_gather') as gexec:
-            # gather_exec => (rc, stdout, stderr)
-            gexec.return_value = tuple([0, image_builds_mock_return, ""])
+        # The builds brew lists, as in the brew CLI example output
+        image_builds = tagged_builds(line.split()[0] for line in
+                                     test_structures.brew_list_tagged_3_9_image_builds.splitlines())
 
+        pool = mock.MagicMock()
+        pool.call.return_value = image_builds
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool):
             # Now we can test the BrewTaggedImageBuilds
-            # collecter/parser class as well as the
-            # get_tagged_image_builds function
+            # collecter class as well as the tag snapshot it is
+            # filled from
             tagged_image_builds = brew.BrewTaggedImageBuilds(tag)
-            # This invokes get_tagged_image_builds, which in turn
-            # invokes our mocked gather_exec
             images_refreshed = tagged_image_builds.refresh()
 
-            # Refreshing returns True after parsing the results from
-            # the brew CLI command, errors will raise an exception
+            # Refreshing returns True after collecting the builds,
+            # errors will raise an exception
             self.assertTrue(images_refreshed)
 
-            # Our example data has 59 valid parseable images listed
-            self.assertEqual(image_builds_mock_length, len(tagged_image_builds.builds))
+            # Our example data has 59 valid images listed
+            self.assertEqual(len(image_builds), len(tagged_image_builds.builds))
+            self.assertIn('registry-console-docker-v3.9.15-1', tagged_image_builds.builds)
 
-            gexec.assert_called_once_with(
-                # shlex must split our command string into a list
-                ['brew', 'list-tagged', 'rhaos-3.9-rhel-7-candidate', '--latest', '--type=image', '--quiet'],
-                logger=self.logger
-            )
+            # Refreshing again answers from the snapshot
+            brew.BrewTaggedImageBuilds(tag).refresh()
+            pool.call.assert_called_once_with('listTagged', tag, inherit=False, latest=True, type='image')
 
     def test_get_tagged_image_builds_failed(self):
-        """Ensure the brew list-tagged explodes if the brew subprocess fails"""
-        # Any value will work for this. Let's use a real one though to
-        # maintain our sanity. This matches with the example data in
-        # test_structures
+        """Ensure refreshing image builds explodes if brew fails"""
         tag = 'rhaos-3.9-rhel-7-candidate'
-        # Big multi-line string with brew image build ouput.
-        image_builds_mock_return = test_structures.brew_list_tagged_3_9_image_builds
-
-        with mock.patch('exectools.cmd_gather') as gexec:
-            # gather_exec => (rc, stdout, stderr)
-            #
-            # The '1' in position 0 is the brew subprocess return
-            # code, this invokes the error raising branch of code
-            gexec.return_value = tuple([1, image_builds_mock_return, ""])
+
+        pool = mock.MagicMock()
+        pool.call.side_effect = brew.koji.GenericError("No such tagInfo")
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool):
             tagged_image_builds = brew.BrewTaggedImageBuilds(tag)
 
             with self.assertRaises(exceptions.BrewBuildException):
                 tagged_image_builds.refresh()
 
-            gexec.assert_called_once_with(
-                # shlex must split our command string into a list
-                ['brew', 'list-tagged', 'rhaos-3.9-rhel-7-candidate', '--latest', '--type=image', '--quiet'],
-                logger=self.logger
-            )
-
     def test_get_tagged_rpm_builds_success(self):
-        """Ensure the brew list-tagged command is correct for rpms"""
+        """Ensure brew is asked for the latest rpm builds in the tag"""
         # Any value will work for this. Let's use a real one though to
         # maintain our sanity. This matches with the example data in
         # test_structures
         tag = 'rhaos-3.9-rhel-7-candidate'
-        # Big multi-line string with brew rpm build ouput.
-        rpm_builds_mock_return = test_structures.brew_list_tagged_3_9_rpm_builds
-        rpm_builds_mock_length = len(rpm_builds_mock_return.splitlines())
-
-        with mock.patch('exectools.cmd_gather') as gexec:
-            # gather_exec => (rc, stdout, stderr)
-            gexec.return_value = tuple([0, rpm_builds_mock_return, ""])
-
-            # Now we can test the BrewTaggedRPMBuilds
-            # collecter/parser class as well as the
-            # get_tagged_rpm_builds function
+        # The builds of the src rpms brew lists, as in the brew CLI
+        # example output
+        nvrs = [line.replace('.src', '')
+                for line in test_structures.brew_list_tagged_3_9_rpm_builds.splitlines()]
+
+        pool = mock.MagicMock()
+        pool.call.return_value = tagged_builds(nvrs)
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool):
             tagged_rpm_builds = brew.BrewTaggedRPMBuilds(tag)
-            # This invokes get_tagged_rpm_builds, which in turn
-            # invokes our mocked gather_exec
             rpms_refreshed = tagged_rpm_builds.refresh()
 
-            # Refreshing returns True after parsing the results from
-            # the brew CLI command, errors will raise an exception
             self.assertTrue(rpms_refreshed)
 
-            # Our example data has 59 valid parseable rpms listed
-            self.assertEqual(rpm_builds_mock_length, len(tagged_rpm_builds.builds))
+            self.assertEqual(set(nvrs), tagged_rpm_builds.builds)
+            self.assertIn('ansible-asb-modules-0.1.1-1.el7', tagged_rpm_builds.builds)
 
-            gexec.assert_called_once_with(
-                # shlex must split our command string into a list
-                ['brew', 'list-tagged', 'rhaos-3.9-rhel-7-candidate', '--latest', '--rpm', '--quiet', '--arch', 'src'],
-                logger=self.logger
-            )
+            pool.call.assert_called_once_with('listTagged', tag, inherit=False, latest=True, type='rpm')
 
     def test_get_tagged_rpm_builds_failed(self):
-        """Ensure the brew list-tagged explodes if the brew subprocess fails"""
-        # Any value will work for this. Let's use a real one though to
-        # maintain our sanity. This matches with the example data in
-        # test_structures
+        """Ensure refreshing rpm builds explodes if brew fails"""
         tag = 'rhaos-3.9-rhel-7-candidate'
-        # Big multi-line string with brew rpm build ouput.
-        rpm_builds_mock_return = test_structures.brew_list_tagged_3_9_rpm_builds
-
-        with mock.patch('exectools.cmd_gather') as gexec:
-            # gather_exec => (rc, stdout, stderr)
-            #
-            # The '1' in position 0 is the brew subprocess return
-            # code, this invokes the error raising branch of code
-            gexec.return_value = tuple([1, rpm_builds_mock_return, ""])
+
+        pool = mock.MagicMock()
+        pool.call.side_effect = brew.koji.GenericError("No such tagInfo")
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool):
             tagged_rpm_builds = brew.BrewTaggedRPMBuilds(tag)
 
             with self.assertRaises(exceptions.BrewBuildException):
                 tagged_rpm_builds.refresh()
 
-            gexec.assert_called_once_with(
-                # shlex must split our command string into a list
-                ['brew', 'list-tagged', 'rhaos-3.9-rhel-7-candidate', '--latest', '--rpm', '--quiet', '--arch', 'src'],
-                logger=self.logger
-            )
+    def test_get_brew_buildinfo(self):
+        """Buildinfo comes from one multicall, with the tags added"""
+        build = brew.Build(nvr='coreutils-8.22-21.el7',
+                           body=test_structures.rpm_build_attached_json,
+                           product_version='rhaos-test-7')
+        pool = mock.MagicMock()
+        pool.multicall.return_value = [
+            {'nvr': 'coreutils-8.22-21.el7', 'completion_ts': 1522698000.0, 'extra': {'a': 'b'}},
+            [{'name': 'tag-candidate'}, {'name': 'tag'}],
+        ]
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool):
+            build.add_buildinfo()
+
+        self.assertEqual(['tag-candidate', 'tag'], build.buildinfo['tags'])
+        self.assertEqual({'a': 'b'}, build.buildinfo['extra'])
+        self.assertEqual(2018, build.finished.year)
+        self.assertEqual(1, pool.multicall.call_count)
+
+    def test_get_brew_buildinfos(self):
+        """Many builds are looked up in one go, all missing ones reported"""
+        pool = mock.MagicMock()
+        pool.multicall.return_value = [
+            {'nvr': 'a-1-1'}, [{'name': 'tag'}],
+            {'nvr': 'b-1-1'}, [],
+        ]
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool):
+            buildinfos = brew.get_brew_buildinfos(['a-1-1', 'b-1-1'])
+
+        self.assertEqual([['tag'], []], [b['tags'] for b in buildinfos])
+        pool.multicall.assert_called_once_with([
+            ('getBuild', ['a-1-1'], {}), ('listTags', [], {'build': 'a-1-1'}),
+            ('getBuild', ['b-1-1'], {}), ('listTags', [], {'build': 'b-1-1'}),
+        ], strict=False)
+
+        pool.multicall.return_value = [
+            None, brew.koji.GenericError('No such build'),
+            {'nvr': 'b-1-1'}, [],
+            None, brew.koji.GenericError('No such build'),
+        ]
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool):
+            with self.assertRaises(exceptions.BrewBuildException) as e:
+                brew.get_brew_buildinfos(['a-1-1', 'b-1-1', 'c-1-1'])
+        self.assertIn('a-1-1', str(e.exception))
+        self.assertIn('c-1-1', str(e.exception))
+
+    def test_tag_snapshot(self):
+        """A snapshot answers latest-build questions from one listing"""
+        pool = mock.MagicMock()
+        pool.call.return_value = tagged_builds(['a-1-2', 'b-1-1'])
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool):
+            snapshot = brew.get_tag_snapshot('tag-candidate', type='image', inherit=True)
+            self.assertIs(snapshot, brew.get_tag_snapshot('tag-candidate', type='image', inherit=True))
+
+            self.assertEqual('a-1-2', snapshot.latest_build('a')['nvr'])
+            self.assertIsNone(snapshot.latest_build('c'))
+            self.assertEqual(['b-1-1', 'a-1-2'], [b['nvr'] for b in snapshot.latest_builds()])
+            pool.call.assert_called_once_with('listTagged', 'tag-candidate', inherit=True, latest=True, type='image')
+
+            # A package can be looked up again, e.g., after a build
+            pool.call.return_value = tagged_builds(['a-1-3'])
+            self.assertEqual('a-1-3', snapshot.refresh_package('a')['nvr'])
+            self.assertEqual('a-1-3', snapshot.latest_build('a')['nvr'])
+            pool.call.assert_called_with('getLatestBuilds', 'tag-candidate', package='a', type='image')
+
+    def test_tag_history_incremental(self):
+        """After the first full listing, only the changes are fetched"""
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        pool = mock.MagicMock()
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool):
+            history = brew.TagHistory(path)
+
+            builds = tagged_builds(['a-1-1', 'b-1-1'])
+            for b in builds:
+                b['create_event'] = 100 + b['id']
+            pool.call.side_effect = [{'id': 200}, builds]
+            self.assertEqual(['a-1-1', 'b-1-1'],
+                             sorted(b['nvr'] for b in history.listing('tag-candidate', 'rpm').values()))
+
+            # b-1-1 untagged, a-1-2 tagged, then c-1-1 tagged and
+            # untagged again. Only a-1-2 is an rpm build.
+            changes = [
+                {'build_id': 2, 'name': 'b', 'version': '1', 'release': '1', 'create_event': 102, 'revoke_event': 201},
+                {'build_id': 3, 'name': 'a', 'version': '1', 'release': '2', 'create_event': 202, 'revoke_event': None},
+                {'build_id': 4, 'name': 'c', 'version': '1', 'release': '1', 'create_event': 203, 'revoke_event': 204},
+            ]
+            pool.call.side_effect = [{'id': 210}, {'tag_listing': changes}]
+            pool.multicall.return_value = [{'rpm': None}]
+            listing = brew.TagHistory(path).listing('tag-candidate', 'rpm')
+
+        self.assertEqual(['a-1-1', 'a-1-2'], sorted(b['nvr'] for b in listing.values()))
+        pool.call.assert_called_with('queryHistory', tables=['tag_listing'], tag='tag-candidate',
+                                     afterEvent=200, beforeEvent=211)
+        pool.multicall.assert_called_once_with([('getBuildType', [3], {})])
+
+    def test_tag_history_damaged(self):
+        """A damaged listing is replaced by a full one"""
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        with open('{}/tag-candidate.all.json'.format(path), 'w') as f:
+            f.write('{"tag": "tag-can')
+
+        pool = mock.MagicMock()
+        pool.call.side_effect = [{'id': 200}, []]
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool):
+            self.assertEqual({}, brew.TagHistory(path).listing('tag-candidate'))
+        pool.call.assert_called_with('listTagged', 'tag-candidate', event=200, type=None)
+
+    def test_tag_snapshot_history(self):
+        """Snapshots come from the tag history, latest tagged wins"""
+        history = mock.MagicMock()
+        builds = tagged_builds(['a-1-2', 'a-1-1'])
+        builds[0]['create_event'] = 10
+        builds[1]['create_event'] = 20
+        history.listing.return_value = dict((b['id'], b) for b in builds)
+
+        snapshot = brew.TagSnapshot('tag-candidate', type='rpm', history=history)
+        snapshot.load()
+        self.assertEqual('a-1-1', snapshot.latest_build('a')['nvr'])
+        history.listing.assert_called_once_with('tag-candidate', 'rpm')
+
+        # Inherited builds are not in the tag's history
+        self.assertIsNone(brew.TagSnapshot('tag-candidate', inherit=True, history=history).history)
+
+    def test_tagged_rpm_names(self):
+        """RPM names are listed in full once, then updated by package"""
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        inheritance = [{'name': 'rhel-7-build'}]
+        rpms = [{'name': 'bash', 'build_id': 1}, {'name': 'bash-doc', 'build_id': 1},
+                {'name': 'python-six', 'build_id': 2}]
+        pool = mock.MagicMock()
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool):
+            pool.call.side_effect = [{'id': 200}, inheritance, (rpms, tagged_builds(['bash-4-1', 'python-six-1-1']))]
+            names = brew.TaggedRPMNames('tag-container-build', 'x86_64', path)
+            names.load()
+            self.assertIn('bash-doc', names)
+            pool.call.assert_called_with('listTaggedRPMS', 'tag-container-build', event=200, inherit=True,
+                                         latest=True, arch=['noarch', 'x86_64'])
+
+            # bash updated in the parent tag, python-six untagged
+            pool.call.side_effect = [{'id': 210}, inheritance]
+            pool.multicall.side_effect = [
+                [{'tag_listing': []}, {'tag_listing': [{'name': 'bash'}, {'name': 'python-six'}]}],
+                [[{'id': 3}], []],
+                [[{'name': 'bash'}]],
+            ]
+            names = brew.TaggedRPMNames('tag-container-build', 'x86_64', path)
+            names.load()
+
+        self.assertEqual(set(['bash']), names.names)
+        self.assertEqual(210, names.listing['event_id'])
+        pool.multicall.assert_called_with([('listRPMs', [], {'buildID': 3, 'arches': ['noarch', 'x86_64']})])
+
+    def test_tagged_rpm_names_inheritance_changed(self):
+        """A tag inheriting from other tags than before is listed again"""
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        pool = mock.MagicMock()
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool):
+            pool.call.side_effect = [{'id': 200}, [], ([], [])]
+            brew.TaggedRPMNames('tag-container-build', 'x86_64', path).load()
+
+            pool.call.side_effect = [{'id': 210}, [{'name': 'rhel-7-build'}], ([], [])]
+            brew.TaggedRPMNames('tag-container-build', 'x86_64', path).load()
+
+        pool.call.assert_called_with('listTaggedRPMS', 'tag-container-build', event=210, inherit=True,
+                                     latest=True, arch=['noarch', 'x86_64'])
+        self.assertFalse(pool.multicall.called)
+
+    def test_get_tagged_rpm_names(self):
+        """The names are loaded once per run, failures raise ValueError"""
+        pool = mock.MagicMock()
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool), \
+                mock.patch.object(brew, '_tagged_rpm_names', {}):
+            pool.call.side_effect = [{'id': 200}, [], ([{'name': 'bash', 'build_id': 1}], tagged_builds(['bash-4-1']))]
+            self.assertEqual(set(['bash']), brew.get_tagged_rpm_names('rhaos-3.10-rhel-7'))
+            self.assertEqual(set(['bash']), brew.get_tagged_rpm_names('rhaos-3.10-rhel-7'))
+            self.assertEqual(3, pool.call.call_count)
+
+            pool.call.side_effect = brew.koji.GenericError('no such tag')
+            with self.assertRaises(ValueError):
+                brew.get_tagged_rpm_names('rhaos-3.10-rhel-7', 'ppc64le')
+
+    def test_task_monitor_poll(self):
+        """One multicall looks at every task, finished ones are woken"""
+        monitor = brew.TaskMonitor()
+        running, closed, failed, lost = [brew.WatchedTask(i) for i in range(1, 5)]
+        lost.errors = 9
+
+        pool = mock.MagicMock()
+        pool.multicall.side_effect = [
+            [{'state': 1}, {'state': 2, 'start_ts': 100.0, 'completion_ts': 700.0}, {'state': 5},
+             brew.koji.GenericError('hub is down')],
+            [brew.koji.BuildError('Build for a-1-1 already exists')],
+        ]
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool):
+            monitor.poll([running, closed, failed, lost])
+
+        self.assertEqual([False, True, True, True], [t.done.is_set() for t in [running, closed, failed, lost]])
+        self.assertEqual('OPEN', running.state)
+        self.assertIsNone(closed.failure)
+        self.assertEqual('BuildError: Build for a-1-1 already exists', failed.failure)
+        self.assertIn('hub is down', lost.watch_error)
+        self.assertEqual([600.0], monitor.durations)
+        pool.multicall.assert_called_with([('getTaskResult', [3], {})], strict=False)
+
+    def test_task_monitor_interval(self):
+        """Tasks are looked at more often close to their expected end"""
+        monitor = brew.TaskMonitor(min_interval=5, max_interval=60, expected_duration=1000)
+        task = brew.WatchedTask(1)
+        task.info = {'state': 1, 'start_ts': 1000}
+
+        self.assertEqual(60, monitor.interval(task, now=1000))
+        self.assertEqual(25, monitor.interval(task, now=1900))
+        self.assertEqual(5, monitor.interval(task, now=2000))
+        self.assertEqual(50, monitor.interval(task, now=2200))
+
+        # Brew's average for the package beats the default
+        task.expected_duration = 100
+        self.assertEqual(5, monitor.interval(task, now=1090))
+
+    def test_watch_task(self):
+        """watch_task returns as soon as the monitor sees the task finish"""
+        pool = mock.MagicMock()
+        pool.call.return_value = 30.0
+        pool.multicall.side_effect = [[{'state': 1}], [{'state': 2}]]
+        monitor = brew.TaskMonitor(min_interval=0.1, max_interval=0.1)
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool), \
+                mock.patch.object(brew, 'get_task_monitor', return_value=monitor):
+            log = []
+            error = brew.watch_task(log.append, '1234', mock.MagicMock(is_set=lambda: False), package='a')
+
+        self.assertIsNone(error)
+        self.assertIn('1234', brew.get_watch_task_info_copy())
+        pool.call.assert_called_once_with('getAverageBuildDuration', 'a')
+        self.assertFalse(pool.session.called)
+
+    def test_check_rpm_buildroot(self):
+        """Buildroot lookups are answered from the index of its repository"""
+        with mock.patch.object(brew.repodata, 'get_repo_index') as get_repo_index:
+            get_repo_index.return_value.whatprovides.return_value = ['bash']
+
+            self.assertEqual(['bash'], brew.check_rpm_buildroot('/usr/bin/sh', 'rhaos-3.10-rhel-7', 'ppc64le'))
+
+        get_repo_index.assert_called_once_with(
+            constants.BREW_BUILDROOT_REPO_URL.format(branch='rhaos-3.10-rhel-7', arch='ppc64le'))
+        get_repo_index.return_value.whatprovides.assert_called_once_with('/usr/bin/sh', 'ppc64le')
+
+    def test_download_task_logs_compressed(self):
+        """Task logs can be stored gzipped"""
+        path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, path)
+        pool = mock.MagicMock()
+        pool.multicall.return_value = [{'arch': 'noarch'}, ['build.log', 'result.rpm']]
+        pool.call.side_effect = ['first, ', 'second', '']
+        with mock.patch.object(brew.koji_client, 'get_pool', return_value=pool):
+            paths = brew.download_task_logs(1234, path, compress=True)
+
+        self.assertEqual(['{}/noarch-1234/build.log.gz'.format(path)], paths)
+        with gzip.open(paths[0]) as f:
+            self.assertEqual('first, second', f.read())
+
+    def test_log_collector(self):
+        """Logs are collected in the background, callers are told when"""
+        collector = brew.LogCollector(concurrency=2)
+        collected = []
+        with mock.patch.object(brew, 'download_task_logs',
+                               side_effect=lambda task_id, logs_dir, compress: ['{}.log.gz'.format(task_id)]):
+            collections = [collector.collect(task_id, 'logs', callback=collected.append) for task_id in range(5)]
+            collector.join()
+
+        self.assertTrue(all(c.done.is_set() for c in collections))
+        self.assertEqual(['3.log.gz'], collections[3].paths)
+        self.assertEqual(range(5), sorted(c.task_id for c in collected))
+        self.assertEqual([], collector.pending)
+        self.assertEqual(2, len(collector._threads))
+
+    def test_log_collector_failed(self):
+        """A failed collection says why"""
+        collector = brew.LogCollector()
+        with mock.patch.object(brew, 'download_task_logs', side_effect=IOError('no space left')):
+            collection = collector.collect('1234', 'logs')
+            self.assertTrue(collection.wait(10))
+
+        self.assertEqual([], collection.paths)
+        self.assertIsInstance(collection.error, IOError)
 
 
 if __name__ == '__main__':
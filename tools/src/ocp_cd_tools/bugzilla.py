@@ -4,12 +4,13 @@ with Red Hat Bugzilla
 """
 
 # stdlib
-from subprocess import call, check_output
+import subprocess
 import urllib
 import logutil
 
 # ours
 import constants
+import throttle
 
 # 3rd party
 import click
@@ -17,6 +18,29 @@ import click
 logger = logutil.getLogger(__name__)
 
 
+def call(args):
+    """subprocess.call(), admitted by the bugzilla admission controller
+(see throttle.py)"""
+    with throttle.get('bugzilla').admit(_endpoint(args)) as admission:
+        rc = subprocess.call(args)
+        if rc != 0:
+            admission.fail()
+        return rc
+
+
+def check_output(args):
+    """subprocess.check_output(), admitted by the bugzilla admission
+controller (see throttle.py)"""
+    with throttle.get('bugzilla').admit(_endpoint(args)):
+        return subprocess.check_output(args)
+
+
+def _endpoint(args):
+    """The bugzilla command run by `args`, e.g., 'query', as the
+endpoint for admission control (see throttle.py)"""
+    return args[len(constants.BUGZILLA_CLI)] if len(args) > len(constants.BUGZILLA_CLI) else None
+
+
 def search_for_bugs(target_release, verbose=False):
     """Search the provided target_release's for bugs in the MODIFIED state
 
@@ -45,7 +69,7 @@ def search_for_bugs(target_release, verbose=False):
         click.echo(query_url)
 
     new_bugs = check_output(
-        ['bugzilla', 'query', '--ids', '--from-url="{0}"'.format(query_url)]).splitlines()
+        constants.BUGZILLA_CLI + ['query', '--ids', '--from-url="{0}"'.format(query_url)]).splitlines()
 
     return [Bug(id=i) for i in new_bugs]
 
@@ -59,7 +83,7 @@ def search_for_bug_transitions(current_state, changed_from, changed_to):
         query_url.addVersion(v)
 
     changed_bugs = check_output(
-        ['bugzilla', 'query', '--ids', '--from-url="{0}"'.format(query_url)]).splitlines()
+        constants.BUGZILLA_CLI + ['query', '--ids', '--from-url="{0}"'.format(query_url)]).splitlines()
 
     return [Bug(id=i) for i in changed_bugs]
 
@@ -80,9 +104,9 @@ class Bug(object):
     def add_comment(self, comment, is_private):
         """Add a comment to a bug"""
         if is_private:
-            call(['bugzilla', 'modify', self.id, '--comment', comment, '--private'])
+            call(constants.BUGZILLA_CLI + ['modify', self.id, '--comment', comment, '--private'])
         else:
-            call(['bugzilla', 'modify', self.id, '--comment', comment])
+            call(constants.BUGZILLA_CLI + ['modify', self.id, '--comment', comment])
 
     def add_flags(self, flags=[]):  # pragma: no cover
         """Add flags to a bug"""
@@ -91,14 +115,14 @@ class Bug(object):
 
     def add_flag(self, flag):
         """Add the given flag to the bug"""
-        call(['bugzilla', 'modify', '--flag', '{0}+'.format(flag), self.id])
+        call(constants.BUGZILLA_CLI + ['modify', '--flag', '{0}+'.format(flag), self.id])
 
     def add_whiteboard_value(self, value):
-        call(['bugzilla', 'modify', self.id, '--whiteboard', value])
+        call(constants.BUGZILLA_CLI + ['modify', self.id, '--whiteboard', value])
 
     def has_whiteboard_value(self, value):
         """Check if the value is in the Whiteboard for the bug"""
-        return check_output(['bugzilla', 'query', '--id', self.id, '--whiteboard', value])
+        return check_output(constants.BUGZILLA_CLI + ['query', '--id', self.id, '--whiteboard', value])
 
 
 class SearchFilter(object):
@@ -1,18 +1,48 @@
 """
 This file contains constants that are used to manage OCP Image and RPM builds
+
+The Errata Tool, Brew hub and Bugzilla locations can be overridden
+with the ELLIOTT_ERRATA_URL, ELLIOTT_BREW_HUB and ELLIOTT_BUGZILLA_URL
+environment variables, e.g. to point elliott at the stand-in services
+in tools/bench/standin.py.
 """
 
+import os
+
 # config data pulled from here
 OCP_BUILD_DATA_RO = "https://github.com/openshift/ocp-build-data"
 # above is used so that anyone can clone
 OCP_BUILD_DATA_RW = "git@github.com:openshift/ocp-build-data.git"
 
-BREW_HUB = "https://brewhub.engineering.redhat.com/brewhub"
+BREW_HUB = os.environ.get("ELLIOTT_BREW_HUB", "https://brewhub.engineering.redhat.com/brewhub")
+# How many idle koji sessions to BREW_HUB to keep for reuse, and how
+# many calls to send in one multicall request, see koji_client.py
+brew_session_pool_size = 16
+brew_multicall_batch_size = 100
+# Brew tasks in flight are looked at every brew_task_poll_min_interval
+# to brew_task_poll_max_interval seconds, more often around when they
+# are expected to finish. Until any have finished, tasks without an
+# average build time in brew are expected to take
+# brew_task_expected_duration seconds.
+brew_task_poll_min_interval = 5
+brew_task_poll_max_interval = 60
+brew_task_expected_duration = 20 * 60
+# How many brew tasks to download the logs of at once, in the
+# background, see brew.LogCollector
+brew_log_collector_concurrency = 4
+# The yum repository of the brew buildroot ODCS composes from, see
+# brew.check_rpm_buildroot
+BREW_BUILDROOT_REPO_URL = "http://download-node-02.eng.bos.redhat.com/brewroot/repos/{branch}-ppc64le-container-build/latest/{arch}"
 BREW_IMAGE_HOST = "brew-pulp-docker01.web.prod.ext.phx2.redhat.com:8888"
 CGIT_URL = "http://pkgs.devel.redhat.com/cgit"
 
 # For Bugzilla searches
 BUGZILLA_SERVER = "bugzilla.redhat.com"
+# The python-bugzilla command line client, talking to the XML-RPC
+# endpoint in ELLIOTT_BUGZILLA_URL if it is set
+BUGZILLA_CLI = ["bugzilla"]
+if "ELLIOTT_BUGZILLA_URL" in os.environ:
+    BUGZILLA_CLI += ["--bugzilla", os.environ["ELLIOTT_BUGZILLA_URL"]]
 DEFAULT_VERSIONS = (
     "3.0.0",
     "3.1.0", "3.1.1",
@@ -30,7 +60,7 @@ DEFAULT_VERSIONS = (
 )
 VALID_BUG_STATES = ['NEW', 'ASSIGNED', 'POST', 'MODIFED', 'ON_QA', 'VERIFIED', 'RELEASE_PENDING', 'CLOSED']
 
-errata_url = "https://errata.devel.redhat.com"
+errata_url = os.environ.get("ELLIOTT_ERRATA_URL", "https://errata.devel.redhat.com")
 bugzilla_query_url = 'https://bugzilla.redhat.com/buglist.cgi?bug_status=MODIFIED&classification=Red%20Hat&f1=component&f2=component&f3=component&f4=cf_verified&keywords=UpcomingRelease&keywords_type=nowords&known_name=All%203.x%20MODIFIED%20Bugs&list_id=8111122&o1=notequals&o2=notequals&o3=notequals&o4=notequals&product=OpenShift%20Container%20Platform&query_format=advanced&short_desc=%5C%5Bfork%5C%5D&short_desc_type=notregexp&{0}&v1=RFE&v2=Documentation&v3=Security&v4=FailedQA&version=3.0.0&version=3.1.0&version=3.1.1&version=3.2.0&version=3.2.1&version=3.3.0&version=3.3.1&version=3.4.0&version=3.4.1&version=3.5.0&version=3.5.1&version=3.6.0&version=3.6.1&version=3.7.0&version=3.7.1&version=3.8.0&version=3.8.1&version=3.9.0&version=3.9.1&version=3.10.0&version=3.10.1&version=3.11.0&version=3.11.1&version=unspecified'
 
 # For new errata
@@ -84,6 +114,30 @@ errata_inactive_advisory_labels = [
     "SHIPPED_LIVE",
     "DROPPED_NO_SHIP"
 ]
+# How many connections the shared Errata Tool client (see
+# errata_client.py) keeps open. Should be at least the number of
+# threads making requests concurrently.
+errata_connection_pool_size = 32
+# The most requests elliott will have in flight to the Errata Tool at
+# once when working on many things (bugs, advisories) in bulk
+errata_max_concurrent_requests = 16
+# How many comments to request per page when reading the comments on
+# an advisory
+errata_comments_page_size = 100
+# How many bytes to read at a time from streamed Errata Tool responses
+errata_stream_chunk_size = 64 * 1024
+# How many builds to send in each add_builds request. Smaller chunks
+# are processed faster by the Errata Tool and fail less work at once.
+errata_add_builds_chunk_size = 20
+# Parts of the add_builds errors the Errata Tool gives for builds which
+# are on the advisory already. A retried request may have gone through
+# the first time, so on a retry these mean the builds are attached.
+errata_already_attached_errors = ['already been added', 'already attached']
+# Seconds between polls of an advisory by advisory:watch. The interval
+# grows by half each time the advisory is found unchanged, up to the
+# maximum, and drops back when it changes.
+errata_watch_interval = 30
+errata_watch_max_interval = 300
 errata_valid_impetus = [
     'standard',
     'cve',
@@ -109,6 +163,21 @@ errata_get_comment_url = errata_url + "/api/v1/comments/{id}"
 errata_get_comments_url = errata_url + "/api/v1/comments"
 errata_get_erratum_url = errata_url + "/api/v1/erratum/{id}"
 errata_post_erratum_url = errata_url + "/api/v1/erratum"
+# How many seconds a cached GET response (see errata_client.py) is
+# used without asking the Errata Tool if it changed, by url prefix.
+# The longest matching prefix applies. Other responses are always
+# revalidated, which costs a '304 Not Modified' when nothing changed.
+errata_cache_ttl = {
+    # Advisories (and the builds attached to them) change, but not
+    # from one minute to the next
+    errata_url + "/api/v1/erratum/": 60,
+    # Brew builds are not listed: what a build is never changes, but
+    # the advisories it is attached to (all_errata) do, so those
+    # responses are always revalidated
+}
+# How many seconds the advisories a build is attached to are trusted
+# in a build store (see brew.BuildStore), once fetched
+errata_build_attachment_ttl = 15 * 60
 ######################################################################
 # Scaffolding for creating a new advisory. See the online
 # documentation for a description of all allowed fields, including
@@ -153,3 +222,15 @@ https://mojo.redhat.com/docs/DOC-1178565#jive_content_id_How_do_I_get_my_Bugzill
 """
 
 DISTGIT_MAX_FILESIZE = 50000000
+
+######################################################################
+# Concurrency limits for requests to each service, see throttle.py.
+# The limit starts at `initial` and moves between `minimum` and
+# `maximum` with how the service copes. Services not listed here get
+# the 'default' settings.
+throttle = {
+    'default': {'initial': 4, 'minimum': 1, 'maximum': 8},
+    'errata': {'initial': 4, 'minimum': 1, 'maximum': errata_max_concurrent_requests},
+    'brew': {'initial': 4, 'minimum': 1, 'maximum': 16},
+    'bugzilla': {'initial': 2, 'minimum': 1, 'maximum': 8},
+}
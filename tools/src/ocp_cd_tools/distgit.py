@@ -17,7 +17,7 @@ import assertion
 import constants
 import exectools
 from pushd import Dir
-from brew import watch_task, check_rpm_buildroot
+from brew import watch_task, collect_task_logs, check_rpm_buildroot
 from model import Model, Missing
 
 OIT_COMMENT_PREFIX = '#oit##'
@@ -648,7 +648,7 @@ class ImageDistGitRepo(DistGitRepo):
             # subsequent builds.
             push_version, push_release = ('','')
             if not scratch:
-                _, push_version, push_release = self.metadata.get_latest_build_info()
+                _, push_version, push_release = self.metadata.get_latest_build_info(refresh=True)
             record["message"] = "Success"
             record["status"] = 0
             self.build_status = True
@@ -747,7 +747,8 @@ class ImageDistGitRepo(DistGitRepo):
         record["task_url"] = task_url
 
         # Now that we have the basics about the task, wait for it to complete
-        error = watch_task(self.logger.info, task_id, terminate_event)
+        error = watch_task(self.logger.info, task_id, terminate_event,
+                           package=self.metadata.get_component_name())
 
         # Looking for something like the following to conclude the image has already been built:
         # BuildError: Build for openshift-enterprise-base-v3.7.0-0.117.0.0 already exists, id 588961
@@ -755,12 +756,10 @@ class ImageDistGitRepo(DistGitRepo):
             self.logger.info("Image already built against this dist-git commit (or version-release tag): {}".format(target_image))
             error = None
 
-        # Gather brew-logs
+        # Gather brew-logs in the background, the build result need not
+        # wait for them
         logs_dir = "%s/%s" % (self.runtime.brew_logs_dir, self.metadata.name)
-        logs_rc, _, logs_err = exectools.cmd_gather(["brew", "download-logs", "-d", logs_dir, task_id])
-
-        if logs_rc != 0:
-            self.logger.info("Error downloading build logs from brew for task %s: %s" % (task_id, logs_err))
+        collect_task_logs(task_id, logs_dir, callback=self._task_logs_collected)
 
         if error is not None:
             # An error occurred. We don't have a viable build.
@@ -770,6 +769,13 @@ class ImageDistGitRepo(DistGitRepo):
         self.logger.info("Successfully built image: {} ; {}".format(target_image, task_url))
         return True
 
+    def _task_logs_collected(self, collection):
+        """Called by the brew log collector once the logs of a build task are downloaded, or failed to"""
+        if collection.error is not None:
+            self.logger.info("Error downloading build logs from brew for task %s: %s" % (collection.task_id, collection.error))
+        else:
+            self.logger.debug("Downloaded %d build logs from brew for task %s" % (len(collection.paths), collection.task_id))
+
     def push(self):
         with Dir(self.distgit_dir):
             self.logger.info("Pushing repository")
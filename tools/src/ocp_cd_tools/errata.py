@@ -11,13 +11,23 @@ Classes representing an ERRATUM (a single errata)
 import copy
 import datetime
 import json
+import os
+import tempfile
+import time
+import multiprocessing
+from multiprocessing import Lock
+from multiprocessing.dummy import Pool as ThreadPool
 
 import constants
 import brew
+import errata_client
 import exceptions
+import exectools
+import logutil
 
 import requests
-from requests_kerberos import HTTPKerberosAuth
+
+logger = logutil.getLogger(__name__)
 
 
 def get_erratum(id):
@@ -31,8 +41,7 @@ def get_erratum(id):
     :return FAILURE: :bool:False
     :raises: exceptions.ErrataToolUnauthenticatedException if the user is not authenticated to make the request
     """
-    res = requests.get(constants.errata_get_erratum_url.format(id=id),
-                       auth=HTTPKerberosAuth())
+    res = errata_client.get_client().get(constants.errata_get_erratum_url.format(id=id))
 
     if res.status_code == 200:
         return Erratum(body=res.json())
@@ -42,6 +51,293 @@ def get_erratum(id):
         return False
 
 
+def iter_errata(ids, n_threads=constants.errata_max_concurrent_requests):
+    """Fetch many advisories concurrently with get_erratum()
+
+    :param list ids: IDs of the advisories to fetch
+    :param int n_threads: The most advisories to fetch at once
+
+    :return: A generator of (advisory_id, Erratum) tuples, in the order
+    the advisories arrive. Erratum is False for advisories which could
+    not be fetched.
+    :raises: exceptions.ErrataToolUnauthenticatedException if the user is not authenticated to make the request
+    """
+    return _imap_unordered(lambda i: (i, get_erratum(i)), ids, n_threads)
+
+
+def change_errata_state(ids, state, n_threads=constants.errata_max_concurrent_requests):
+    """Change the state of many advisories concurrently
+
+    :param list ids: IDs of the advisories to change
+    :param str state: The state to change them to
+    :param int n_threads: The most advisories to change at once
+
+    :return: A generator of (advisory_id, previous_state, Erratum,
+    error) tuples, in the order the changes complete. Erratum is the
+    changed advisory. If the advisory could not be changed it is as it
+    was (False if it could not be fetched at all), and `error` says why.
+    :raises: exceptions.ErrataToolUnauthenticatedException if the user is not authenticated to make the request
+    """
+    def change(advisory_id):
+        erratum = get_erratum(advisory_id)
+        if erratum is False:
+            return advisory_id, None, False, "Could not locate advisory {id}".format(id=advisory_id)
+        previous = erratum.status
+        try:
+            erratum.change_state(state)
+        except exceptions.ErrataToolError as e:
+            return advisory_id, previous, erratum, str(e)
+        return advisory_id, previous, erratum, None
+
+    return _imap_unordered(change, ids, n_threads)
+
+
+def _imap_unordered(f, items, n_threads):
+    """Yield f(item) for every item, computed concurrently, in the
+order they complete. Ctrl-C abandons the items not yet started."""
+    items = list(items)
+    if len(items) == 0:
+        return
+
+    pool = ThreadPool(min(n_threads, len(items)))
+    results = pool.imap_unordered(f, items)
+    pool.close()
+    try:
+        for _ in items:
+            while True:
+                try:
+                    # `next` without a timeout disables signal handling
+                    result = results.next(60)
+                    break
+                except multiprocessing.TimeoutError:
+                    continue
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def watch_errata(ids, interval=constants.errata_watch_interval,
+                 max_interval=constants.errata_watch_max_interval,
+                 until=constants.errata_inactive_advisory_labels,
+                 n_threads=constants.errata_max_concurrent_requests):
+    """Poll advisories concurrently, yielding each change of state
+
+    Every advisory is polled on its own schedule: every `interval`
+    seconds at first, half as long again each time it is found
+    unchanged (up to `max_interval`), and back to `interval` once it
+    changes. The polls are conditional requests (If-None-Match/
+    If-Modified-Since, see errata_client), an unchanged advisory costs
+    an empty 304 response when the client's cache is enabled.
+
+    An advisory is watched until it reaches one of the `until` states.
+    Failed polls are logged and tried again at the next interval.
+
+    :param list ids: IDs of the advisories to watch
+    :param int interval: Seconds between polls of a changing advisory
+    :param int max_interval: The most seconds between polls
+    :param list until: Stop watching an advisory in any of these states
+    :param int n_threads: The most advisories to poll at once
+
+    :return: A generator of (advisory_id, previous_state, Erratum)
+    tuples, one for each advisory as it is first seen (previous_state
+    is None then), and one every time its state changes after that
+    :raises: exceptions.ErrataToolUnauthenticatedException if the user is not authenticated to make the request
+    :raises: exceptions.ErrataToolError if an advisory does not exist
+    """
+    ids = list(set(ids))
+    if len(ids) == 0:
+        return
+
+    # advisory id => next poll time, seconds between polls, last state
+    next_poll = dict((i, 0) for i in ids)
+    intervals = dict((i, interval) for i in ids)
+    states = {}
+
+    pool = ThreadPool(min(n_threads, len(ids)))
+    try:
+        while next_poll:
+            now = time.time()
+            due = [i for i, t in next_poll.items() if t <= now]
+            if not due:
+                # Short sleeps, so Ctrl-C is noticed
+                time.sleep(min(min(next_poll.values()) - now, 1))
+                continue
+
+            ret = pool.map_async(_poll_erratum, due)
+            # `wait` without a timeout disables signal handling
+            while not ret.ready():
+                ret.wait(60)
+
+            for advisory_id, advisory, error in ret.get():
+                if advisory is None:
+                    logger.warn("Could not poll advisory {id}, trying again later: {err}".format(
+                        id=advisory_id, err=error))
+                elif advisory.status != states.get(advisory_id):
+                    previous = states.get(advisory_id)
+                    states[advisory_id] = advisory.status
+                    intervals[advisory_id] = interval
+                    yield advisory_id, previous, advisory
+                else:
+                    intervals[advisory_id] = min(max_interval, intervals[advisory_id] * 1.5)
+
+                if states.get(advisory_id) in until:
+                    del next_poll[advisory_id]
+                else:
+                    next_poll[advisory_id] = time.time() + intervals[advisory_id]
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _poll_erratum(advisory_id):
+    """Fetch an advisory for watch_errata(), revalidating any cached copy
+
+    :return: A tuple of (advisory_id, Erratum, error). Erratum is None
+    if the advisory could not be fetched, in which case `error` says why.
+    :raises: exceptions.ErrataToolUnauthenticatedException if the user is not authenticated to make the request
+    :raises: exceptions.ErrataToolError if the advisory does not exist
+    """
+    try:
+        res = errata_client.get_client().get(constants.errata_get_erratum_url.format(id=advisory_id), max_age=0)
+    except requests.exceptions.RequestException as e:
+        return advisory_id, None, str(e)
+
+    if res.status_code == 200:
+        return advisory_id, Erratum(body=res.json(), keep_body=False), None
+    elif res.status_code == 401:
+        raise exceptions.ErrataToolUnauthenticatedException(res.text)
+    elif res.status_code == 404:
+        raise exceptions.ErrataToolError("Could not locate advisory {id}".format(id=advisory_id))
+    else:
+        return advisory_id, None, "{rc}: {msg}".format(rc=res.status_code, msg=res.text)
+
+
+def get_builds(advisory_id):
+    """5.2.2.6. GET /api/v1/erratum/{id}/builds
+
+    Fetch the Brew builds associated with an advisory.
+
+    https://errata.devel.redhat.com/developer-guide/api-http-api.html#api-get-apiv1erratumidbuilds
+
+    :param int advisory_id: The advisory to list the builds of
+    :return: A list of the NVRs of the builds attached to the advisory,
+    under any product version
+    :raises: exceptions.ErrataToolUnauthenticatedException if the user is not authenticated to make the request
+    :raises: exceptions.ErrataToolError if the builds could not be listed
+    """
+    res = errata_client.get_client().get(constants.errata_get_builds_url.format(id=advisory_id))
+
+    if res.status_code == 401:
+        raise exceptions.ErrataToolUnauthenticatedException(res.text)
+    elif res.status_code != 200:
+        raise exceptions.ErrataToolError("Could not list the builds of advisory {id}: {msg}".format(
+            id=advisory_id, msg=res.text))
+
+    # {"RHEL-7-OSE-3.9": {"name": ..., "builds": [{"<nvr>": {...}}, ...]}, ...}
+    nvrs = []
+    for product_version in res.json().values():
+        for build in product_version.get('builds', []):
+            nvrs.extend(build.keys())
+    return nvrs
+
+
+def get_open_advisories(filter_id=constants.errata_live_advisory_filter):
+    """The advisories in a filter which are still open (not shipped or
+dropped). The live advisory filter has all the active advisories of
+the product.
+
+    :return: A list of Erratum objects, without their raw bodies
+    """
+    return [advs for advs in iter_filtered_list(filter_id, keep_body=False)
+            if advs.status in constants.errata_active_advisory_labels]
+
+
+def get_attached_builds_index(advisories=None, n_threads=constants.errata_max_concurrent_requests):
+    """Index the builds attached to open advisories
+
+    Listing the builds of every open advisory takes one request per
+    advisory, far fewer than looking up every candidate build with
+    brew.get_brew_build() to see where it is attached.
+
+    :param list[Erratum] advisories: The advisories to index. Defaults
+    to get_open_advisories()
+    :param int n_threads: The most advisories to list the builds of at once
+
+    :return: A dict mapping the NVR of each attached build to the set
+    of IDs of the advisories it is attached to
+    :raises: exceptions.ErrataToolUnauthenticatedException if the user is not authenticated to make the request
+    :raises: exceptions.ErrataToolError if the builds of an advisory could not be listed
+    """
+    return _attached_index(advisories, get_builds, n_threads)
+
+
+def get_bugs(advisory_id):
+    """The IDs of the bugs attached to an advisory
+
+    Read from the advisory data (see get_erratum()), there is no
+    separate endpoint for the bugs of an advisory.
+
+    :param int advisory_id: The advisory to list the bugs of
+    :return: A list of the bug IDs, as integers
+    :raises: exceptions.ErrataToolUnauthenticatedException if the user is not authenticated to make the request
+    :raises: exceptions.ErrataToolError if the advisory could not be read
+    """
+    res = errata_client.get_client().get(constants.errata_get_erratum_url.format(id=advisory_id))
+
+    if res.status_code == 401:
+        raise exceptions.ErrataToolUnauthenticatedException(res.text)
+    elif res.status_code != 200:
+        raise exceptions.ErrataToolError("Could not list the bugs of advisory {id}: {msg}".format(
+            id=advisory_id, msg=res.text))
+
+    # {"bugs": {"bugs": [{"bug": {"id": 1234567, ...}}, ...], ...}, ...}
+    return [int(b['bug']['id']) for b in res.json().get('bugs', {}).get('bugs', [])]
+
+
+def get_attached_bugs_index(advisories=None, n_threads=constants.errata_max_concurrent_requests):
+    """Index the bugs attached to open advisories
+
+    A bug can only be attached to one open advisory at a time, trying
+    to add it to another one fails after a full round trip. This finds
+    those bugs up front, with one request per open advisory.
+
+    :param list[Erratum] advisories: The advisories to index. Defaults
+    to get_open_advisories()
+    :param int n_threads: The most advisories to read at once
+
+    :return: A dict mapping the ID (an integer) of each attached bug
+    to the set of IDs of the advisories it is attached to
+    :raises: exceptions.ErrataToolUnauthenticatedException if the user is not authenticated to make the request
+    :raises: exceptions.ErrataToolError if an advisory could not be read
+    """
+    return _attached_index(advisories, get_bugs, n_threads)
+
+
+def _attached_index(advisories, list_f, n_threads):
+    """Map everything list_f(advisory_id) lists to the advisories
+listing it. See get_attached_builds_index()."""
+    if advisories is None:
+        advisories = get_open_advisories()
+
+    index = {}
+    if len(advisories) == 0:
+        return index
+
+    pool = ThreadPool(min(n_threads, len(advisories)))
+    results = pool.map(
+        lambda advs: (advs.advisory_id, list_f(advs.advisory_id)),
+        advisories)
+    # Wait for results
+    pool.close()
+    pool.join()
+
+    for advisory_id, items in results:
+        for item in items:
+            index.setdefault(item, set([])).add(advisory_id)
+    return index
+
+
 def find_mutable_erratum(kind, minor, major=3):
     """Find the latest mutable (may be updated/changed) erratum for a
     release series using a combination of search parameters.
@@ -78,7 +374,7 @@ def find_mutable_erratum(kind, minor, major=3):
     pass
 
 
-def find_latest_erratum(kind, minor, major=3):
+def find_latest_erratum(kind, minor, major=3, index=None):
     """Find an erratum in a given release series, in ANY state.
 
     Put simply, this tells you the erratum that has the most recent,
@@ -101,6 +397,11 @@ def find_latest_erratum(kind, minor, major=3):
     that, this function will tell you what the latest ship date is for
     an erratum in that series.
 
+    :param MetadataIndex index: Where to remember the metadata found
+    in advisory comments. Advisories which have not been updated since
+    they were indexed are not scanned again. By default every
+    candidate advisory is scanned.
+
     If erratum exists matching your search:
     :return: An `Erratum` object of the erratum
 
@@ -108,7 +409,6 @@ def find_latest_erratum(kind, minor, major=3):
     :return: `None`
     """
     release = "{}.{}".format(major, minor)
-    found_advisory = None
 
     # List of hashes because we will scan the Mutable advisories first
     filters = [
@@ -116,41 +416,235 @@ def find_latest_erratum(kind, minor, major=3):
         {'Immutable Advisories': constants.errata_immutable_advisory_filter}
     ]
 
+    pool = ThreadPool(constants.errata_max_concurrent_requests)
+
     # Fetch initial lists of advisories in each pre-defined filter
-    advisory_list = []
     print("Running initial advisory fetching")
     for f in filters:
-        state_desc, filter_id = f.items()[0]
-        print("Fetching {state}".format(state=state_desc))
-        advisories = get_filtered_list(filter_id, limit=50)
+        print("Fetching {state}".format(state=f.keys()[0]))
+    filtered_lists = pool.map(
+        lambda f: get_filtered_list(f.values()[0], limit=50, keep_body=False),
+        filters)
+
+    advisory_list = []
+    seen_ids = set([])
+    for advisories in filtered_lists:
         # Filter out advisories that aren't for this release
-        advisory_list.extend([advs for advs in advisories if " {} ".format(release) in advs.synopsis])
-        print("Advisory list has {n} items after this fetch".format(
-            n=len(advisory_list)))
+        for advs in advisories:
+            if " {} ".format(release) in advs.synopsis and advs.advisory_id not in seen_ids:
+                seen_ids.add(advs.advisory_id)
+                advisory_list.append(advs)
+    print("Advisory list has {n} items after fetching".format(
+        n=len(advisory_list)))
+
+    # Visit the advisories with the newest listed release dates first.
+    # Once an advisory with metadata for this release is found,
+    # advisories listed with an older date can not beat it and we can
+    # stop. The list does not show a date for every advisory that has
+    # one (the real advisory may have publish_date_override set), so
+    # those listed without a date are always visited.
+    dated = sorted([advs for advs in advisory_list if advs.release_date is not None],
+                   key=lambda advs: advs.release_date, reverse=True)
+    undated = [advs for advs in advisory_list if advs.release_date is None]
 
     print("Looking for elliott metadata in comments:")
-    matched_advisories = []
-    for advisory in advisory_list:
-        print("Scanning advisory {}".format(str(advisory)))
+    # The best match, and the same advisory as it was listed
+    latest = None
+    latest_listed = None
+    batch_size = constants.errata_max_concurrent_requests
+    batches = [dated[start:start + batch_size] for start in range(0, len(dated), batch_size)]
+    batches.extend(undated[start:start + batch_size] for start in range(0, len(undated), batch_size))
+    for batch in batches:
+        listed_dates = [latest_listed.release_date if latest_listed is not None else None, batch[0].release_date]
+        if None not in listed_dates and listed_dates[1] <= listed_dates[0]:
+            # Nothing left to scan with a date was listed as released
+            # after what we found. Listed dates are compared with
+            # listed dates, the real ones may differ.
+            continue
+
+        for advisory in batch:
+            print("Scanning advisory {}".format(str(advisory)))
+        found_metadata = pool.map(
+            lambda advs: _indexed_elliott_metadata(advs, index),
+            batch)
+        matched_advisories = [advs for advs, metadata in zip(batch, found_metadata)
+                              if _metadata_matches(metadata, release, kind)]
+
+        # The release date in the filtered list may be stale, the real
+        # advisory has the final say
+        real_advisories = pool.map(
+            lambda advs: get_erratum(advs.advisory_id),
+            matched_advisories)
+        for listed, advs in zip(matched_advisories, real_advisories):
+            if latest is None or _release_date_key(advs) > _release_date_key(latest):
+                latest = advs
+                latest_listed = listed
+
+    pool.close()
+    pool.join()
+
+    if index is not None:
+        index.save()
+    return latest
+
+
+def _release_date_key(advisory):
+    """Sort key ordering advisories by release date, those without one
+    before all others"""
+    return (advisory.release_date is not None, advisory.release_date)
+
+
+def get_elliott_metadata(advisory):
+    """Find the metadata comment added to an advisory by
+    advisory:add-metadata
+
+    :param Erratum advisory: The advisory to scan
+
+    :return: The most recently added metadata, a dict with the
+    'release', 'kind' and 'impetus' keys. None if the advisory has no
+    metadata comment.
+
+    :raises: exceptions.ErrataToolError if the comments can not be fetched
+    """
+    # Comments come newest first, the pages after the first metadata
+    # comment are never fetched
+    for c in advisory.iter_comments():
+        try:
+            metadata = json.loads(c['attributes']['text'])
+            if all(key in metadata for key in ['release', 'kind', 'impetus']):
+                return metadata
+        except Exception:
+            # Not a metadata comment
+            continue
+    return None
+
+
+def _indexed_elliott_metadata(advisory, index=None):
+    """Like get_elliott_metadata(), but consult (and update) `index`
+    first, if one is given"""
+    if index is not None:
+        current, metadata = index.lookup(advisory)
+        if current:
+            return metadata
+
+    try:
+        metadata = get_elliott_metadata(advisory)
+    except exceptions.ErrataToolError as e:
+        # Treat it like an advisory without metadata, but leave it
+        # out of the index so it is tried again next time
+        print("Could not scan advisory {}: {}".format(advisory.advisory_id, e))
+        return None
 
-        for c in advisory.get_comments():
-            try:
-                metadata = json.loads(c['attributes']['text'])
-            except Exception as e:
-                pass
-            else:
-                if str(metadata['release']) == str(release) and metadata['kind'] == kind and metadata['impetus'] == 'standard':
-                    matched_advisories.append(advisory)
-                    # Don't scan any more comments
-                    break
+    if index is not None:
+        index.record(advisory, metadata)
+    return metadata
 
-    if matched_advisories == []:
-        return None
-    else:
-        # loop over discovered advisories, select one with max() date
-        real_advisories = [get_erratum(e.advisory_id) for e in matched_advisories]
-        sorted_dates = sorted(real_advisories, key=lambda advs: advs.release_date)
-        return sorted_dates[-1]
+
+def _metadata_matches(metadata, release, kind):
+    """Is `metadata` the standard metadata for this release and kind?"""
+    if metadata is None:
+        return False
+    return (str(metadata['release']), metadata['kind'], metadata['impetus']) == (str(release), kind, 'standard')
+
+
+class MetadataIndex(object):
+    """
+    Persistent record of the metadata comments (see
+    advisory:add-metadata) found on advisories, and their release
+    dates.
+
+    Every entry remembers the `updated_at` timestamp the advisory had
+    when it was scanned. An entry is only trusted while the advisory
+    still has that timestamp, so only advisories changed since the
+    last run have to be scanned again.
+
+    The index is a JSON file:
+
+        {
+            "advisories": {
+                "32916": {
+                    "updated_at": "2018-03-07T20:47:23Z",
+                    "release_date": "2018-03-27T00:00:00",
+                    "metadata": {"release": "3.9", "kind": "rpm", "impetus": "standard"}
+                },
+                ...
+            }
+        }
+    """
+    def __init__(self, path=None):
+        """
+        :param str path: Where the index is stored. If None the index
+        only lives in memory.
+        """
+        self.path = path
+        self.entries = {}
+        self.dirty = False
+        self.lock = Lock()
+
+        if path is not None and os.path.isfile(path):
+            self.load()
+
+    def load(self):
+        """Read the index from disk. A damaged index is discarded."""
+        try:
+            with open(self.path, 'r') as f:
+                self.entries = json.load(f)['advisories']
+        except (IOError, ValueError, KeyError) as e:
+            logger.warning("Ignoring unreadable advisory metadata index {}: {}".format(self.path, e))
+            self.entries = {}
+
+    def save(self):
+        """Write the index to disk, if anything changed"""
+        if self.path is None or not self.dirty:
+            return
+
+        with self.lock:
+            # Write the new index next to the old one and swap it in,
+            # an interrupted run can not leave a truncated index behind
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'advisories': self.entries}, f, indent=2)
+            os.rename(tmp_path, self.path)
+            self.dirty = False
+
+    def lookup(self, advisory):
+        """
+        :param Erratum advisory: The advisory to look up
+
+        :return: A tuple (current, metadata). `current` is True if the
+        advisory has not been updated since it was indexed, in which
+        case `metadata` is what get_elliott_metadata() would return.
+        """
+        with self.lock:
+            entry = self.entries.get(str(advisory.advisory_id))
+
+        if entry is None or advisory.updated_at is None or entry['updated_at'] != advisory.updated_at:
+            return False, None
+        return True, entry['metadata']
+
+    def record(self, advisory, metadata):
+        """Remember the metadata found on `advisory`
+
+        :param Erratum advisory: The advisory that was scanned
+        :param dict metadata: What get_elliott_metadata() returned for it
+        """
+        release_date = None
+        if advisory.release_date is not None:
+            release_date = advisory.release_date.isoformat()
+
+        with self.lock:
+            self.entries[str(advisory.advisory_id)] = {
+                'updated_at': advisory.updated_at,
+                'release_date': release_date,
+                'metadata': metadata,
+            }
+            self.dirty = True
+
+    def forget(self, advisory_id):
+        """Drop an advisory from the index, it will be scanned again next time"""
+        with self.lock:
+            if self.entries.pop(str(advisory_id), None) is not None:
+                self.dirty = True
 
 
 def new_erratum(kind=None, release_date=None, create=False, minor='Y',
@@ -203,9 +697,8 @@ def new_erratum(kind=None, release_date=None, create=False, minor='Y',
 
     if create:
         # THIS IS NOT A DRILL
-        res = requests.post(constants.errata_post_erratum_url,
-                            auth=HTTPKerberosAuth(),
-                            json=body)
+        res = errata_client.get_client().post(constants.errata_post_erratum_url,
+                                              json=body)
 
         if res.status_code == 201:
             return Erratum(body=res.json())
@@ -220,12 +713,13 @@ def new_erratum(kind=None, release_date=None, create=False, minor='Y',
         return json.dumps(body, indent=2)
 
 
-def get_filtered_list(filter_id=constants.errata_default_filter, limit=5):
+def get_filtered_list(filter_id=constants.errata_default_filter, limit=5, keep_body=True):
     """return a list of Erratum() objects from results using the provided
 filter_id
 
     :param filter_id: The ID number of the pre-defined filter
     :param int limit: How many erratum to list
+    :param bool keep_body: See Erratum()
     :return: A list of Erratum objects
 
     :raises exceptions.ErrataToolUnauthenticatedException: If the user is not authenticated to make the request
@@ -233,28 +727,108 @@ filter_id
 
     Note: Errata filters are defined in the ET web interface
     """
+    return list(iter_filtered_list(filter_id, limit, keep_body))
+
+
+def iter_filtered_list(filter_id=constants.errata_default_filter, limit=None, keep_body=True):
+    """Like get_filtered_list(), but yield the Erratum() objects one
+at a time as the filter results arrive.
+
+    Only `limit` results are asked of the Errata Tool. In case it
+    sends more anyway the response is parsed as it streams in and
+    dropped once `limit` advisories have been read.
+
+    :param filter_id: The ID number of the pre-defined filter
+    :param int limit: How many erratum to list, None for all of them
+    :param bool keep_body: See Erratum()
+
+    :raises exceptions.ErrataToolUnauthenticatedException: If the user is not authenticated to make the request
+    :raises exceptions.ErrataToolError: If the given filter does not exist, and, any other unexpected error
+    """
     filter_endpoint = constants.errata_filter_list_url.format(
         id=filter_id)
-    res = requests.get(filter_endpoint,
-                       auth=HTTPKerberosAuth())
-    if res.status_code == 200:
+    params = {}
+    if limit is not None:
+        params = {'page': 1, 'per_page': limit}
+
+    res = errata_client.get_client().get(filter_endpoint, params=params, stream=True)
+    try:
+        if res.status_code == 401:
+            raise exceptions.ErrataToolUnauthenticatedException(res.text)
+        elif res.status_code != 200:
+            raise exceptions.ErrataToolError("Other error (status_code={code}): {msg}".format(
+                code=res.status_code,
+                msg=res.text))
+
+        if limit is not None and limit < 1:
+            return
+
         # When asked for an advisory list which does not exist
         # normally you would expect a code like '404' (not
         # found). However, the Errata Tool sadistically returns a 200
         # response code. That leaves us with one option: Decide that
-        # successfully parsing the response as a JSONinfo object indicates
+        # successfully parsing the response as a JSON array indicates
         # a successful API call.
-        try:
-            return [Erratum(body=advs) for advs in res.json()][:limit]
-        except Exception:
-            raise exceptions.ErrataToolError("Could not locate the given advisory filter: {fid}".format(
-                fid=filter_id))
-    elif res.status_code == 401:
-        raise exceptions.ErrataToolUnauthenticatedException(res.text)
-    else:
-        raise exceptions.ErrataToolError("Other error (status_code={code}): {msg}".format(
-            code=res.status_code,
-            msg=res.text))
+        count = 0
+        advisories = _iter_json_array(res.iter_content(chunk_size=constants.errata_stream_chunk_size))
+        while True:
+            try:
+                row = next(advisories)
+                if not isinstance(row, dict) or 'synopsis' not in row:
+                    raise ValueError("Not an advisory: {}".format(row))
+                advs = Erratum(body=row, keep_body=keep_body)
+            except StopIteration:
+                return
+            except Exception:
+                raise exceptions.ErrataToolError("Could not locate the given advisory filter: {fid}".format(
+                    fid=filter_id))
+
+            yield advs
+            count += 1
+            if limit is not None and count >= limit:
+                return
+    finally:
+        # Drops the connection if the body wasn't read to the end
+        res.close()
+
+
+def _iter_json_array(chunks):
+    """Decode a JSON array of objects incrementally
+
+    :param chunks: An iterable of strings which together make up the
+    JSON document, e.g. requests.Response.iter_content()
+    :return: A generator of the decoded array items, each yielded as
+    soon as the chunks containing it have been read
+    :raises ValueError: If the document is not a JSON array
+    """
+    decoder = json.JSONDecoder()
+    buf = ''
+    started = False
+    for chunk in chunks:
+        buf += chunk
+        while True:
+            buf = buf.lstrip()
+            if not buf:
+                break
+            elif not started:
+                if buf[0] != '[':
+                    raise ValueError("Not a JSON array")
+                started = True
+                buf = buf[1:]
+            elif buf[0] == ']':
+                return
+            elif buf[0] == ',':
+                buf = buf[1:]
+            else:
+                try:
+                    item, end = decoder.raw_decode(buf)
+                except ValueError:
+                    # The item isn't complete yet, read on
+                    break
+                yield item
+                buf = buf[end:]
+
+    raise ValueError("Truncated JSON array")
 
 
 class Erratum(object):
@@ -264,26 +838,81 @@ class Erratum(object):
     well as from the full erratum body returned by the Errata Tool
     API. See also: get_erratum(id) for creating a filled in Erratum
     object automatically.
+
+    Lists of hundreds of advisories are common, so instances are kept
+    small (__slots__) and the `body` is only decoded into attributes
+    the first time one of them is read. Timestamps are only parsed into
+    datetime objects when they are used.
     """
 
+    __slots__ = (
+        'body', '_parsed',
+        'advisory_id', 'advisory_name', 'synopsis', 'description',
+        'solution', 'topic', 'status', 'updated_at', 'url',
+        '_created_at', '_release_date',
+    )
+
+    # Attributes filled in by _parse_body()
+    _body_fields = frozenset(__slots__) - frozenset(['body', '_parsed'])
+
     date_format = '%Y-%m-%dT%H:%M:%SZ'
 
-    def __init__(self, body=None):
+    def __init__(self, body=None, keep_body=True):
         """If a `body` is provided then this is an EXISTING advisory and we
         are filling in all the  at the time of object creation.
+
+        :param dict body: The advisory as returned by the Errata Tool API
+        :param bool keep_body: Set to False to decode the `body` right
+        away and drop it, to save memory when only the attributes are
+        needed. to_json() is not available on such an Erratum until
+        it is refresh()ed.
         """
         self.body = body
+        self._parsed = False
 
         if body is not None:
-            self._parse_body()
+            if not keep_body:
+                self._parse_body()
+                self.body = None
         else:
             # Attributes used in str() representation
-            self.adv_name = ''
+            self._parsed = True
+            self.advisory_name = ''
             self.synopsis = ''
             self.url = ''
             self.created_at = datetime.datetime.now()
+            self.updated_at = None
             self.release_date = None
 
+    def __getattr__(self, name):
+        # Only called when `name` is not set yet. Decode the body the
+        # first time an attribute from it is asked for.
+        if name in Erratum._body_fields and not self._parsed:
+            self._parse_body()
+            return getattr(self, name)
+        raise AttributeError("'Erratum' object has no attribute '{}'".format(name))
+
+    @property
+    def created_at(self):
+        # Left as the string from the body until it is first read
+        if self._created_at is not None and not isinstance(self._created_at, datetime.datetime):
+            self._created_at = datetime.datetime.strptime(self._created_at, self.date_format)
+        return self._created_at
+
+    @created_at.setter
+    def created_at(self, value):
+        self._created_at = value
+
+    @property
+    def release_date(self):
+        if self._release_date is not None and not isinstance(self._release_date, datetime.datetime):
+            self._release_date = datetime.datetime.strptime(self._release_date, self.date_format)
+        return self._release_date
+
+    @release_date.setter
+    def release_date(self, value):
+        self._release_date = value
+
     ######################################################################
     # Basic utility/setup methods
 
@@ -295,7 +924,10 @@ class Erratum(object):
             url=self.url)
 
     def _parse_body(self):
-        """The `body` content is different based on where it came from."""
+        """The `body` content is different based on where it came from.
+
+        Timestamps are left as strings, they are parsed by their
+        properties when read."""
         # Erratum from the direct erratum GET method
         if 'params' in self.body:
             # An advisory will come back as one of the following
@@ -316,11 +948,9 @@ class Erratum(object):
             self.solution = content['solution']
             self.topic = content['topic']
             self.status = rha['status']
-            self.created_at = datetime.datetime.strptime(rha['created_at'], self.date_format)
-            self.release_date = datetime.datetime.strptime(rha['publish_date_override'], self.date_format)
-            self.url = "{et}/advisory/{id}".format(
-                et=constants.errata_url,
-                id=self.advisory_id)
+            self._created_at = rha['created_at']
+            self.updated_at = rha['updated_at']
+            self._release_date = rha['publish_date_override']
         else:
             # Erratum returned from an advisory filtered list
             self.advisory_id = self.body.get('id', 0)
@@ -330,29 +960,111 @@ class Erratum(object):
             self.solution = self.body['content']['solution']
             self.topic = self.body['content']['topic']
             self.status = self.body.get('status', 'NEW_FILES')
-            self.created_at = datetime.datetime.strptime(self.body['timestamps']['created_at'], self.date_format)
-            self.url = "{et}/advisory/{id}".format(
-                et=constants.errata_url,
-                id=self.advisory_id)
+            self._created_at = self.body['timestamps']['created_at']
+            self.updated_at = self.body['timestamps'].get('updated_at')
+            # Not every advisory has a release date set yet
+            self._release_date = self.body['timestamps'].get('release_date')
+        self.url = "{et}/advisory/{id}".format(
+            et=constants.errata_url,
+            id=self.advisory_id)
+        self._parsed = True
 
     def refresh(self):
         """Refreshes this object by pulling down a fresh copy from the API"""
         self.body = get_erratum(self.advisory_id).body
         self._parse_body()
 
-    def to_json(self):
-        return json.dumps(self.body, indent=2)
+    def to_json(self, indent=2):
+        """:param int indent: As for json.dumps(), None for a single line
+        :raises ValueError: If the body was dropped (keep_body=False) and
+        not refresh()ed since
+        """
+        if self.body is None and hasattr(self, 'advisory_id'):
+            raise ValueError("The body of advisory {} was dropped (keep_body=False), refresh() it first".format(
+                self.advisory_id))
+        return json.dumps(self.body, indent=indent)
 
     ######################################################################
     # The following methods are related to REST API interactions
 
-    def add_bugs(self, bugs=[]):  # pragma: no cover
-        """Shortcut for several calls to self.add_bug()
+    def add_bugs(self, bugs=[], n_threads=constants.errata_max_concurrent_requests, retries=3):
+        """Attach several bugs to this advisory concurrently
+
+        Up to `n_threads` bugs are attached at the same time. A bug is
+        tried up to `retries` times if the Errata Tool fails the request
+        with a server side error (5xx), or if the request could not be
+        made at all. Any other failure (e.g., the bug is not eligible
+        for this advisory) is final.
 
         :param Bug bugs: A list of :module:`bugzilla` Bug objects
+        :param int n_threads: The most add_bug requests in flight at once
+        :param int retries: How many times to try attaching each bug
+
+        :return: A dict describing the outcome for every bug:
+
+            {
+                'added': [Bug, ...],
+                'failed': [
+                    {'bug': Bug, 'status_code': 422, 'error': 'Bug is not eligible...'},
+                    ...
+                ]
+            }
+
+        `status_code` is None for bugs which never got a response.
+        """
+        report = {'added': [], 'failed': []}
+        if len(bugs) == 0:
+            return report
+
+        pool = ThreadPool(min(n_threads, len(bugs)))
+        results = pool.map(
+            lambda bug: self._add_bug_with_retries(bug, retries),
+            bugs)
+        # Wait for results
+        pool.close()
+        pool.join()
+
+        for bug, res, error in results:
+            if res is not None and res.status_code == 201:
+                report['added'].append(bug)
+            elif res is not None:
+                report['failed'].append({'bug': bug, 'status_code': res.status_code, 'error': res.text})
+            else:
+                report['failed'].append({'bug': bug, 'status_code': None, 'error': error})
+
+        return report
+
+    def _add_bug_with_retries(self, bug, retries):
+        """Call add_bug(), retrying server errors and connection problems
+
+        :return: A tuple of (bug, response, error). `response` is the
+        last response received, None if no request got a response, in
+        which case `error` describes why.
         """
-        for bug in bugs:
-            yield (self.add_bug(bug), bug.id)
+        outcome = {'response': None, 'error': None}
+
+        def attempt():
+            try:
+                outcome['response'] = self.add_bug(bug)
+                outcome['error'] = None
+            except requests.exceptions.RequestException as e:
+                outcome['response'] = None
+                outcome['error'] = str(e)
+            return outcome['response']
+
+        def finished(res):
+            return res is not None and res.status_code < 500
+
+        def wait(attempt_num):
+            time.sleep(2 ** attempt_num)
+
+        try:
+            exectools.retry(retries, attempt, check_f=finished, wait_f=wait)
+        except exectools.RetryException:
+            # The last response (or error) is reported as the failure
+            pass
+
+        return bug, outcome['response'], outcome['error']
 
     def add_bug(self, bug):
         """5.2.1.5. POST /api/v1/erratum/{id}/add_bug
@@ -366,11 +1078,11 @@ class Erratum(object):
 
         :param Bug bug: A :module:`bugzilla` Bug object
         """
-        return requests.post(constants.errata_add_bug_url.format(id=self.advisory_id),
-                             auth=HTTPKerberosAuth(),
-                             json={'bug': bug.id})
+        return errata_client.get_client().post(constants.errata_add_bug_url.format(id=self.advisory_id),
+                                               json={'bug': bug.id})
 
-    def add_builds(self, builds=[]):
+    def add_builds(self, builds=[], chunk_size=constants.errata_add_builds_chunk_size,
+                   n_threads=constants.errata_max_concurrent_requests, retries=3):
         """5.2.2.7. POST /api/v1/erratum/{id}/add_builds
 
         Add one or more brew builds to an advisory.
@@ -385,33 +1097,151 @@ class Erratum(object):
 
         https://errata.devel.redhat.com/developer-guide/api-http-api.html#api-post-apiv1erratumidadd_builds
 
+        The builds are sent `chunk_size` at a time, up to `n_threads`
+        chunks at once. The Errata Tool rejects a whole chunk (422) if
+        any one of its builds can not be attached, so a rejected chunk
+        is split in half and each half is sent again, until the builds
+        at fault are isolated. Every other build is still attached.
+
+        A chunk is tried up to `retries` times if the Errata Tool fails
+        the request with a server side error (5xx), or if the request
+        could not be made at all.
+
+        Builds already attached to this advisory, or given more than
+        once, are skipped.
+
         :param list[Build] builds: List of Build objects to attach to
         an advisory
+        :param int chunk_size: The most builds to send per request
+        :param int n_threads: The most add_builds requests in flight at once
+        :param int retries: How many times to try sending each chunk
+
+        :return: A dict describing the outcome for every build:
+
+            {
+                'attached': [Build, ...],
+                'skipped': [Build, ...],
+                'rejected': [
+                    {'build': Build, 'status_code': 422, 'error': '...'},
+                    ...
+                ]
+            }
 
-        :return: True if builds were added successfully
+        `status_code` is None for builds which never got a response.
 
-        :raises: exceptions.BrewBuildException if the builds could not be attached
         :raises: exceptions.ErrataToolUnauthenticatedException if the user is not authenticated to make the request
         """
-        data = [b.to_json() for b in builds]
+        report = {'attached': [], 'skipped': [], 'rejected': []}
 
-        res = requests.post(constants.errata_add_builds_url.format(id=self.advisory_id),
-                            auth=HTTPKerberosAuth(),
-                            json=data)
-
-        print(res.status_code)
-        print(res.text)
+        to_add = []
+        seen = set([])
+        for b in builds:
+            if b.nvr in seen or self.advisory_id in [e['id'] for e in b.all_errata]:
+                report['skipped'].append(b)
+            else:
+                seen.add(b.nvr)
+                to_add.append(b)
+
+        if len(to_add) == 0:
+            return report
+
+        chunks = [to_add[i:i + chunk_size] for i in range(0, len(to_add), chunk_size)]
+        pool = ThreadPool(min(n_threads, len(chunks)))
+        results = pool.map(
+            lambda chunk: self._add_builds_bisecting(chunk, retries),
+            chunks)
+        # Wait for results
+        pool.close()
+        pool.join()
+
+        for attached, rejected in results:
+            report['attached'].extend(attached)
+            report['rejected'].extend(rejected)
+
+        return report
+
+    def _add_builds_bisecting(self, builds, retries, outcome=None):
+        """Send a chunk of builds to add_builds, splitting it up if the
+        Errata Tool rejects it
+
+        If both halves of the first split are rejected with the same
+        error the advisory itself is at fault (e.g., it is not in
+        NEW_FILES), no smaller chunk would get through, so the chunk
+        is not split any further.
+
+        :param tuple outcome: What _add_builds_with_retries() returned
+        for this chunk, if it has been sent already
+        :return: A tuple of (attached, rejected) like the lists in the
+        add_builds() report
+        """
+        first_split = outcome is None
+        res, error, attached = outcome or self._add_builds_with_retries(builds, retries)
 
-        if res.status_code == 422:
-            # "Something" bad happened
-            print(res.status_code)
-            print(res.text)
-            raise exceptions.BrewBuildException(str(res.json()))
-        elif res.status_code == 401:
+        if res is not None and res.status_code == 401:
             raise exceptions.ErrataToolUnauthenticatedException(res.text)
-        # TODO: Find the success return code
+        elif attached or (res is not None and res.status_code < 400):
+            return builds, []
+        elif res is not None and res.status_code == 422 and len(builds) > 1:
+            half = len(builds) // 2
+            halves = [builds[:half], builds[half:]]
+            outcomes = [self._add_builds_with_retries(h, retries) for h in halves]
+            errors = set((o[0].status_code, o[0].text) if o[0] is not None and not o[2] else None for o in outcomes)
+            if first_split and len(errors) == 1 and (422, res.text) in errors:
+                logger.warning("Advisory {id} refuses every build: {error}".format(id=self.advisory_id, error=res.text))
+                return [], [{'build': b, 'status_code': res.status_code, 'error': res.text} for b in builds]
+            attached, rejected = self._add_builds_bisecting(halves[0], retries, outcomes[0])
+            more_attached, more_rejected = self._add_builds_bisecting(halves[1], retries, outcomes[1])
+            return attached + more_attached, rejected + more_rejected
+        elif res is not None:
+            return [], [{'build': b, 'status_code': res.status_code, 'error': res.text} for b in builds]
         else:
-            return True
+            return [], [{'build': b, 'status_code': None, 'error': error} for b in builds]
+
+    def _add_builds_with_retries(self, builds, retries):
+        """POST a chunk of builds to add_builds, retrying server errors
+        and connection problems
+
+        A request which failed to connect, or lost its connection, may
+        have been processed all the same. If a retry is then rejected
+        because the builds are on the advisory already, they were
+        attached by the earlier request.
+
+        :return: A tuple of (response, error, attached). `response` is
+        the last response received, None if no request got a response,
+        in which case `error` describes why. `attached` is True if an
+        earlier request was found to have attached the builds.
+        """
+        outcome = {'response': None, 'error': None, 'maybe_sent': False}
+        url = constants.errata_add_builds_url.format(id=self.advisory_id)
+        data = [b.to_json() for b in builds]
+
+        def attempt():
+            try:
+                outcome['response'] = errata_client.get_client().post(url, json=data)
+                outcome['error'] = None
+            except requests.exceptions.RequestException as e:
+                outcome['response'] = None
+                outcome['error'] = str(e)
+                outcome['maybe_sent'] = True
+            return outcome['response']
+
+        def finished(res):
+            return res is not None and res.status_code < 500
+
+        def wait(attempt_num):
+            time.sleep(2 ** attempt_num)
+
+        try:
+            exectools.retry(retries, attempt, check_f=finished, wait_f=wait)
+        except exectools.RetryException:
+            # The last response (or error) is reported as the failure
+            pass
+
+        res = outcome['response']
+        attached = False
+        if outcome['maybe_sent'] and res is not None and res.status_code == 422:
+            attached = any(e in res.text for e in constants.errata_already_attached_errors)
+        return res, outcome['error'], attached
 
     def add_comment(self, comment):  # pragma: no cover
         """5.2.1.8. POST /api/v1/erratum/{id}/add_comment
@@ -428,9 +1258,8 @@ class Erratum(object):
         :param dict comment: The metadata object to add as a comment
         """
         data = {"comment": json.dumps(comment)}
-        return requests.post(constants.errata_add_comment_url.format(id=self.advisory_id),
-                             auth=HTTPKerberosAuth(),
-                             data=data)
+        return errata_client.get_client().post(constants.errata_add_comment_url.format(id=self.advisory_id),
+                                               data=data)
 
     def change_state(self, state):
         """5.2.1.14. POST /api/v1/erratum/{id}/change_state
@@ -450,9 +1279,8 @@ class Erratum(object):
 
         https://errata.devel.redhat.com/developer-guide/api-http-api.html#api-post-apiv1erratumidchange_state
         """
-        res = requests.post(constants.errata_change_state_url.format(id=self.advisory_id),
-                            auth=HTTPKerberosAuth(),
-                            data={"new_state": state})
+        res = errata_client.get_client().post(constants.errata_change_state_url.format(id=self.advisory_id),
+                                              data={"new_state": state})
 
         # You may receive this response when: Erratum isn't ready to
         # move to QE, no builds in erratum, erratum has no Bugzilla
@@ -490,20 +1318,74 @@ class Erratum(object):
 
         This is a paginated API. Reference documentation:
         https://errata.devel.redhat.com/developer-guide/api-http-api.html#api-pagination
+
+        Every page is fetched. To stop early use iter_comments().
+
+        :return: A list of comments, False if they could not be fetched
+        """
+        try:
+            return list(self.iter_comments())
+        except exceptions.ErrataToolError:
+            return False
+
+    def iter_comments(self, page_size=constants.errata_comments_page_size):
+        """Iterate over the advisory comments, newest first, walking
+        every page of GET /api/v1/comments (see get_comments())
+
+        While one page is being consumed the next one is already being
+        fetched in the background. Pages after that are only requested
+        if the caller keeps iterating, so stopping early (break) saves
+        downloading the rest.
+
+        :param int page_size: How many comments to request at once
+        :raises: exceptions.ErrataToolUnauthorizedException if the user is not authorized
+        :raises: exceptions.ErrataToolError if a page can not be fetched
+        """
+        pool = ThreadPool(1)
+        try:
+            number = 1
+            pending = pool.apply_async(self._get_comments_page, (number, page_size))
+            while True:
+                comments = pending.get()
+                if not comments:
+                    # Only an empty page is past the last one, the
+                    # Errata Tool may give fewer comments per page
+                    # than asked for
+                    break
+                number += 1
+                pending = pool.apply_async(self._get_comments_page, (number, page_size))
+
+                for c in comments:
+                    yield c
+        finally:
+            # Don't leave the worker behind when the caller stops
+            # early, a look-ahead request still in flight is waited for
+            pool.terminate()
+            pool.join()
+
+    def _get_comments_page(self, number, page_size):
+        """Fetch one page of comments (see get_comments())
+
+        :return: The list of comments on the page
         """
         body = {
             "filter": {
                 "errata_id": self.advisory_id,
                 "type": "Comment"
-                }
+            },
+            "page": {
+                "number": number,
+                "size": page_size
             }
-        res = requests.get(constants.errata_get_comments_url,
-                           auth=HTTPKerberosAuth(),
-                           json=body)
+        }
+        res = errata_client.get_client().get(constants.errata_get_comments_url,
+                                             json=body)
 
         if res.status_code == 200:
             return res.json().get('data', [])
         elif res.status_code == 401:
             raise exceptions.ErrataToolUnauthorizedException(res.text)
         else:
-            return False
+            raise exceptions.ErrataToolError(
+                "Could not fetch page {n} of comments on advisory {id}: {code} {text}".format(
+                    n=number, id=self.advisory_id, code=res.status_code, text=res.text))
@@ -0,0 +1,322 @@
+"""
+A pooled, thread-safe client for the Errata Tool HTTP API.
+
+Every request elliott makes to the Errata Tool should go through the
+single shared ErrataClient returned by get_client(). The client owns a
+keep-alive connection pool and a cookie jar, so the TLS handshake and
+the SPNEGO (kerberos) negotiation done for the first request are
+reused by every request that follows it, from any thread. Requests are
+admitted by the 'errata' admission controller (see throttle.py), which
+backs off when the Errata Tool struggles.
+
+GET responses can be kept in a ResponseCache (see
+ErrataClient.enable_cache()), optionally on disk so they outlive the
+process. Cached responses are revalidated with conditional requests
+(If-None-Match/If-Modified-Since) once they are older than the time to
+live configured for their endpoint in constants.errata_cache_ttl.
+"""
+
+# stdlib
+import base64
+import hashlib
+import json
+import os
+import tempfile
+import re
+import time
+import urlparse
+from multiprocessing import Lock
+
+# ours
+import constants
+import logutil
+import throttle
+
+# 3rd party
+import requests
+import requests.adapters
+import requests.structures
+from requests_kerberos import HTTPKerberosAuth, OPTIONAL
+
+logger = logutil.getLogger(__name__)
+
+# The shared client, created on first use by get_client()
+_client = None
+# Protects creation of the shared client
+_client_lock = Lock()
+
+
+def endpoint(method, url):
+    """The endpoint a request goes to, for telling apart how long
+    different kinds of request usually take (see throttle.py). Path
+    segments holding an ID or NVR are left out.
+
+    :return: A string like 'GET /api/v1/build/{id}'
+    """
+    path = urlparse.urlparse(url).path
+    return "{} {}".format(method, '/'.join(
+        '{id}' if re.search(r'^\d|-\d', segment) else segment for segment in path.split('/')))
+
+
+class ErrataClient(object):
+    """
+    Wrapper around a requests.Session configured for the Errata
+    Tool. The get/post methods take the same arguments as their
+    requests.Session counterparts, minus `auth` which the client
+    provides itself.
+    """
+    def __init__(self, pool_size=constants.errata_connection_pool_size, auth=None):
+        """
+        :param int pool_size: The most connections to keep open to the
+        Errata Tool at once. Set this to at least the number of threads
+        you expect to make requests concurrently, connections beyond
+        this are closed after each request instead of reused.
+        :param requests.auth.AuthBase auth: Authentication handler,
+        defaults to kerberos (HTTPKerberosAuth)
+        """
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        if auth is None:
+            # Once the Errata Tool hands back a session cookie later
+            # responses carry no negotiate token to verify, so mutual
+            # authentication can only ever be optional here.
+            auth = HTTPKerberosAuth(mutual_authentication=OPTIONAL)
+        self.session.auth = auth
+
+        # Serializes requests until one has authenticated successfully
+        self._auth_lock = Lock()
+        self.authenticated = False
+
+        self.cache = None
+
+    def enable_cache(self, path=None):
+        """Start caching GET responses
+
+        :param str path: Directory to keep the cached responses in. If
+        None they are only kept in memory.
+        """
+        self.cache = ResponseCache(path)
+
+    def request(self, method, url, **kwargs):
+        """Make a request, see requests.Session.request for the parameters
+
+        GET requests are answered from the cache when it is enabled,
+        except streamed (stream=True) ones. Any other request may
+        change something on the Errata Tool, after it everything in the
+        cache is revalidated before being used again.
+
+        Give a GET request `max_age` (seconds) to revalidate a cached
+        response older than that, even if it is within its TTL. With
+        max_age=0 every request is a conditional one.
+
+        :return: A requests.Response object
+        """
+        max_age = kwargs.pop('max_age', None)
+        if self.cache is None:
+            return self._request(method, url, **kwargs)
+
+        if method != 'GET':
+            try:
+                return self._request(method, url, **kwargs)
+            finally:
+                self.cache.invalidate()
+
+        if kwargs.get('stream'):
+            return self._request(method, url, **kwargs)
+
+        key = self.cache.key(url, kwargs)
+        entry = self.cache.get(key)
+        if entry is not None and self.cache.is_fresh(entry, max_age):
+            return self.cache.response(entry)
+
+        if entry is not None:
+            headers = dict(kwargs.get('headers') or {})
+            if entry['etag'] is not None:
+                headers['If-None-Match'] = entry['etag']
+            if entry['last_modified'] is not None:
+                headers['If-Modified-Since'] = entry['last_modified']
+            kwargs['headers'] = headers
+
+        res = self._request(method, url, **kwargs)
+        if res.status_code == 304 and entry is not None:
+            # Unchanged, the cached copy is good for another TTL
+            self.cache.store(key, entry)
+            return self.cache.response(entry)
+        elif res.status_code == 200:
+            self.cache.store(key, self.cache.entry(url, res))
+        return res
+
+    def _request(self, method, url, **kwargs):
+        """Make a request, see requests.Session.request for the parameters
+
+        Until a request has succeeded in authenticating, requests are
+        made one at a time. This way only the first request pays for
+        the negotiate round trip, the threads waiting behind it reuse
+        the session cookie it brings back.
+
+        :return: A requests.Response object
+        """
+        if self.authenticated:
+            return self._send(method, url, **kwargs)
+
+        with self._auth_lock:
+            res = self._send(method, url, **kwargs)
+            if res.status_code != 401:
+                self.authenticated = True
+            return res
+
+    def _send(self, method, url, **kwargs):
+        """Make a request once admitted by the Errata Tool's admission
+        controller (see throttle.py). Server errors and 429 (Too Many
+        Requests) responses count against the service.
+
+        :return: A requests.Response object
+        """
+        with throttle.get('errata').admit(endpoint(method, url)) as admission:
+            res = self.session.request(method, url, **kwargs)
+            if res.status_code == 429 or res.status_code >= 500:
+                retry_after = res.headers.get('Retry-After', '')
+                admission.fail(int(retry_after) if retry_after.isdigit() else None)
+            return res
+
+    def get(self, url, **kwargs):
+        """HTTP GET the given Errata Tool url"""
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """HTTP POST to the given Errata Tool url"""
+        return self.request('POST', url, **kwargs)
+
+
+class ResponseCache(object):
+    """
+    Errata Tool GET responses with their validators (ETag,
+    Last-Modified), kept in memory and, if a `path` is given, on disk
+    with one JSON file per response. Only responses from endpoints with
+    a TTL are written to disk, the rest would have to be revalidated by
+    any later run and would only pile up there.
+
+    Responses younger than the TTL for their endpoint
+    (constants.errata_cache_ttl) and younger than the last write made
+    through the client (see invalidate()) are used as they are. Older
+    ones have to be revalidated.
+    """
+    def __init__(self, path=None, ttl=None):
+        """
+        :param str path: Directory for the cached responses, None to
+        only keep them in memory
+        :param dict ttl: Seconds responses are used without
+        revalidating them, keyed by url prefix. The longest matching
+        prefix applies, urls matching none are always revalidated.
+        Defaults to constants.errata_cache_ttl.
+        """
+        self.path = path
+        self.ttl = constants.errata_cache_ttl if ttl is None else ttl
+        self.entries = {}
+        self.lock = Lock()
+        # When the last write went through the client
+        self.last_write = 0
+
+        if path is not None and not os.path.isdir(path):
+            os.makedirs(path)
+
+    def key(self, url, kwargs):
+        """A key identifying a GET of `url` with the given requests
+        arguments"""
+        request = [url, kwargs.get('params'), kwargs.get('json'), kwargs.get('data')]
+        return hashlib.sha1(json.dumps(request, sort_keys=True)).hexdigest()
+
+    def ttl_for(self, url):
+        """:return: How many seconds a response from `url` is fresh"""
+        matches = [prefix for prefix in self.ttl if url.startswith(prefix)]
+        if not matches:
+            return 0
+        return self.ttl[max(matches, key=len)]
+
+    def is_fresh(self, entry, max_age=None):
+        """Can `entry` be used without revalidating it?
+
+        :param float max_age: If not None, entries older than this many
+        seconds are not fresh, whatever their TTL
+        """
+        if entry['stored_at'] <= self.last_write:
+            return False
+        age = time.time() - entry['stored_at']
+        if max_age is not None and age >= max_age:
+            return False
+        return age < self.ttl_for(entry['url'])
+
+    def invalidate(self):
+        """Something was changed, revalidate every response cached so far"""
+        self.last_write = time.time()
+
+    def entry(self, url, res):
+        """:return: A cache entry for the response `res` to a GET of `url`"""
+        return {
+            'url': url,
+            'stored_at': time.time(),
+            'etag': res.headers.get('ETag'),
+            'last_modified': res.headers.get('Last-Modified'),
+            'status_code': res.status_code,
+            'headers': dict(res.headers),
+            'encoding': res.encoding,
+            'content': base64.b64encode(res.content),
+        }
+
+    def response(self, entry):
+        """:return: A requests.Response made from a cache entry"""
+        res = requests.Response()
+        res.url = entry['url']
+        res.status_code = entry['status_code']
+        res.headers = requests.structures.CaseInsensitiveDict(entry['headers'])
+        res.encoding = entry['encoding']
+        res._content = base64.b64decode(entry['content'])
+        return res
+
+    def get(self, key):
+        """:return: The cache entry for `key`, None if there is none"""
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is not None or self.path is None:
+            return entry
+
+        try:
+            with open(os.path.join(self.path, key + '.json'), 'r') as f:
+                entry = json.load(f)
+        except (IOError, ValueError):
+            return None
+
+        with self.lock:
+            self.entries[key] = entry
+        return entry
+
+    def store(self, key, entry):
+        """Remember `entry` under `key`, marking it as fresh from now"""
+        entry['stored_at'] = time.time()
+        with self.lock:
+            self.entries[key] = entry
+        if self.path is None or self.ttl_for(entry['url']) <= 0:
+            return
+
+        # Write next to the final name and swap it in, so readers
+        # never see a partial entry
+        fd, tmp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(entry, f)
+        os.rename(tmp_path, os.path.join(self.path, key + '.json'))
+
+
+def get_client():
+    """
+    :return: The ErrataClient shared by the whole process. It is
+    created the first time this is called.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            logger.debug("Creating shared Errata Tool client")
+            _client = ErrataClient()
+        return _client
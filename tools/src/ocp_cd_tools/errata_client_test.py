@@ -0,0 +1,165 @@
+"""
+Test the shared Errata Tool client
+"""
+
+import mock
+import os
+import shutil
+import tempfile
+import time
+
+# Import the right version for your python
+import platform
+(major, minor, patch) = platform.python_version_tuple()
+if int(major) == 2 and int(minor) < 7:
+    import unittest2 as unittest
+else:
+    import unittest
+
+import errata_client
+
+
+class TestErrataClient(unittest.TestCase):
+
+    def test_connection_pool_size(self):
+        """The client keeps as many connections open as it was asked to"""
+        c = errata_client.ErrataClient(pool_size=7, auth=mock.MagicMock())
+        adapter = c.session.get_adapter('https://errata.devel.redhat.com')
+        self.assertEqual(7, adapter._pool_maxsize)
+
+    def test_requests_use_the_session(self):
+        """Requests are made on the pooled session, not requests.get/post"""
+        c = errata_client.ErrataClient(auth=mock.MagicMock())
+        with mock.patch.object(c.session, 'request') as request:
+            request.return_value = mock.MagicMock(status_code=200)
+            c.get('https://example.com/a', json={'a': 1})
+            c.post('https://example.com/b', data={'b': 2})
+
+            request.assert_any_call('GET', 'https://example.com/a', json={'a': 1})
+            request.assert_any_call('POST', 'https://example.com/b', data={'b': 2})
+
+    def test_authenticated_after_first_success(self):
+        """A successful request marks the client as authenticated"""
+        c = errata_client.ErrataClient(auth=mock.MagicMock())
+        with mock.patch.object(c.session, 'request') as request:
+            request.return_value = mock.MagicMock(status_code=401)
+            c.get('https://example.com/')
+            self.assertFalse(c.authenticated)
+
+            request.return_value = mock.MagicMock(status_code=200)
+            c.get('https://example.com/')
+            self.assertTrue(c.authenticated)
+
+    def test_get_client_is_shared(self):
+        """Every caller gets the same client"""
+        with mock.patch.object(errata_client, '_client', None):
+            with mock.patch.object(errata_client, 'ErrataClient') as client_class:
+                first = errata_client.get_client()
+                second = errata_client.get_client()
+                self.assertIs(first, second)
+                self.assertEqual(1, client_class.call_count)
+
+    def test_endpoint(self):
+        """IDs and NVRs are left out of endpoints, API versions are not"""
+        self.assertEqual('GET /api/v1/build/{id}', errata_client.endpoint(
+            'GET', 'https://errata.devel.redhat.com/api/v1/build/coreutils-8.22-21.el7'))
+        self.assertEqual('POST /api/v1/erratum/{id}/add_builds', errata_client.endpoint(
+            'POST', 'https://errata.devel.redhat.com/api/v1/erratum/12345/add_builds'))
+        self.assertEqual('GET /filter/{id}', errata_client.endpoint(
+            'GET', 'https://errata.devel.redhat.com/filter/1965.json?page=2'))
+
+
+class TestResponseCache(unittest.TestCase):
+
+    url = 'https://errata.devel.redhat.com/api/v1/erratum/1'
+
+    def setUp(self):
+        self.client = errata_client.ErrataClient(auth=mock.MagicMock())
+        patcher = mock.patch.object(self.client.session, 'request')
+        self.request = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def response(self, status_code, content='', headers={}):
+        res = errata_client.requests.Response()
+        res.status_code = status_code
+        res._content = content
+        res.headers.update(headers)
+        return res
+
+    def test_fresh_responses_are_reused(self):
+        """Responses younger than their TTL are answered from the cache"""
+        self.client.enable_cache()
+        self.client.cache.ttl = {'https://errata.devel.redhat.com/api/v1/erratum/': 60}
+        self.request.return_value = self.response(200, '{"id": 1}')
+
+        self.assertEqual({'id': 1}, self.client.get(self.url).json())
+        self.assertEqual({'id': 1}, self.client.get(self.url).json())
+        self.assertEqual(1, self.request.call_count)
+
+    def test_revalidate(self):
+        """Stale responses are revalidated with a conditional request"""
+        self.client.enable_cache()
+        self.client.cache.ttl = {}
+        self.request.return_value = self.response(200, '{"id": 1}', {'ETag': 'W/"abc"'})
+        self.client.get(self.url)
+
+        self.request.return_value = self.response(304)
+        self.assertEqual({'id': 1}, self.client.get(self.url).json())
+        self.assertEqual('W/"abc"', self.request.call_args[1]['headers']['If-None-Match'])
+
+    def test_max_age(self):
+        """max_age forces revalidating responses still within their TTL"""
+        self.client.enable_cache()
+        self.client.cache.ttl = {'https://errata.devel.redhat.com/api/v1/erratum/': 60}
+        self.request.return_value = self.response(200, '{"id": 1}', {'ETag': '"abc"'})
+        self.client.get(self.url)
+
+        self.request.return_value = self.response(304)
+        self.assertEqual({'id': 1}, self.client.get(self.url, max_age=0).json())
+        self.assertEqual(2, self.request.call_count)
+        self.assertEqual('"abc"', self.request.call_args[1]['headers']['If-None-Match'])
+        self.assertNotIn('max_age', self.request.call_args[1])
+
+    def test_writes_invalidate(self):
+        """After a POST cached responses are revalidated"""
+        self.client.enable_cache()
+        self.client.cache.ttl = {'https://errata.devel.redhat.com/api/v1/erratum/': 60}
+        self.request.return_value = self.response(200, '{"id": 1}', {'Last-Modified': 'yesterday'})
+        self.client.get(self.url)
+        self.client.post(self.url + '/change_state', data={'new_state': 'QE'})
+
+        time.sleep(0.01)
+        self.request.return_value = self.response(200, '{"id": 2}')
+        self.assertEqual({'id': 2}, self.client.get(self.url).json())
+        self.assertEqual('yesterday', self.request.call_args[1]['headers']['If-Modified-Since'])
+
+    def test_disk_cache(self):
+        """Responses cached on disk are used by a new client"""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.client.enable_cache(tmp_dir)
+        self.request.return_value = self.response(200, '{"id": 1}', {'ETag': '"abc"'})
+        self.client.get(self.url)
+
+        client = errata_client.ErrataClient(auth=mock.MagicMock())
+        client.enable_cache(tmp_dir)
+        client.cache.ttl = {}
+        with mock.patch.object(client.session, 'request') as request:
+            request.return_value = self.response(304)
+            self.assertEqual({'id': 1}, client.get(self.url).json())
+            self.assertEqual('"abc"', request.call_args[1]['headers']['If-None-Match'])
+
+    def test_disk_cache_skips_untimed_endpoints(self):
+        """Responses from endpoints without a TTL are not written to disk"""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        self.client.enable_cache(tmp_dir)
+        self.request.return_value = self.response(200, '[]', {'ETag': '"abc"'})
+        self.client.get('https://errata.devel.redhat.com/api/v1/build/coreutils-8.22-21.el7')
+        self.client.get(self.url)
+
+        self.assertEqual(1, len(os.listdir(tmp_dir)))
+
+
+if __name__ == '__main__':
+    unittest.main()
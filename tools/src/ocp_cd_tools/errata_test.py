@@ -2,9 +2,13 @@
 Test errata models/controllers
 """
 
+import copy
 import datetime
 import mock
 import json
+import os
+import shutil
+import tempfile
 from contextlib import nested
 
 # Import the right version for your python
@@ -22,14 +26,13 @@ import bugzilla
 import brew
 import test_structures
 
-from requests_kerberos import HTTPKerberosAuth
-
 
 class TestBrew(unittest.TestCase):
 
     def test_get_erratum_success(self):
         """Verify a 'good' erratum request is fulfilled"""
-        with mock.patch('errata.requests.get') as get:
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            get = client.return_value.get
             # Create the requests.response object. The status code
             # here will change the path of execution to the not-found
             # branch of errata.get_erratum
@@ -37,7 +40,7 @@ class TestBrew(unittest.TestCase):
             # response's have a 'json' function that returns a dict of
             # the JSON response body ('example_erratum' defined below)
             response.json.return_value = test_structures.example_erratum
-            # Set the return value of the requests.get call to the
+            # Set the return value of the client.get call to the
             # response we just created
             get.return_value = response
             e = errata.get_erratum(123456)
@@ -45,7 +48,8 @@ class TestBrew(unittest.TestCase):
 
     def test_get_erratum_unauthorized(self):
         """Verify an we can detect unauthorized requests"""
-        with mock.patch('errata.requests.get') as get:
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            get = client.return_value.get
             # Create the requests.response object. The status code
             # here will change the path of execution to the
             # unauthorized branch of code
@@ -56,7 +60,8 @@ class TestBrew(unittest.TestCase):
 
     def test_get_erratum_failure(self):
         """Verify a 'bad' erratum request returns False"""
-        with mock.patch('errata.requests.get') as get:
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            get = client.return_value.get
             # Engage the not-found branch
             response = mock.MagicMock(status_code=404)
             response.json.return_value = test_structures.example_erratum
@@ -90,7 +95,8 @@ class TestBrew(unittest.TestCase):
 
     def test_erratum_refresh(self):
         """Ensure Erratum.refresh does the needful"""
-        with mock.patch('errata.requests.get') as get:
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            get = client.return_value.get
             # Create the requests.response object. The status code
             # here will change the path of execution to the not-found
             # branch of errata.get_erratum
@@ -98,7 +104,7 @@ class TestBrew(unittest.TestCase):
             # response's have a 'json' function that returns a dict of
             # the JSON response body ('example_erratum' defined below)
             response.json.return_value = test_structures.example_erratum
-            # Set the return value of the requests.get call to the
+            # Set the return value of the client.get call to the
             # response we just created
             get.return_value = response
             e = errata.get_erratum(123456)
@@ -109,33 +115,224 @@ class TestBrew(unittest.TestCase):
             e.refresh()
             self.assertEqual(original_str, str(e))
 
+    def filtered_list_response(self, body, chunk_size=100):
+        """A streamed response carrying `body` as JSON"""
+        content = json.dumps(body)
+        response = mock.MagicMock(status_code=200)
+        response.iter_content.return_value = iter(
+            [content[i:i + chunk_size] for i in range(0, len(content), chunk_size)])
+        return response
+
     def test_get_filtered_list(self):
         """Ensure we can generate an Erratum List"""
-        with mock.patch('errata.requests.get') as get:
-            response = mock.MagicMock(status_code=200)
-            response.json.return_value = test_structures.example_erratum_filtered_list
-            get.return_value = response
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            get = client.return_value.get
+            get.return_value = self.filtered_list_response(test_structures.example_erratum_filtered_list)
             res = errata.get_filtered_list()
             self.assertEqual(2, len(res))
+            self.assertEqual(test_structures.example_erratum_filtered_list[1]['id'], res[1].advisory_id)
 
     def test_get_filtered_list_limit(self):
         """Ensure we can generate a trimmed Erratum List"""
-        with mock.patch('errata.requests.get') as get:
-            response = mock.MagicMock(status_code=200)
-            response.json.return_value = test_structures.example_erratum_filtered_list
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            get = client.return_value.get
+            response = self.filtered_list_response(test_structures.example_erratum_filtered_list)
             get.return_value = response
             res = errata.get_filtered_list(limit=1)
             self.assertEqual(1, len(res))
+            # Only as many as needed are asked for, and the rest of
+            # the response is dropped
+            self.assertEqual(1, get.call_args[1]['params']['per_page'])
+            response.close.assert_called_once_with()
+
+    def test_iter_filtered_list_streams(self):
+        """Advisories are yielded before the whole list has been read"""
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            get = client.return_value.get
+            response = self.filtered_list_response(test_structures.example_erratum_filtered_list)
+            get.return_value = response
+            advisories = errata.iter_filtered_list(limit=None)
+            next(advisories)
+            self.assertIsNotNone(next(response.iter_content.return_value, None))
+
+    def test_get_filtered_list_bad_filter(self):
+        """Ensure we notice filters that do not exist"""
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            get = client.return_value.get
+            get.return_value = self.filtered_list_response({'error': 'Bad filter'})
+            with self.assertRaises(exceptions.ErrataToolError):
+                errata.get_filtered_list()
 
     def test_get_filtered_list_fail(self):
         """Ensure we notice invalid erratum lists"""
-        with mock.patch('errata.requests.get') as get:
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            get = client.return_value.get
             response = mock.MagicMock(status_code=404)
             response.json.return_value = test_structures.example_erratum_filtered_list
             get.return_value = response
             with self.assertRaises(exceptions.ErrataToolError):
                 errata.get_filtered_list()
 
+    def test_find_latest_erratum(self):
+        """Ensure the newest advisory with matching metadata is found without scanning older dated ones"""
+        def advisory(id, release_date):
+            body = copy.deepcopy(test_structures.example_erratum_filtered_list[1])
+            body['id'] = id
+            body['synopsis'] = 'OpenShift Container Platform 3.9 images update'
+            body['timestamps']['release_date'] = release_date
+            return errata.Erratum(body=body)
+
+        advisories = [
+            advisory(1, '2018-01-01T00:00:00Z'),
+            advisory(2, '2018-03-01T00:00:00Z'),
+            advisory(3, '2018-02-01T00:00:00Z'),
+            advisory(4, None),
+        ]
+        metadata = {'release': '3.9', 'kind': 'image', 'impetus': 'standard'}
+        comments = {
+            1: [{'attributes': {'text': json.dumps(metadata)}}],
+            2: [{'attributes': {'text': 'Not metadata'}}],
+            3: [{'attributes': {'text': json.dumps(metadata)}}],
+            4: [{'attributes': {'text': json.dumps(metadata)}}],
+        }
+        scanned = []
+
+        def iter_comments(advs):
+            scanned.append(advs.advisory_id)
+            return comments[advs.advisory_id]
+
+        with nested(
+                mock.patch.object(errata, 'get_filtered_list'),
+                mock.patch.object(errata, 'get_erratum'),
+                mock.patch.object(errata.Erratum, 'iter_comments', autospec=True),
+                # Scan one advisory at a time
+                mock.patch.object(errata.constants, 'errata_max_concurrent_requests', 1)) as (filtered_list, get_erratum, iter_comm, _):
+            filtered_list.side_effect = [advisories, []]
+            # The real advisory 4 has a date (publish_date_override),
+            # the filtered list does not show it
+            real_dates = {3: '2018-02-01T00:00:00Z', 4: '2018-04-01T00:00:00Z'}
+            get_erratum.side_effect = lambda id: advisory(id, real_dates[id])
+            iter_comm.side_effect = iter_comments
+
+            latest = errata.find_latest_erratum('image', 9)
+
+            self.assertEqual(4, latest.advisory_id)
+            # 2 is newer but has no metadata, 1 is listed as older than
+            # 3 so it is never scanned. 4 is listed without a date, it
+            # is always scanned.
+            self.assertEqual([2, 3, 4], scanned)
+
+            # Without a date anywhere an advisory is still a candidate
+            del scanned[:]
+            real_dates[4] = None
+            filtered_list.side_effect = [[advisories[1], advisories[3]], []]
+            self.assertEqual(4, errata.find_latest_erratum('image', 9).advisory_id)
+            self.assertEqual([2, 4], scanned)
+
+            # But it loses to one with a date
+            del scanned[:]
+            filtered_list.side_effect = [advisories, []]
+            self.assertEqual(3, errata.find_latest_erratum('image', 9).advisory_id)
+            self.assertEqual([2, 3, 4], scanned)
+
+    def test_find_latest_erratum_index(self):
+        """Advisories already in the metadata index are not scanned again"""
+        body = copy.deepcopy(test_structures.example_erratum_filtered_list[1])
+        body['synopsis'] = 'OpenShift Container Platform 3.9 images update'
+        body['timestamps']['release_date'] = '2018-03-27T00:00:00Z'
+        advs = errata.Erratum(body=body)
+        metadata = {'release': '3.9', 'kind': 'image', 'impetus': 'standard'}
+        index = errata.MetadataIndex()
+
+        with nested(
+                mock.patch.object(errata, 'get_filtered_list'),
+                mock.patch.object(errata, 'get_erratum'),
+                mock.patch.object(errata.Erratum, 'iter_comments')) as (filtered_list, get_erratum, iter_comments):
+            filtered_list.return_value = [advs]
+            get_erratum.return_value = advs
+            iter_comments.return_value = [{'attributes': {'text': json.dumps(metadata)}}]
+
+            self.assertIs(advs, errata.find_latest_erratum('image', 9, index=index))
+            self.assertIs(advs, errata.find_latest_erratum('image', 9, index=index))
+            self.assertEqual(1, iter_comments.call_count)
+
+            # Once the advisory changes it is scanned again
+            advs.updated_at = '2099-01-01T00:00:00Z'
+            self.assertIs(advs, errata.find_latest_erratum('image', 9, index=index))
+            self.assertEqual(2, iter_comments.call_count)
+
+    def test_iter_comments(self):
+        """Comments are read from every page"""
+        def page(*ids):
+            response = mock.MagicMock(status_code=200)
+            response.json.return_value = {'data': [{'id': i} for i in ids]}
+            return response
+
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            get = client.return_value.get
+            get.side_effect = [page(1, 2), page(3), page()]
+
+            e = errata.Erratum(body=test_structures.example_erratum)
+            self.assertEqual([1, 2, 3], [c['id'] for c in e.iter_comments(page_size=2)])
+            self.assertEqual([1, 2, 3], [call[1]['json']['page']['number'] for call in get.call_args_list])
+
+            # Pages may hold fewer comments than asked for
+            get.side_effect = [page(1, 2), page(3, 4), page()]
+            self.assertEqual([1, 2, 3, 4], [c['id'] for c in e.iter_comments(page_size=100)])
+
+    def test_iter_comments_stops_early(self):
+        """Pages past the one being read ahead are not fetched when iteration stops"""
+        response = mock.MagicMock(status_code=200)
+        response.json.return_value = {'data': [{'id': 1}, {'id': 2}]}
+
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            get = client.return_value.get
+            get.return_value = response
+
+            e = errata.Erratum(body=test_structures.example_erratum)
+            comments = e.iter_comments(page_size=2)
+            self.assertEqual({'id': 1}, next(comments))
+            comments.close()
+            self.assertLessEqual(get.call_count, 2)
+
+    def test_get_comments_failed(self):
+        """get_comments reports failure the way it always has"""
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            client.return_value.get.return_value = mock.MagicMock(status_code=500)
+
+            e = errata.Erratum(body=test_structures.example_erratum)
+            self.assertFalse(e.get_comments())
+
+    def test_metadata_index_persists(self):
+        """The metadata index survives being saved and loaded again"""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'index.json')
+
+        advs = errata.Erratum(body=test_structures.example_erratum_filtered_list[0])
+        metadata = {'release': '3.9', 'kind': 'rpm', 'impetus': 'standard'}
+        index = errata.MetadataIndex(path)
+        index.record(advs, metadata)
+        index.save()
+
+        index = errata.MetadataIndex(path)
+        self.assertEqual((True, metadata), index.lookup(advs))
+
+        index.forget(advs.advisory_id)
+        index.save()
+        self.assertEqual((False, None), errata.MetadataIndex(path).lookup(advs))
+
+    def test_metadata_index_damaged(self):
+        """A damaged metadata index is ignored"""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        path = os.path.join(tmp_dir, 'index.json')
+        with open(path, 'w') as f:
+            f.write('{"advisories": ')
+
+        advs = errata.Erratum(body=test_structures.example_erratum_filtered_list[0])
+        self.assertEqual((False, None), errata.MetadataIndex(path).lookup(advs))
+
     def test_working_erratum(self):
         """We can create an Erratum object with a known erratum from the API"""
         # If there is an error, it will raise on its own during parsing
@@ -146,37 +343,283 @@ class TestBrew(unittest.TestCase):
         e = errata.Erratum(body=test_structures.example_erratum)
         self.assertEqual(type(e), type(errata.Erratum()))
 
+    def test_erratum_lazy(self):
+        """The body is only decoded when an attribute is read"""
+        e = errata.Erratum(body=test_structures.example_erratum_filtered_list[0])
+        self.assertFalse(e._parsed)
+
+        self.assertEqual(test_structures.example_erratum_filtered_list[0]['id'], e.advisory_id)
+        self.assertTrue(e._parsed)
+        self.assertEqual(datetime.datetime(2018, 3, 12), e.release_date)
+        self.assertIsInstance(e.created_at, datetime.datetime)
+
+    def test_erratum_compact(self):
+        """An Erratum can drop its body once decoded"""
+        e = errata.Erratum(body=test_structures.example_erratum, keep_body=False)
+        self.assertIsNone(e.body)
+        self.assertEqual(str(errata.Erratum(body=test_structures.example_erratum)), str(e))
+        self.assertFalse(hasattr(e, '__dict__'))
+
+    def test_erratum_compact_to_json(self):
+        """to_json() refuses to serialize an Erratum which dropped its body"""
+        e = errata.Erratum(body=test_structures.example_erratum, keep_body=False)
+        with self.assertRaises(ValueError):
+            e.to_json()
+
     def test_add_bug(self):
         """Verify Bugs are added the right way"""
-        with nested(
-                mock.patch('errata.requests.post'),
-                # Mock the HTTPKerberosAuth object in the module
-                mock.patch('errata.HTTPKerberosAuth')) as (post, kerb):
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            post = client.return_value.post
             response = mock.MagicMock(status_code=404)
             response.json.return_value = test_structures.example_erratum_filtered_list
             post.return_value = response
 
             b = bugzilla.Bug(id=1337)
-
-            # With the mocked HTTPKerberosAuth object we can now
-            # create an erratum
             e = errata.Erratum(body=test_structures.example_erratum)
 
-            # When we make the method call, we will be using the same
-            # mocked ('kerb') HTTPKerberosAuth object
+            # The request goes through the shared Errata Tool
+            # client, which brings its own authentication
             e.add_bug(b)
 
             post.assert_called_once_with(
                 constants.errata_add_bug_url.format(id=test_structures.example_erratum['content']['content']['errata_id']),
-                auth=kerb(),
                 json={'bug': b.id}
             )
 
+    def test_add_bugs(self):
+        """Verify bulk bug attachment reports successes and failures"""
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            def post(url, json):
+                # Bug 2 is not eligible, every other bug is attached
+                if json['bug'] == 2:
+                    return mock.MagicMock(status_code=422, text='Bug 2 is not eligible')
+                return mock.MagicMock(status_code=201)
+            client.return_value.post.side_effect = post
+
+            e = errata.Erratum(body=test_structures.example_erratum)
+            bugs = [bugzilla.Bug(id=i) for i in [1, 2, 3]]
+            report = e.add_bugs(bugs)
+
+            self.assertEqual([1, 3], sorted([b.id for b in report['added']]))
+            self.assertEqual(1, len(report['failed']))
+            self.assertEqual(2, report['failed'][0]['bug'].id)
+            self.assertEqual(422, report['failed'][0]['status_code'])
+            self.assertEqual('Bug 2 is not eligible', report['failed'][0]['error'])
+            # Client errors are not retried
+            self.assertEqual(3, client.return_value.post.call_count)
+
+    def test_add_bugs_retries_server_errors(self):
+        """Verify bulk bug attachment retries 5xx responses"""
+        with nested(
+                mock.patch.object(errata.errata_client, 'get_client'),
+                mock.patch.object(errata.time, 'sleep')) as (client, sleep):
+            client.return_value.post.side_effect = [
+                mock.MagicMock(status_code=503, text='Unavailable'),
+                mock.MagicMock(status_code=201),
+            ]
+
+            e = errata.Erratum(body=test_structures.example_erratum)
+            report = e.add_bugs([bugzilla.Bug(id=1337)], retries=3)
+
+            self.assertEqual([1337], [b.id for b in report['added']])
+            self.assertEqual([], report['failed'])
+            self.assertEqual(2, client.return_value.post.call_count)
+
+    def test_add_bugs_gives_up(self):
+        """Verify bulk bug attachment stops retrying eventually"""
+        with nested(
+                mock.patch.object(errata.errata_client, 'get_client'),
+                mock.patch.object(errata.time, 'sleep')) as (client, sleep):
+            client.return_value.post.return_value = mock.MagicMock(status_code=500, text='Oops')
+
+            e = errata.Erratum(body=test_structures.example_erratum)
+            report = e.add_bugs([bugzilla.Bug(id=1337)], retries=3)
+
+            self.assertEqual([], report['added'])
+            self.assertEqual(500, report['failed'][0]['status_code'])
+            self.assertEqual(3, client.return_value.post.call_count)
+
+    def test_iter_errata(self):
+        """Ensure every advisory is fetched, missing ones reported as False"""
+        def get_erratum(advisory_id):
+            if advisory_id == 3:
+                return False
+            return errata.Erratum(body=test_structures.example_erratum)
+
+        with mock.patch.object(errata, 'get_erratum', side_effect=get_erratum):
+            results = dict(errata.iter_errata([1, 2, 3], n_threads=2))
+
+        self.assertEqual([1, 2, 3], sorted(results))
+        self.assertIs(False, results[3])
+        self.assertEqual(32916, results[1].advisory_id)
+
+    def test_change_errata_state(self):
+        """Ensure each advisory's state change is reported, failures included"""
+        def get_erratum(advisory_id):
+            if advisory_id == 3:
+                return False
+            erratum = errata.Erratum(body=test_structures.example_erratum)
+            erratum.status = 'NEW_FILES'
+            return erratum
+
+        def change_state(erratum, state):
+            if erratum.advisory_id == 32916 and state == 'REL_PREP':
+                raise exceptions.ErrataToolError('Not ready')
+            erratum.status = state
+
+        with nested(
+                mock.patch.object(errata, 'get_erratum', side_effect=get_erratum),
+                mock.patch.object(errata.Erratum, 'change_state', autospec=True, side_effect=change_state)):
+            results = dict((r[0], r[1:]) for r in errata.change_errata_state([1, 3], 'QE'))
+            failed = list(errata.change_errata_state([2], 'REL_PREP'))
+
+        self.assertEqual(('NEW_FILES', None), (results[1][0], results[1][2]))
+        self.assertEqual('QE', results[1][1].status)
+        self.assertIs(False, results[3][1])
+        self.assertEqual('Could not locate advisory 3', results[3][2])
+        self.assertEqual('Not ready', failed[0][3])
+        self.assertEqual('NEW_FILES', failed[0][2].status)
+
+    def test_watch_errata(self):
+        """Ensure only state changes are reported, until the final state"""
+        states = {
+            1: ['NEW_FILES', 'NEW_FILES', 'QE', 'QE', 'SHIPPED_LIVE'],
+            2: ['REL_PREP', 'SHIPPED_LIVE'],
+        }
+        polls = []
+
+        def poll(advisory_id):
+            polls.append(advisory_id)
+            advisory = errata.Erratum(body=test_structures.example_erratum)
+            advisory.status = states[advisory_id].pop(0)
+            return advisory_id, advisory, None
+
+        with mock.patch.object(errata, '_poll_erratum', side_effect=poll):
+            changes = [(i, previous, advisory.status)
+                       for i, previous, advisory in errata.watch_errata([1, 2], interval=0, max_interval=0)]
+
+        self.assertEqual([
+            (1, None, 'NEW_FILES'),
+            (1, 'NEW_FILES', 'QE'),
+            (1, 'QE', 'SHIPPED_LIVE'),
+        ], [c for c in changes if c[0] == 1])
+        self.assertEqual([(2, None, 'REL_PREP'), (2, 'REL_PREP', 'SHIPPED_LIVE')], [c for c in changes if c[0] == 2])
+        # Nothing is polled once it is shipped
+        self.assertEqual(5, polls.count(1))
+        self.assertEqual(2, polls.count(2))
+
+    def test_watch_errata_poll_failure(self):
+        """Ensure failed polls are tried again"""
+        advisory = errata.Erratum(body=test_structures.example_erratum)
+        advisory.status = 'SHIPPED_LIVE'
+        results = [(1, None, 'Oops'), (1, advisory, None)]
+
+        with mock.patch.object(errata, '_poll_erratum', side_effect=lambda i: results.pop(0)):
+            changes = list(errata.watch_errata([1], interval=0))
+
+        self.assertEqual([(1, None, advisory)], changes)
+
+    def test_poll_erratum_revalidates(self):
+        """Ensure advisories are polled with conditional requests"""
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            response = mock.MagicMock(status_code=200)
+            response.json.return_value = test_structures.example_erratum
+            client.return_value.get.return_value = response
+
+            advisory_id, advisory, error = errata._poll_erratum(32916)
+
+            self.assertEqual(32916, advisory.advisory_id)
+            client.return_value.get.assert_called_once_with(
+                constants.errata_get_erratum_url.format(id=32916), max_age=0)
+
+            client.return_value.get.return_value = mock.MagicMock(status_code=404)
+            with self.assertRaises(exceptions.ErrataToolError):
+                errata._poll_erratum(32916)
+
+    def test_get_builds(self):
+        """Ensure the builds of an advisory are listed under every product version"""
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            response = mock.MagicMock(status_code=200)
+            response.json.return_value = {
+                'RHEL-7-OSE-3.9': {'name': 'RHEL-7-OSE-3.9', 'builds': [
+                    {'coreutils-8.22-21.el7': {'id': 1}},
+                    {'bash-4.2.46-30.el7': {'id': 2}}]},
+                'RHEL-7-OSE-3.9-EXTRAS': {'name': 'RHEL-7-OSE-3.9-EXTRAS', 'builds': [
+                    {'zsh-5.0.2-28.el7': {'id': 3}}]},
+            }
+            client.return_value.get.return_value = response
+
+            nvrs = errata.get_builds(1234)
+
+            self.assertEqual(['bash-4.2.46-30.el7', 'coreutils-8.22-21.el7', 'zsh-5.0.2-28.el7'], sorted(nvrs))
+            client.return_value.get.assert_called_once_with(constants.errata_get_builds_url.format(id=1234))
+
+            client.return_value.get.return_value = mock.MagicMock(status_code=404)
+            with self.assertRaises(exceptions.ErrataToolError):
+                errata.get_builds(1234)
+
+            client.return_value.get.return_value = mock.MagicMock(status_code=401)
+            with self.assertRaises(exceptions.ErrataToolUnauthenticatedException):
+                errata.get_builds(1234)
+
+    def test_get_attached_builds_index(self):
+        """Ensure builds are mapped to every open advisory they are attached to"""
+        advisories = [errata.Erratum(body=row) for row in test_structures.example_erratum_filtered_list]
+        first, second = [a.advisory_id for a in advisories]
+        builds = {
+            first: ['coreutils-8.22-21.el7', 'bash-4.2.46-30.el7'],
+            second: ['bash-4.2.46-30.el7'],
+        }
+        with mock.patch.object(errata, 'get_builds', side_effect=lambda id: builds[id]):
+            index = errata.get_attached_builds_index(advisories, n_threads=2)
+
+        self.assertEqual({
+            'coreutils-8.22-21.el7': set([first]),
+            'bash-4.2.46-30.el7': set([first, second]),
+        }, index)
+        self.assertEqual({}, errata.get_attached_builds_index([]))
+
+    def test_get_open_advisories(self):
+        """Ensure only advisories in an active state are returned"""
+        rows = copy.deepcopy(test_structures.example_erratum_filtered_list)
+        rows[0]['status'] = 'QE'
+        rows[1]['status'] = 'SHIPPED_LIVE'
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            client.return_value.get.return_value = self.filtered_list_response(rows)
+            advisories = errata.get_open_advisories()
+
+        self.assertEqual([rows[0]['id']], [a.advisory_id for a in advisories])
+
+    def test_get_bugs(self):
+        """Ensure the bugs of an advisory are read from the advisory data"""
+        body = copy.deepcopy(test_structures.example_erratum)
+        body['bugs']['bugs'] = [{'bug': {'id': 1337}}, {'bug': {'id': '8675309'}}]
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            response = mock.MagicMock(status_code=200)
+            response.json.return_value = body
+            client.return_value.get.return_value = response
+
+            self.assertEqual([1337, 8675309], errata.get_bugs(1234))
+            client.return_value.get.assert_called_once_with(constants.errata_get_erratum_url.format(id=1234))
+
+            client.return_value.get.return_value = mock.MagicMock(status_code=404)
+            with self.assertRaises(exceptions.ErrataToolError):
+                errata.get_bugs(1234)
+
+    def test_get_attached_bugs_index(self):
+        """Ensure bugs are mapped to the open advisories they are attached to"""
+        advisories = [errata.Erratum(body=row) for row in test_structures.example_erratum_filtered_list]
+        first, second = [a.advisory_id for a in advisories]
+        bugs = {first: [1337, 42], second: [8675309]}
+        with mock.patch.object(errata, 'get_bugs', side_effect=lambda id: bugs[id]):
+            index = errata.get_attached_bugs_index(advisories)
+
+        self.assertEqual({1337: set([first]), 42: set([first]), 8675309: set([second])}, index)
+
     def test_add_builds_success(self):
         """Ensure legit builds are added correctly"""
-        with nested(
-                mock.patch('errata.requests.post'),
-                mock.patch('errata.HTTPKerberosAuth')) as (post, kerb):
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            post = client.return_value.post
             response = mock.MagicMock(status_code=200)
             response.json.return_value = test_structures.example_erratum_filtered_list
             post.return_value = response
@@ -193,8 +636,9 @@ class TestBrew(unittest.TestCase):
 
             result = e.add_builds(builds)
 
-            # add_builds returns True on success
-            self.assertTrue(result)
+            self.assertEqual(builds, result['attached'])
+            self.assertEqual([], result['skipped'])
+            self.assertEqual([], result['rejected'])
             # Even though we have multiple builds, the add_builds
             # endpoint allows us to make just one call, as it
             # accepts a list of builds in the request body
@@ -202,18 +646,15 @@ class TestBrew(unittest.TestCase):
 
             post.assert_called_once_with(
                 constants.errata_add_builds_url.format(id=test_structures.example_erratum['content']['content']['errata_id']),
-                auth=kerb(),
                 json=[b1.to_json(), b2.to_json()]
             )
 
     def test_add_builds_failure(self):
-        """Ensure failing add_builds raises correctly on a known bad status code"""
-        with nested(
-                mock.patch('errata.requests.post'),
-                mock.patch('errata.HTTPKerberosAuth')) as (post, kerb):
+        """Ensure builds rejected by the Errata Tool are reported"""
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            post = client.return_value.post
             # This triggers the failure code-branch
-            response = mock.MagicMock(status_code=422)
-            response.json.return_value = test_structures.example_erratum_filtered_list
+            response = mock.MagicMock(status_code=422, text='Build is invalid')
             post.return_value = response
 
             pv = 'rhaos-test-7'
@@ -226,30 +667,131 @@ class TestBrew(unittest.TestCase):
                             product_version=pv)
             builds = [b1, b2]
 
-            with self.assertRaises(exceptions.BrewBuildException):
-                e.add_builds(builds)
-
-    # Commented out until we update add_builds to handle non-422 response codes
-    # def test_add_builds_failure(self):
-    #     """Ensure failing add_builds raises correctly on an unknown bad status code"""
-    #     with mock.patch('errata.requests.post') as post:
-    #         # This triggers the failure code-branch
-    #         response = mock.MagicMock(status_code=500)
-    #         response.json.return_value = example_erratum_filtered_list
-    #         post.return_value = response
-    #         with mock.patch('errata.HTTPKerberosAuth') as kerb:
-    #             pv = 'rhaos-test-7'
-    #             e = errata.Erratum(body=example_erratum)
-    #             b1 = brew.Build(nvr='coreutils-8.22-21.el7',
-    #                             body=rpm_build_attached_json,
-    #                             product_version=pv)
-    #             b2 = brew.Build(nvr='ansible-service-broker-1.0.21-1.el7',
-    #                             body=rpm_build_unattached_json,
-    #                             product_version=pv)
-    #             builds = [b1, b2]
-
-    #             with self.assertRaises(exceptions.BrewBuildException):
-    #                 result = e.add_builds(builds)
+            result = e.add_builds(builds)
+
+            self.assertEqual([], result['attached'])
+            self.assertEqual(builds, [r['build'] for r in result['rejected']])
+            self.assertEqual(422, result['rejected'][0]['status_code'])
+            self.assertEqual('Build is invalid', result['rejected'][0]['error'])
+            # The pair, then each build on its own
+            self.assertEqual(3, post.call_count)
+
+    def test_add_builds_bisect(self):
+        """Ensure one bad build does not stop the rest being attached"""
+        pv = 'rhaos-test-7'
+        builds = [brew.Build(nvr='pkg{}-1.0-1.el7'.format(i),
+                             body=test_structures.rpm_build_unattached_json,
+                             product_version=pv)
+                  for i in range(10)]
+        bad = builds[6].to_json()
+
+        def post(url, json):
+            if bad in json:
+                return mock.MagicMock(status_code=422, text='Bad build')
+            return mock.MagicMock(status_code=201)
+
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            client.return_value.post.side_effect = post
+            e = errata.Erratum(body=test_structures.example_erratum)
+
+            result = e.add_builds(builds, chunk_size=4, n_threads=2)
+
+            self.assertEqual(builds[:6] + builds[7:], result['attached'])
+            self.assertEqual([builds[6]], [r['build'] for r in result['rejected']])
+            # Chunks of 4, 4 and 2, the second bisected down to the bad build
+            self.assertTrue(all(len(c[1]['json']) <= 4 for c in client.return_value.post.call_args_list))
+
+    def test_add_builds_advisory_refused(self):
+        """Ensure a chunk is not bisected when the advisory refuses every build"""
+        builds = [brew.Build(nvr='pkg{}-1.0-1.el7'.format(i),
+                             body=test_structures.rpm_build_unattached_json,
+                             product_version='rhaos-test-7')
+                  for i in range(8)]
+
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            client.return_value.post.return_value = mock.MagicMock(
+                status_code=422, text='Advisory is not in NEW_FILES state')
+            e = errata.Erratum(body=test_structures.example_erratum)
+
+            result = e.add_builds(builds, chunk_size=8)
+
+            self.assertEqual([], result['attached'])
+            self.assertEqual(builds, [r['build'] for r in result['rejected']])
+            self.assertEqual('Advisory is not in NEW_FILES state', result['rejected'][0]['error'])
+            # The chunk, then each half of it
+            self.assertEqual(3, client.return_value.post.call_count)
+
+    def test_add_builds_retry_already_attached(self):
+        """Ensure builds are reported attached when a request which lost
+        its connection went through after all"""
+        with nested(
+                mock.patch.object(errata.errata_client, 'get_client'),
+                mock.patch.object(errata.time, 'sleep')) as (client, sleep):
+            client.return_value.post.side_effect = [
+                errata.requests.exceptions.ConnectionError('Connection reset by peer'),
+                mock.MagicMock(status_code=422, text='Build coreutils-8.22-21.el7 has already been added to this advisory'),
+            ]
+            e = errata.Erratum(body=test_structures.example_erratum)
+            b = brew.Build(nvr='coreutils-8.22-21.el7',
+                           body=test_structures.rpm_build_unattached_json,
+                           product_version='rhaos-test-7')
+
+            result = e.add_builds([b], retries=3)
+
+            self.assertEqual([b], result['attached'])
+            self.assertEqual([], result['rejected'])
+            self.assertEqual(2, client.return_value.post.call_count)
+
+    def test_add_builds_skipped(self):
+        """Ensure builds already attached, or given twice, are skipped"""
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            client.return_value.post.return_value = mock.MagicMock(status_code=201)
+            pv = 'rhaos-test-7'
+            e = errata.Erratum(body=test_structures.example_erratum)
+            attached = brew.Build(nvr='coreutils-8.22-21.el7',
+                                  body=copy.deepcopy(test_structures.rpm_build_attached_json),
+                                  product_version=pv)
+            attached.all_errata[0]['id'] = e.advisory_id
+            new = brew.Build(nvr='ansible-service-broker-1.0.21-1.el7',
+                             body=test_structures.rpm_build_unattached_json,
+                             product_version=pv)
+
+            result = e.add_builds([attached, new, new])
+
+            self.assertEqual([new], result['attached'])
+            self.assertEqual([attached, new], result['skipped'])
+            client.return_value.post.assert_called_once_with(
+                constants.errata_add_builds_url.format(id=e.advisory_id),
+                json=[new.to_json()])
+
+    def test_add_builds_unauthenticated(self):
+        """Ensure add_builds gives up when the user is not authenticated"""
+        with mock.patch.object(errata.errata_client, 'get_client') as client:
+            client.return_value.post.return_value = mock.MagicMock(status_code=401)
+            e = errata.Erratum(body=test_structures.example_erratum)
+            b = brew.Build(nvr='coreutils-8.22-21.el7',
+                           body=test_structures.rpm_build_unattached_json,
+                           product_version='rhaos-test-7')
+
+            with self.assertRaises(exceptions.ErrataToolUnauthenticatedException):
+                e.add_builds([b])
+
+    def test_add_builds_server_error(self):
+        """Ensure add_builds retries server errors, then reports the builds rejected"""
+        with nested(
+                mock.patch.object(errata.errata_client, 'get_client'),
+                mock.patch.object(errata.time, 'sleep')) as (client, sleep):
+            client.return_value.post.return_value = mock.MagicMock(status_code=500, text='Oops')
+            e = errata.Erratum(body=test_structures.example_erratum)
+            b = brew.Build(nvr='coreutils-8.22-21.el7',
+                           body=test_structures.rpm_build_unattached_json,
+                           product_version='rhaos-test-7')
+
+            result = e.add_builds([b], retries=3)
+
+            self.assertEqual([], result['attached'])
+            self.assertEqual(500, result['rejected'][0]['status_code'])
+            self.assertEqual(3, client.return_value.post.call_count)
 
 
 if __name__ == '__main__':
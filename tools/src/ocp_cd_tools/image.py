@@ -7,7 +7,7 @@ from metadata import Metadata
 from model import Missing
 from pushd import Dir
 
-import assertion
+import brew
 import constants
 import logutil
 import exectools
@@ -17,6 +17,37 @@ import logutil
 logger = logutil.getLogger(__name__)
 
 
+def get_latest_build_infos(image_metas, refresh=False):
+    """
+    Determines the most recently built release of the components
+    associated with many images. See
+    ImageMetadata.get_latest_build_info.
+
+    The answers come from a snapshot of each image's candidate tag,
+    loaded from brew once per run (see brew.get_tag_snapshot).
+
+    :param list image_metas: A list of ImageMetadata
+    :param bool refresh: Ask brew again instead of trusting the
+    snapshot, e.g., right after building the images
+    :return: A list of (component name, version, release) tuples, in
+    the same order as `image_metas`
+    :raises IOError: If an image has no builds
+    """
+    infos = []
+    for meta in image_metas:
+        tag = "{}-candidate".format(meta.branch())
+        component_name = meta.get_component_name()
+        snapshot = brew.get_tag_snapshot(tag, type='image', inherit=True)
+        if refresh:
+            build = snapshot.refresh_package(component_name)
+        else:
+            build = snapshot.latest_build(component_name)
+        if build is None:
+            raise IOError("No builds detected for %s using tag: %s" % (meta.qualified_name, tag))
+        infos.append((build['name'], build['version'], build['release']))
+    return infos
+
+
 YUM_NON_FLAGS = [
     '-c', '--config',
     '--installroot',
@@ -133,36 +164,18 @@ class ImageMetadata(Metadata):
 
         return [str(r) for r in rpms]  # strip unicode
 
-    def get_latest_build_info(self):
+    def get_latest_build_info(self, refresh=False):
 
         """
         Queries brew to determine the most recently built release of the component
         associated with this image. This method does not rely on the "release"
         label needing to be present in the Dockerfile.
 
+        :param bool refresh: Ask brew again, rather than answer from the
+        snapshot of the tag loaded earlier in this run
         :return: A tuple: (component name, version, release); e.g. ("registry-console-docker", "v3.6.173.0.75", "1")
         """
-
-        component_name = self.get_component_name()
-
-        tag = "{}-candidate".format(self.branch())
-
-        rc, stdout, stderr = exectools.cmd_gather(["brew", "latest-build", tag, component_name])
-
-        assertion.success(rc, "Unable to search brew builds: %s" % stderr)
-
-        latest = stdout.strip().splitlines()[-1].split(' ')[0]
-
-        if not latest.startswith(component_name):
-            # If no builds found, `brew latest-build` output will appear as:
-            # Build                                     Tag                   Built by
-            # ----------------------------------------  --------------------  ----------------
-            raise IOError("No builds detected for %s using tag: %s" % (self.qualified_name, tag))
-
-        # latest example: "registry-console-docker-v3.6.173.0.75-1""
-        name, version, release = latest.rsplit("-", 2)  # [ "registry-console-docker", "v3.6.173.0.75", "1"]
-
-        return name, version, release
+        return get_latest_build_infos([self], refresh)[0]
 
     def pull_url(self):
         # Don't trust what is the Dockerfile for version & release. This field may not even be present.
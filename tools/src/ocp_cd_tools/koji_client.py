@@ -0,0 +1,141 @@
+"""
+A pool of koji ClientSessions for Brew.
+
+Every call elliott makes to the Brew hub should go through the shared
+SessionPool returned by get_pool(), rather than through the brew
+command line client. Each session keeps its connection to the hub (and
+its login, once it has one) open for the next call, and is used by one
+thread at a time, so there is no interpreter to start, nothing to
+authenticate again and no text output to parse for every query.
+
+Many queries at once are best sent with SessionPool.multicall(), which
+batches them into a few koji multicall requests:
+
+    pool = koji_client.get_pool()
+    builds = pool.multicall([('getBuild', [nvr], {}) for nvr in nvrs])
+
+Calls are admitted by the 'brew' admission controller (see
+throttle.py), which backs off when the hub struggles.
+"""
+
+# stdlib
+import contextlib
+from multiprocessing import Lock
+
+# ours
+import constants
+import logutil
+import throttle
+
+# 3rd party
+import koji
+
+logger = logutil.getLogger(__name__)
+
+# The shared pool, created on first use by get_pool()
+_pool = None
+# Protects creation of the shared pool
+_pool_lock = Lock()
+
+
+class SessionPool(object):
+    """
+    Hands out koji ClientSessions to the hub, one thread at a
+    time. Sessions are created as they are needed and kept for reuse,
+    at most `size` of them idle at once. A session is only kept if the
+    `with` block using it completes without raising.
+    """
+    def __init__(self, hub=constants.BREW_HUB, size=constants.brew_session_pool_size):
+        """
+        :param str hub: The URL of the koji hub
+        :param int size: The most idle sessions to keep around
+        """
+        self.hub = hub
+        self.size = size
+        self._idle = []
+        self._lock = Lock()
+
+    @contextlib.contextmanager
+    def session(self, login=False):
+        """A session for the duration of a `with` block
+
+        :param bool login: Log the session in (kerberos) if it is not
+        yet, for calls which need to be authenticated
+        """
+        with self._lock:
+            session = self._idle.pop() if self._idle else None
+        if session is None:
+            logger.debug("Creating koji session to {}".format(self.hub))
+            session = koji.ClientSession(self.hub)
+
+        if login and not session.logged_in:
+            session.gssapi_login()
+
+        # If the block raises we never get past this, the session is
+        # dropped rather than handed on in an unknown state, e.g., with
+        # calls queued for a multicall which never went out
+        yield session
+
+        with self._lock:
+            if len(self._idle) < self.size:
+                self._idle.append(session)
+
+    def call(self, method, *args, **kwargs):
+        """Call a single hub method
+
+        :param str method: The name of the hub method, e.g., 'getBuild'
+        :return: What the method returns
+        :raises koji.GenericError: Or a subclass, if the call failed
+        """
+        with self.session() as session:
+            with throttle.get('brew').admit(method):
+                return getattr(session, method)(*args, **kwargs)
+
+    def multicall(self, calls, batch_size=constants.brew_multicall_batch_size, strict=True):
+        """Call many hub methods, `batch_size` calls per request to the
+        hub
+
+        :param list calls: A list of (method, args, kwargs) tuples
+        :param int batch_size: How many calls to send in one request
+        :param bool strict: Raise the error of the first call which
+        failed. Otherwise failed calls give their error in place of a
+        result.
+
+        :return: A list of the results of `calls`, in the same order
+        :raises koji.GenericError: Or a subclass, if `strict` and a
+        call failed
+        """
+        results = []
+        with self.session() as session:
+            for i in range(0, len(calls), batch_size):
+                session.multicall = True
+                for method, args, kwargs in calls[i:i + batch_size]:
+                    getattr(session, method)(*args, **kwargs)
+                # Named after the first call, a batch is usually many
+                # calls of the same method
+                with throttle.get('brew').admit('multiCall ' + calls[i][0]):
+                    batch = session.multiCall()
+
+                for entry in batch:
+                    # Each entry is a list holding the result, or a
+                    # dict describing the fault
+                    if isinstance(entry, dict):
+                        error = koji.convertFault(koji.Fault(entry['faultCode'], entry['faultString']))
+                        if strict:
+                            raise error
+                        results.append(error)
+                    else:
+                        results.append(entry[0])
+        return results
+
+
+def get_pool():
+    """
+    :return: The SessionPool shared by the whole process. It is
+    created the first time this is called.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = SessionPool()
+        return _pool
@@ -0,0 +1,100 @@
+"""
+Test the pool of koji sessions
+"""
+
+import mock
+
+# Import the right version for your python
+import platform
+(major, minor, patch) = platform.python_version_tuple()
+if int(major) == 2 and int(minor) < 7:
+    import unittest2 as unittest
+else:
+    import unittest
+
+import koji_client
+
+
+class FakeSession(object):
+    """Enough of a koji.ClientSession. Every hub method returns its
+    first argument, except 'fail' which fails."""
+
+    def __init__(self, hub):
+        self.hub = hub
+        self.multicall = False
+        self.logged_in = False
+        self.queued = []
+        self.requests = 0
+
+    def __getattr__(self, method):
+        def call(*args, **kwargs):
+            if self.multicall:
+                self.queued.append((method, args))
+                return None
+            self.requests += 1
+            return args[0]
+        return call
+
+    def multiCall(self):
+        self.requests += 1
+        self.multicall = False
+        queued, self.queued = self.queued, []
+        return [{'faultCode': 1000, 'faultString': 'failed'} if method == 'fail' else [args[0]]
+                for method, args in queued]
+
+
+class TestSessionPool(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(koji_client.koji, 'ClientSession', side_effect=FakeSession)
+        self.client_session = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sessions_reused(self):
+        """A session is handed out again once it is free"""
+        pool = koji_client.SessionPool(hub='https://hub.example.com')
+        with pool.session() as first:
+            with pool.session() as second:
+                self.assertIsNot(first, second)
+        with pool.session() as third:
+            self.assertIn(third, [first, second])
+        self.assertEqual(2, self.client_session.call_count)
+
+    def test_session_dropped_on_error(self):
+        """A session whose user raised is not handed out again"""
+        pool = koji_client.SessionPool(hub='https://hub.example.com')
+        with self.assertRaises(ValueError):
+            with pool.session() as first:
+                raise ValueError()
+        with pool.session() as second:
+            self.assertIsNot(first, second)
+
+    def test_multicall_batches(self):
+        """Calls are sent batch_size at a time, results come back in order"""
+        pool = koji_client.SessionPool(hub='https://hub.example.com')
+        results = pool.multicall([('getBuild', [i], {}) for i in range(25)], batch_size=10)
+
+        self.assertEqual(range(25), results)
+        with pool.session() as session:
+            self.assertEqual(3, session.requests)
+
+    def test_multicall_strict(self):
+        """A failed call raises, unless asked not to"""
+        pool = koji_client.SessionPool(hub='https://hub.example.com')
+        calls = [('getBuild', ['a-1-1'], {}), ('fail', ['b-1-1'], {})]
+
+        with self.assertRaises(koji_client.koji.GenericError):
+            pool.multicall(calls)
+
+        results = pool.multicall(calls, strict=False)
+        self.assertEqual('a-1-1', results[0])
+        self.assertIsInstance(results[1], koji_client.koji.GenericError)
+
+    def test_call(self):
+        """Single calls go straight to the hub"""
+        pool = koji_client.SessionPool(hub='https://hub.example.com')
+        self.assertEqual('a-1-1', pool.call('getBuild', 'a-1-1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
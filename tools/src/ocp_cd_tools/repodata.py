@@ -0,0 +1,220 @@
+"""
+In-memory indexes of the packages in yum repositories.
+
+Asking a yum repository what provides a capability with repoquery
+downloads and parses the repository metadata every time. A RepoIndex
+reads the metadata (repodata/repomd.xml, then the primary.xml it points
+to) once and answers any number of `whatprovides` questions from
+memory:
+
+    index = repodata.get_repo_index(baseurl)
+    names = index.whatprovides('bash', 'x86_64')
+
+The index answers lookups of capability names and globs over them.
+Versioned provides (e.g., 'bash >= 4') and file paths listed only in
+filelists.xml are not in it, those lookups (and any other the index
+finds nothing for) are passed on to repoquery, with a warning.
+
+get_repo_index() shares one index per repository across the process,
+so every thread asking about the same repository waits for it to be
+loaded once.
+"""
+
+# stdlib
+import fnmatch
+import gzip
+import tempfile
+import xml.etree.cElementTree as ElementTree
+from multiprocessing import Lock
+
+# ours
+import exectools
+import logutil
+
+# 3rd party
+import requests
+
+logger = logutil.getLogger(__name__)
+
+REPO_NS = '{http://linux.duke.edu/metadata/repo}'
+COMMON_NS = '{http://linux.duke.edu/metadata/common}'
+RPM_NS = '{http://linux.duke.edu/metadata/rpm}'
+
+# Populated by get_repo_index. Each repository base url is a key in the
+# dict and each value is the RepoIndex for it
+_repo_indexes = {}
+# Protects threaded access to _repo_indexes
+_repo_indexes_lock = Lock()
+
+
+def repoquery_whatprovides(baseurl, name, arch):
+    """Ask repoquery which packages of a repository provide a
+    capability, reading the repository metadata from scratch
+
+    :param str baseurl: The base url of the repository
+    :param str name: A capability, as repoquery --whatprovides takes it
+    :param str arch: CPU architecture to search, noarch packages are
+    always included
+    :return: A sorted list of package names
+    :raises ValueError: If repoquery failed
+    """
+    rc, stdout, stderr = exectools.cmd_gather([
+        'repoquery', '--repofrompath', 'foo,{}'.format(baseurl), '--repoid=foo',
+        '--arch', '{},noarch'.format(arch), '--whatprovides', name])
+    if rc != 0:
+        raise ValueError(stderr)
+    # name-epoch:version-release.arch
+    return sorted(set('-'.join(rpm.split(':')[0].split('-')[:-1]) for rpm in stdout.strip().splitlines()))
+
+
+def get_repo_index(baseurl):
+    """The RepoIndex of a repository, shared by the whole process. It
+    is loaded the first time it is asked for, later calls answer from
+    memory.
+
+    :param str baseurl: The base url of the repository, the one
+    holding repodata/
+    :return: A loaded RepoIndex
+    :raises ValueError: If the repository metadata could not be read
+    """
+    with _repo_indexes_lock:
+        if baseurl not in _repo_indexes:
+            _repo_indexes[baseurl] = RepoIndex(baseurl)
+        index = _repo_indexes[baseurl]
+    index.load()
+    return index
+
+
+class RepoIndex(object):
+    """
+    What the packages of one yum repository provide, as listed in its
+    primary metadata: their provides entries, and the files listed
+    there (binaries and config files, which is what file dependencies
+    are usually on).
+    """
+    def __init__(self, baseurl, chunk_size=64 * 1024):
+        """
+        :param str baseurl: The base url of the repository, the one
+        holding repodata/
+        :param int chunk_size: How much of the metadata to download at
+        a time
+        """
+        self.baseurl = baseurl.rstrip('/')
+        self.chunk_size = chunk_size
+        # Capability (a provides name or a file path) => set of
+        # (package name, arch)
+        self.provides = None
+        self._lock = Lock()
+
+    def load(self, reload=False):
+        """Read the metadata of the repository, unless it has been
+        already
+
+        :param bool reload: Read it again even if it has been
+        :raises ValueError: If the metadata could not be read
+        """
+        with self._lock:
+            if self.provides is not None and not reload:
+                return
+            href = self._primary_href()
+            if not href.endswith(('.xml', '.xml.gz')):
+                raise ValueError("Unsupported primary metadata in {}: {}".format(self.baseurl, href))
+            with tempfile.TemporaryFile() as primary:
+                self._download(href, primary)
+                primary.seek(0)
+                try:
+                    if href.endswith('.gz'):
+                        self.provides = self.parse_primary(gzip.GzipFile(fileobj=primary, mode='rb'))
+                    else:
+                        self.provides = self.parse_primary(primary)
+                except (IOError, SyntaxError) as e:
+                    raise ValueError("Could not parse {}/{}: {}".format(self.baseurl, href, e))
+            logger.debug("Indexed {n} capabilities provided in {url}".format(n=len(self.provides), url=self.baseurl))
+
+    def whatprovides(self, name, arch, fallback=True):
+        """The packages providing a capability, as `repoquery --arch
+        {arch},noarch --whatprovides {name}` would find them
+
+        :param str name: A capability, e.g., 'bash', 'libc.so.6()(64bit)',
+        '/usr/bin/python' or a glob like 'python-*'
+        :param str arch: CPU architecture to search, noarch packages are
+        always included
+        :param bool fallback: Ask repoquery when the index finds nothing
+        :return: A sorted list of package names
+        :raises ValueError: If repoquery was asked and failed
+        """
+        if any(c in name for c in '*?['):
+            packages = set(p for capability in fnmatch.filter(self.provides, name)
+                           for p in self.provides[capability])
+        else:
+            packages = self.provides.get(name, ())
+        names = sorted(set(n for n, a in packages if a in (arch, 'noarch')))
+        if names or not fallback:
+            return names
+
+        # Versioned provides and files only listed in filelists.xml
+        # are not indexed, nor is what does not exist at all
+        logger.warning("Nothing in the index of {url} provides {name} for {arch}, asking repoquery".format(
+            url=self.baseurl, name=name, arch=arch))
+        return repoquery_whatprovides(self.baseurl, name, arch)
+
+    @staticmethod
+    def parse_primary(f):
+        """Index the packages listed in primary metadata
+
+        :param file f: The primary.xml, uncompressed
+        :return: A dict mapping each capability to a set of (package
+        name, arch)
+        """
+        provides = {}
+        for event, elem in ElementTree.iterparse(f):
+            if elem.tag != COMMON_NS + 'package':
+                continue
+            package = (elem.findtext(COMMON_NS + 'name'), elem.findtext(COMMON_NS + 'arch'))
+            capabilities = set([package[0]])
+            fmt = elem.find(COMMON_NS + 'format')
+            if fmt is not None:
+                capabilities.update(e.get('name') for e in fmt.iterfind('{0}provides/{0}entry'.format(RPM_NS)))
+                capabilities.update(e.text for e in fmt.iterfind(COMMON_NS + 'file'))
+            for capability in capabilities:
+                provides.setdefault(capability, set()).add(package)
+            # Packages are parsed one at a time, don't keep them all
+            elem.clear()
+        return provides
+
+    def _primary_href(self):
+        """
+        :return: The location of the primary metadata, relative to the
+        base url, as given in repomd.xml
+        """
+        url = '{}/repodata/repomd.xml'.format(self.baseurl)
+        try:
+            res = requests.get(url)
+        except requests.RequestException as e:
+            raise ValueError("Could not read {}: {}".format(url, e))
+        if res.status_code != 200:
+            raise ValueError("Could not read {}: {} {}".format(url, res.status_code, res.reason))
+        try:
+            repomd = ElementTree.fromstring(res.content)
+        except SyntaxError as e:
+            raise ValueError("Could not parse {}: {}".format(url, e))
+        for data in repomd.iterfind(REPO_NS + 'data'):
+            if data.get('type') == 'primary':
+                return data.find(REPO_NS + 'location').get('href')
+        raise ValueError("No primary metadata listed in {}".format(url))
+
+    def _download(self, href, f):
+        """Download a file of the repository
+
+        :param str href: Its location, relative to the base url
+        :param file f: Where to write it
+        """
+        url = '{}/{}'.format(self.baseurl, href)
+        try:
+            res = requests.get(url, stream=True)
+            if res.status_code != 200:
+                raise ValueError("Could not download {}: {} {}".format(url, res.status_code, res.reason))
+            for chunk in res.iter_content(self.chunk_size):
+                f.write(chunk)
+        except requests.RequestException as e:
+            raise ValueError("Could not download {}: {}".format(url, e))
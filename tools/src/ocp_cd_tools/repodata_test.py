@@ -0,0 +1,164 @@
+"""
+Test the yum repository indexes
+"""
+
+import gzip
+import StringIO
+
+import mock
+
+# Import the right version for your python
+import platform
+(major, minor, patch) = platform.python_version_tuple()
+if int(major) == 2 and int(minor) < 7:
+    import unittest2 as unittest
+else:
+    import unittest
+
+import repodata
+
+REPOMD = """<?xml version="1.0" encoding="UTF-8"?>
+<repomd xmlns="http://linux.duke.edu/metadata/repo" xmlns:rpm="http://linux.duke.edu/metadata/rpm">
+  <revision>1530000000</revision>
+  <data type="filelists">
+    <location href="repodata/0123-filelists.xml.gz"/>
+  </data>
+  <data type="primary">
+    <location href="repodata/4567-primary.xml.gz"/>
+  </data>
+</repomd>
+"""
+
+PRIMARY = """<?xml version="1.0" encoding="UTF-8"?>
+<metadata xmlns="http://linux.duke.edu/metadata/common" xmlns:rpm="http://linux.duke.edu/metadata/rpm" packages="3">
+<package type="rpm">
+  <name>bash</name>
+  <arch>x86_64</arch>
+  <format>
+    <rpm:provides>
+      <rpm:entry name="bash"/>
+      <rpm:entry name="config(bash)" flags="EQ" epoch="0" ver="4.2.46" rel="30.el7"/>
+    </rpm:provides>
+    <file>/usr/bin/sh</file>
+  </format>
+</package>
+<package type="rpm">
+  <name>bash</name>
+  <arch>ppc64le</arch>
+  <format>
+    <file>/usr/bin/sh</file>
+  </format>
+</package>
+<package type="rpm">
+  <name>python-six</name>
+  <arch>noarch</arch>
+  <format>
+    <rpm:provides>
+      <rpm:entry name="python2-six"/>
+    </rpm:provides>
+  </format>
+</package>
+</metadata>
+"""
+
+
+def gzipped(data):
+    out = StringIO.StringIO()
+    with gzip.GzipFile(fileobj=out, mode='wb') as f:
+        f.write(data)
+    return out.getvalue()
+
+
+def response(content, status_code=200):
+    res = mock.MagicMock(status_code=status_code, content=content, reason='OK')
+    res.iter_content.return_value = [content[i:i + 100] for i in range(0, len(content), 100)]
+    return res
+
+
+class TestRepoIndex(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch.object(repodata, '_repo_indexes', {})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_parse_primary(self):
+        """Packages provide their name, provides entries and files"""
+        provides = repodata.RepoIndex.parse_primary(StringIO.StringIO(PRIMARY))
+
+        self.assertEqual(set([('bash', 'x86_64'), ('bash', 'ppc64le')]), provides['bash'])
+        self.assertEqual(set([('bash', 'x86_64')]), provides['config(bash)'])
+        self.assertEqual(set([('bash', 'x86_64'), ('bash', 'ppc64le')]), provides['/usr/bin/sh'])
+        self.assertEqual(set([('python-six', 'noarch')]), provides['python2-six'])
+
+    def test_whatprovides(self):
+        """Lookups only find packages of the arch asked for, or noarch"""
+        index = repodata.RepoIndex('http://example.com/repo/x86_64')
+        index.provides = repodata.RepoIndex.parse_primary(StringIO.StringIO(PRIMARY))
+
+        self.assertEqual(['bash'], index.whatprovides('/usr/bin/sh', 'x86_64'))
+        self.assertEqual([], index.whatprovides('config(bash)', 'ppc64le', fallback=False))
+        self.assertEqual(['python-six'], index.whatprovides('python2-six', 's390x'))
+        self.assertEqual([], index.whatprovides('zsh', 'x86_64', fallback=False))
+
+    def test_whatprovides_glob(self):
+        """Globs are matched against every capability"""
+        index = repodata.RepoIndex('http://example.com/repo/x86_64')
+        index.provides = repodata.RepoIndex.parse_primary(StringIO.StringIO(PRIMARY))
+
+        self.assertEqual(['bash', 'python-six'], index.whatprovides('*', 'x86_64'))
+        self.assertEqual(['python-six'], index.whatprovides('python?-six', 'x86_64'))
+        self.assertEqual(['bash'], index.whatprovides('/usr/bin/s[h]', 'ppc64le'))
+
+    def test_whatprovides_fallback(self):
+        """What the index can not answer is asked of repoquery"""
+        index = repodata.RepoIndex('http://example.com/repo/x86_64')
+        index.provides = repodata.RepoIndex.parse_primary(StringIO.StringIO(PRIMARY))
+
+        with mock.patch.object(repodata.exectools, 'cmd_gather') as cmd_gather:
+            cmd_gather.return_value = (0, 'bash-0:4.2.46-30.el7.x86_64\n', '')
+            self.assertEqual(['bash'], index.whatprovides('bash >= 4', 'x86_64'))
+            cmd_gather.assert_called_once_with([
+                'repoquery', '--repofrompath', 'foo,http://example.com/repo/x86_64', '--repoid=foo',
+                '--arch', 'x86_64,noarch', '--whatprovides', 'bash >= 4'])
+
+            # Answered from the index
+            index.whatprovides('bash', 'x86_64')
+            self.assertEqual(1, cmd_gather.call_count)
+
+            cmd_gather.return_value = (1, '', 'Cannot retrieve repository metadata')
+            with self.assertRaises(ValueError):
+                index.whatprovides('/usr/lib64/libfoo.so', 'x86_64')
+
+    def test_get_repo_index(self):
+        """The metadata of a repository is read once"""
+        with mock.patch.object(repodata.requests, 'get') as get:
+            get.side_effect = [response(REPOMD), response(gzipped(PRIMARY))]
+
+            first = repodata.get_repo_index('http://example.com/repo/x86_64/')
+            second = repodata.get_repo_index('http://example.com/repo/x86_64/')
+
+        self.assertIs(first, second)
+        self.assertEqual(['bash'], second.whatprovides('bash', 'x86_64'))
+        get.assert_has_calls([
+            mock.call('http://example.com/repo/x86_64/repodata/repomd.xml'),
+            mock.call('http://example.com/repo/x86_64/repodata/4567-primary.xml.gz', stream=True),
+        ])
+        self.assertEqual(2, get.call_count)
+
+    def test_load_failed(self):
+        """Unreadable repositories raise ValueError"""
+        index = repodata.RepoIndex('http://example.com/repo/x86_64')
+        with mock.patch.object(repodata.requests, 'get') as get:
+            get.return_value = response('Not Found', status_code=404)
+            with self.assertRaises(ValueError):
+                index.load()
+
+            get.side_effect = [response(REPOMD), response('not gzipped')]
+            with self.assertRaises(ValueError):
+                index.load()
+        self.assertIsNone(index.provides)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,7 @@ import traceback
 
 import exectools
 from pushd import Dir
-from brew import watch_task
+from brew import watch_task, collect_task_logs
 
 from metadata import Metadata
 from model import Missing
@@ -225,15 +225,12 @@ class RPMMetadata(Metadata):
             record["task_url"] = task_url
 
             # Now that we have the basics about the task, wait for it to complete
-            error = watch_task(self.logger.info, task_id, terminate_event)
+            error = watch_task(self.logger.info, task_id, terminate_event, package=self.rpm_name)
 
-            # Gather brew-logs
+            # Gather brew-logs in the background, the build result need not
+            # wait for them
             logs_dir = "%s/%s" % (self.runtime.brew_logs_dir, self.name)
-            logs_rc, _, logs_err = exectools.cmd_gather(
-                ["brew", "download-logs", "-d", logs_dir, task_id])
-
-            if logs_rc != 0:
-                self.logger.info("Error downloading build logs from brew for task %s: %s" % (task_id, logs_err))
+            collect_task_logs(task_id, logs_dir, callback=self._task_logs_collected)
 
             if error is not None:
                 # An error occurred. We don't have a viable build.
@@ -243,6 +240,13 @@ class RPMMetadata(Metadata):
             self.logger.info("Successfully built rpm: {} ; {}".format(self.rpm_name, task_url))
         return True
 
+    def _task_logs_collected(self, collection):
+        """Called by the brew log collector once the logs of a build task are downloaded, or failed to"""
+        if collection.error is not None:
+            self.logger.info("Error downloading build logs from brew for task %s: %s" % (collection.task_id, collection.error))
+        else:
+            self.logger.debug("Downloaded %d build logs from brew for task %s" % (len(collection.paths), collection.task_id))
+
     def build_rpm(
             self, version, release, terminate_event, scratch=False, retries=3):
         self.set_nvr(version, release)
@@ -211,6 +211,12 @@ class Runtime(object):
         if not os.path.isdir(self.sources_dir):
             os.mkdir(self.sources_dir)
 
+        # Data kept between invocations in the same working-dir to
+        # save repeating expensive lookups
+        self.cache_dir = os.path.join(self.working_dir, "cache")
+        if not os.path.isdir(self.cache_dir):
+            os.mkdir(self.cache_dir)
+
         if disabled is not None:
             self.disabled = disabled
 
@@ -639,7 +639,7 @@ rpm_build_unattached_json = {
 #
 #     $ brew list-tagged rhaos-3.9-rhel-7-candidate --latest --type=image --quiet
 #
-# Used for mocking brew.get_tagged_image_builds()
+# Used for mocking the listing of image builds in a tag
 brew_list_tagged_3_9_image_builds = """aos-f5-router-docker-v3.9.15-1            rhaos-3.9-rhel-7-candidate  ocp-build/buildvm.openshift.eng.bos.redhat.com
 aos3-installation-docker-v3.9.15-1        rhaos-3.9-rhel-7-candidate  ocp-build/buildvm.openshift.eng.bos.redhat.com
 atomic-openshift-descheduler-docker-v3.9.13-1  rhaos-3.9-rhel-7-candidate  ocp-build/buildvm.openshift.eng.bos.redhat.com
@@ -705,7 +705,7 @@ template-service-broker-docker-v3.9.15-1  rhaos-3.9-rhel-7-candidate  ocp-build/
 #
 #     $ brew list-tagged rhaos-3.9-rhel-7-candidate --latest --rpm --quiet --arch src
 #
-# Used for mocking brew.get_tagged_rpm_builds()
+# Used for mocking the listing of rpm builds in a tag
 #
 # First example, 'ansible-asb-modules' has no '.src' suffix to ensure
 # all parsing code branches are explored
@@ -0,0 +1,201 @@
+"""
+Admission control for the services elliott talks to.
+
+Bulk operations run many requests at once from thread pools. How many
+of those a service should see at the same time depends on how busy it
+is, so rather than fixing a number, each service gets an
+AdmissionController which adjusts its concurrency limit as it goes
+(AIMD, additive increase/multiplicative decrease):
+
+  * each request which completes in good time raises the limit by
+    1/limit, so about one more request per round of requests
+  * a failed request (an error, a 5xx or 429 response, a failed
+    command), or requests to an endpoint getting much slower than that
+    endpoint usually is, halve the limit, at most once per round trip
+
+Wrap every request to a service in an admission, naming the endpoint
+it goes to. Endpoints answer at different speeds (a filtered list of
+advisories takes far longer than a single build), so each has its own
+idea of what is usual:
+
+    with throttle.get('errata').admit('GET /api/v1/build/{id}') as admission:
+        res = session.get(url)
+        if res.status_code >= 500:
+            admission.fail()
+
+The controllers are shared by every thread in the process, see get().
+Their settings come from constants.throttle.
+"""
+
+# stdlib
+import threading
+import time
+from multiprocessing import Lock
+
+# ours
+import constants
+import logutil
+
+logger = logutil.getLogger(__name__)
+
+# The shared controllers, by service name
+_controllers = {}
+# Protects creation of the shared controllers
+_controllers_lock = Lock()
+
+
+def get(service):
+    """The shared AdmissionController for a service
+
+    :param str service: The name of the service, e.g., 'errata'. The
+    controller is configured by constants.throttle[service] if that
+    exists, otherwise by constants.throttle['default'].
+    :return: An AdmissionController
+    """
+    with _controllers_lock:
+        if service not in _controllers:
+            settings = constants.throttle.get(service, constants.throttle['default'])
+            _controllers[service] = AdmissionController(service, **settings)
+        return _controllers[service]
+
+
+class AdmissionController(object):
+    """
+    Admits requests to one service while fewer than `limit` of them
+    are in flight, adjusting `limit` to how the service copes.
+    """
+    def __init__(self, name, initial=4, minimum=1, maximum=16, slow_factor=3.0):
+        """
+        :param str name: The service, for logging
+        :param int initial: The concurrency limit to start with
+        :param int minimum: The limit never drops below this
+        :param int maximum: The limit never rises above this
+        :param float slow_factor: Requests to an endpoint taking this
+        many times longer (smoothed) than the fastest requests to it
+        seen lately is a sign of congestion, like a failure
+        """
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.slow_factor = slow_factor
+
+        self.limit = float(initial)
+        self.in_flight = 0
+        # Endpoint => EndpointLatency
+        self.endpoints = {}
+        # When the limit was last decreased, and the earliest time new
+        # requests may be admitted (set by Retry-After)
+        self.last_decrease = 0
+        self.paused_until = 0
+
+        self._cond = threading.Condition(threading.Lock())
+
+    def admit(self, endpoint=None):
+        """Wait for a request to be admitted
+
+        :param str endpoint: What the request is for, e.g.,
+        'GET /api/v1/build/{id}'. Requests to the same endpoint should
+        take about as long as each other.
+        :return: An Admission, to be used as a context manager around
+        the request
+        """
+        with self._cond:
+            while True:
+                pause = self.paused_until - time.time()
+                if pause <= 0 and self.in_flight < int(self.limit):
+                    break
+                # Wake up now and then, `wait` without a timeout
+                # disables signal handling
+                self._cond.wait(max(min(pause, 1.0), 0.05) if pause > 0 else 1.0)
+            self.in_flight += 1
+        return Admission(self, endpoint)
+
+    def pause(self, seconds):
+        """Admit no new requests for a while, e.g., when told to by a
+        Retry-After header"""
+        with self._cond:
+            self.paused_until = max(self.paused_until, time.time() + seconds)
+
+    def _release(self, latency, failed, endpoint=None):
+        """A request has completed
+
+        :param float latency: How long it took, in seconds
+        :param bool failed: If it failed
+        :param str endpoint: What the request was for, see admit()
+        """
+        with self._cond:
+            self.in_flight -= 1
+
+            if endpoint not in self.endpoints:
+                self.endpoints[endpoint] = EndpointLatency()
+            stats = self.endpoints[endpoint]
+            stats.update(latency)
+
+            slow = stats.latency > self.slow_factor * max(stats.base_latency, 0.001)
+            now = time.time()
+            if failed or slow:
+                # Only back off once per round trip, the other requests
+                # of the same round saw the same congestion
+                if now - self.last_decrease > stats.latency:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self.last_decrease = now
+                    logger.debug("{}: {} request, concurrency limit down to {}".format(
+                        self.name, 'failed' if failed else 'slow', int(self.limit)))
+            else:
+                self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+            self._cond.notify_all()
+
+
+class EndpointLatency(object):
+    """
+    How long requests to one endpoint of a service take: the smoothed
+    latency, and the lowest it has been lately.
+    """
+    def __init__(self):
+        self.latency = None
+        self.base_latency = None
+
+    def update(self, latency):
+        """A request has completed in `latency` seconds"""
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = 0.8 * self.latency + 0.2 * latency
+        # The base latency follows the lowest smoothed latency, and
+        # slowly creeps up to where the latency stays, as some
+        # queueing comes with every extra request in flight
+        if self.base_latency is None or self.latency < self.base_latency:
+            self.base_latency = self.latency
+        else:
+            self.base_latency += 0.01 * (self.latency - self.base_latency)
+
+
+class Admission(object):
+    """
+    A request admitted by an AdmissionController. The request counts as
+    failed if fail() is called, or if the `with` block raises.
+    """
+    def __init__(self, controller, endpoint=None):
+        self.controller = controller
+        self.endpoint = endpoint
+        self.failed = False
+        self.start = None
+
+    def fail(self, retry_after=None):
+        """Count the request as failed
+
+        :param float retry_after: Seconds the service asked us to wait
+        before trying again, if it did (HTTP 429/503 Retry-After)
+        """
+        self.failed = True
+        if retry_after is not None:
+            self.controller.pause(retry_after)
+
+    def __enter__(self):
+        self.start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.controller._release(time.time() - self.start, self.failed or exc_type is not None, self.endpoint)
+        return False
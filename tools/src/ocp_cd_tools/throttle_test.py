@@ -0,0 +1,125 @@
+"""
+Test the per-service admission controllers
+"""
+
+import mock
+import threading
+import time
+
+# Import the right version for your python
+import platform
+(major, minor, patch) = platform.python_version_tuple()
+if int(major) == 2 and int(minor) < 7:
+    import unittest2 as unittest
+else:
+    import unittest
+
+import throttle
+
+
+class TestAdmissionController(unittest.TestCase):
+
+    def complete(self, controller, n, latency=0.01, failed=False, endpoint=None):
+        """Run `n` requests through the controller one at a time"""
+        for _ in range(n):
+            controller.admit(endpoint)
+            controller._release(latency, failed, endpoint)
+
+    def test_additive_increase(self):
+        """The limit grows by about one for each round of good requests"""
+        c = throttle.AdmissionController('test', initial=2, maximum=10)
+        self.complete(c, 2)
+        self.assertAlmostEqual(2.9, c.limit)
+        self.complete(c, 100)
+        self.assertEqual(10, c.limit)
+
+    def test_multiplicative_decrease(self):
+        """A failure halves the limit, once per round trip"""
+        c = throttle.AdmissionController('test', initial=8, minimum=2)
+        self.complete(c, 1)
+        self.complete(c, 3, failed=True)
+        self.assertEqual(4, int(c.limit))
+
+        c.last_decrease = 0
+        self.complete(c, 1, failed=True)
+        c.last_decrease = 0
+        self.complete(c, 1, failed=True)
+        self.assertEqual(2, c.limit)
+
+    def test_slow_requests_back_off(self):
+        """A request far slower than usual counts as congestion"""
+        c = throttle.AdmissionController('test', initial=8, slow_factor=3.0)
+        self.complete(c, 5, latency=0.01)
+        limit = c.limit
+        self.complete(c, 1, latency=1.0)
+        self.assertEqual(limit / 2, c.limit)
+
+    def test_endpoints_own_latency(self):
+        """Slow endpoints are only compared with themselves"""
+        c = throttle.AdmissionController('test', initial=8, maximum=8, slow_factor=3.0)
+        for _ in range(10):
+            self.complete(c, 5, latency=0.01, endpoint='GET /api/v1/build/{id}')
+            self.complete(c, 1, latency=1.0, endpoint='GET /filter/{id}')
+        self.assertEqual(8, c.limit)
+
+        # Unless one gets slower than it usually is
+        self.complete(c, 1, latency=20.0, endpoint='GET /filter/{id}')
+        self.assertEqual(4, c.limit)
+
+    def test_failure_on_exception(self):
+        """A request raising an exception counts as failed"""
+        c = throttle.AdmissionController('test', initial=8)
+        with self.assertRaises(ValueError):
+            with c.admit():
+                raise ValueError()
+        self.assertEqual(4, c.limit)
+        self.assertEqual(0, c.in_flight)
+
+    def test_limit_respected(self):
+        """No more requests are in flight than the limit allows"""
+        c = throttle.AdmissionController('test', initial=3, maximum=3)
+        lock = threading.Lock()
+        seen = {'now': 0, 'most': 0}
+
+        def request():
+            with c.admit():
+                with lock:
+                    seen['now'] += 1
+                    seen['most'] = max(seen['most'], seen['now'])
+                time.sleep(0.01)
+                with lock:
+                    seen['now'] -= 1
+
+        threads = [threading.Thread(target=request) for _ in range(12)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(3, seen['most'])
+        self.assertEqual(0, c.in_flight)
+
+    def test_retry_after(self):
+        """Nothing is admitted while the service asked us to wait"""
+        c = throttle.AdmissionController('test', initial=4)
+        with c.admit() as admission:
+            admission.fail(retry_after=0.2)
+
+        start = time.time()
+        with c.admit():
+            pass
+        self.assertGreaterEqual(time.time() - start, 0.15)
+
+    def test_get_shared(self):
+        """Controllers are shared per service, configured from constants"""
+        with mock.patch.object(throttle, '_controllers', {}):
+            with mock.patch.object(throttle.constants, 'throttle', {
+                    'default': {'initial': 1, 'maximum': 2},
+                    'errata': {'initial': 5, 'maximum': 6}}):
+                self.assertIs(throttle.get('errata'), throttle.get('errata'))
+                self.assertEqual(6, throttle.get('errata').maximum)
+                self.assertEqual(2, throttle.get('registry').maximum)
+
+
+if __name__ == '__main__':
+    unittest.main()